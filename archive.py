@@ -0,0 +1,183 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from transform import WeatherTransformer
+from load import WeatherLoader
+from config import ARCHIVE_ROOT, REPLAY_CHUNK_SIZE
+
+# Segments are named per process, so every RawArchive in the process (one per
+# pipeline, sharing a segment) must take the same lock to append
+APPEND_LOCK = threading.Lock()
+
+class RawArchive:
+    """Append-only archive of raw API payloads, kept so data can be re-transformed later
+
+    Payloads are appended as gzip-compressed NDJSON to one segment per process
+    and UTC hour: date=YYYY-MM-DD/hour=HH/<host>-<pid>.ndjson.gz. Each append
+    is a separate gzip member, which gzip readers handle transparently. An
+    SQLite index in the archive root records each segment's observation time
+    range per city, so a replay only opens the segments it needs.
+    """
+    def __init__(self, root=ARCHIVE_ROOT):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        connection = self.index()
+        with connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS segment_index (
+                    path TEXT NOT NULL,
+                    city TEXT NOT NULL,
+                    min_dt INTEGER NOT NULL,
+                    max_dt INTEGER NOT NULL,
+                    records INTEGER NOT NULL,
+                    PRIMARY KEY (path, city)
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_segment_time ON segment_index (max_dt, min_dt)")
+        connection.close()
+
+    def index(self):
+        connection = sqlite3.connect(os.path.join(self.root, 'index.sqlite3'), timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def segment_path(self, now):
+        return os.path.join(f"date={now:%Y-%m-%d}", f"hour={now:%H}",
+                            f"{socket.gethostname()}-{os.getpid()}.ndjson.gz")
+
+    def append(self, raw_data):
+        """Append payloads to the current segment and update the index"""
+        if not raw_data:
+            return
+        fetched_at = int(time.time())
+        path = self.segment_path(datetime.fromtimestamp(fetched_at, timezone.utc))
+        full_path = os.path.join(self.root, path)
+
+        ranges = {}
+        lines = []
+        for data in raw_data:
+            dt = data.get('dt')
+            dt = int(dt) if isinstance(dt, (int, float)) else fetched_at
+            city = str(data.get('name'))
+            low, high, count = ranges.get(city, (dt, dt, 0))
+            ranges[city] = (min(low, dt), max(high, dt), count + 1)
+            lines.append(json.dumps(data, separators=(',', ':')))
+
+        with APPEND_LOCK:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with gzip.open(full_path, 'ab') as f:
+                f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+
+        connection = self.index()
+        with connection:
+            connection.executemany("""
+                INSERT INTO segment_index (path, city, min_dt, max_dt, records) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (path, city) DO UPDATE SET
+                    min_dt = MIN(min_dt, excluded.min_dt),
+                    max_dt = MAX(max_dt, excluded.max_dt),
+                    records = records + excluded.records
+            """, [(path, city, low, high, count) for city, (low, high, count) in ranges.items()])
+        connection.close()
+
+    def segments(self, start, end, cities=None):
+        """Segments holding observations in [start, end) epoch seconds, oldest first"""
+        query = "SELECT path, MIN(min_dt) FROM segment_index WHERE max_dt >= ? AND min_dt < ?"
+        params = [start, end]
+        if cities:
+            query += f" AND city IN ({', '.join('?' * len(cities))})"
+            params += list(cities)
+        query += " GROUP BY path ORDER BY MIN(min_dt), path"
+        connection = self.index()
+        try:
+            return [path for path, _ in connection.execute(query, params)]
+        finally:
+            connection.close()
+
+    def iter_records(self, start, end, cities=None):
+        """Yield archived payloads observed in [start, end) epoch seconds"""
+        wanted = set(cities) if cities else None
+        for path in self.segments(start, end, cities):
+            try:
+                with gzip.open(os.path.join(self.root, path), 'rt', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            data = json.loads(line)
+                        except ValueError:
+                            logging.warning(f"Skipping unreadable line in {path}")
+                            continue
+                        dt = data.get('dt')
+                        if not isinstance(dt, (int, float)) or not start <= dt < end:
+                            continue
+                        if wanted is None or data.get('name') in wanted:
+                            yield data
+            except (EOFError, OSError, zlib.error) as e:
+                # A crash mid-append leaves a truncated last gzip member; everything before it is intact
+                logging.warning(f"Stopped reading damaged segment {path}: {e}")
+
+class ArchiveReplayer:
+    """Streams archived payloads back through transform, validation and the loader"""
+    def __init__(self, archive=None, chunk_size=REPLAY_CHUNK_SIZE):
+        self.archive = archive or RawArchive()
+        self.chunk_size = chunk_size
+        self.transformer = WeatherTransformer()
+        self.loader = WeatherLoader()
+
+    def replay(self, start, end, cities=None):
+        """Reload [start, end); returns (records read, rows loaded, failed chunks)"""
+        read = loaded = failed = 0
+        chunk = []
+        started = time.monotonic()
+
+        def flush(chunk):
+            df = self.transformer.transform_weather_data_columnar(chunk)
+            df = self.transformer.validate_data(df)
+            if df.empty:
+                return 0, 0
+            return (len(df), 0) if self.loader.load_data(df) else (0, 1)
+
+        for data in self.archive.iter_records(start.timestamp(), end.timestamp(), cities):
+            read += 1
+            chunk.append(data)
+            if len(chunk) >= self.chunk_size:
+                rows, errors = flush(chunk)
+                loaded, failed = loaded + rows, failed + errors
+                chunk = []
+        if chunk:
+            rows, errors = flush(chunk)
+            loaded, failed = loaded + rows, failed + errors
+
+        elapsed = time.monotonic() - started
+        rate = read / elapsed if elapsed else 0
+        logging.info(f"Replayed {read} archived records ({loaded} rows loaded, {failed} chunks failed) "
+                     f"in {elapsed:.1f}s, {rate:.0f} records/s")
+        return read, loaded, failed
+
+def parse_time(value):
+    return datetime.fromisoformat(value)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay archived raw API payloads into the database")
+    parser.add_argument('--start', type=parse_time, help="first observation time to replay (ISO format, local time)")
+    parser.add_argument('--end', type=parse_time, help="replay observations before this time (default: now)")
+    parser.add_argument('--days', type=int, default=1, help="days before --end to replay when --start is not given")
+    parser.add_argument('--city', action='append', help="only replay this city (repeatable)")
+    parser.add_argument('--chunk-size', type=int, default=REPLAY_CHUNK_SIZE, help="records per load")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    end = args.end or datetime.now()
+    start = args.start or end - timedelta(days=args.days)
+    _, _, failed = ArchiveReplayer(chunk_size=args.chunk_size).replay(start, end, args.city)
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
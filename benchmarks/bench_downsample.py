@@ -0,0 +1,30 @@
+import plotly.express as px
+import pytest
+from dashboard import TREND_CHART_MAX_POINTS
+from downsample import downsample_series
+from synthetic import PayloadGenerator
+
+@pytest.fixture(scope='module', params=[(20, 30), (100, 30), (100, 90)], ids=lambda p: f"{p[0]}cities-{p[1]}days")
+def history(request):
+    """Hourly history as get_historical_data returned it to the chart before downsampling"""
+    cities, days = request.param
+    df = PayloadGenerator(cities=cities, hours=days * 24).frame()
+    return df[['city', 'temperature', 'humidity', 'pressure', 'data_timestamp']].sort_values(
+        ['city', 'data_timestamp'], ignore_index=True)
+
+def render(df):
+    """Build the trend chart and serialize it, which is what Streamlit ships to the browser"""
+    fig = px.line(df, x='data_timestamp', y='temperature', color='city', title="Temperature Over Time")
+    fig.update_layout(height=400)
+    return fig.to_json()
+
+def downsampled(df):
+    trend = df[['city', 'data_timestamp', 'temperature']]
+    return downsample_series(trend, 'data_timestamp', 'temperature', 'city', TREND_CHART_MAX_POINTS)
+
+@pytest.mark.parametrize('mode', ['raw', 'downsampled'])
+def test_trend_chart(benchmark, history, mode):
+    prepare = downsampled if mode == 'downsampled' else lambda df: df
+    payload = benchmark(lambda: render(prepare(history)))
+    benchmark.extra_info['points'] = len(prepare(history))
+    benchmark.extra_info['payload_bytes'] = len(payload)
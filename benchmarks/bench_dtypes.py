@@ -0,0 +1,51 @@
+from decimal import Decimal
+import pytest
+from dtypes import OUTPUT_COLUMNS, apply_dtypes
+from synthetic import PayloadGenerator
+
+# DECIMAL(5,2) columns in schema.sql; the rest of the measurements are INT
+DECIMAL_COLUMNS = ['temperature', 'feels_like', 'wind_speed']
+
+@pytest.fixture(scope='module')
+def fetched():
+    """30 days of 2,000 cities as a bare pd.read_sql returns them from MySQL
+
+    DECIMALs arrive as Decimal objects, strings and timestamps as object columns.
+    """
+    df = PayloadGenerator(cities=2000, hours=30 * 24).frame()[OUTPUT_COLUMNS]
+    df = df.astype({col: object for col in ['city', 'country', 'weather_main', 'data_timestamp']})
+    for col in DECIMAL_COLUMNS:
+        df[col] = df[col].astype('float64').map('{:.2f}'.format).map(Decimal)
+    df['data_timestamp'] = df['data_timestamp'].map(lambda value: value.to_pydatetime()).astype(object)
+    return df
+
+@pytest.fixture(scope='module', params=['object', 'numpy', 'pyarrow'])
+def typed(request, fetched):
+    if request.param == 'object':
+        return request.param, fetched
+    return request.param, apply_dtypes(fetched, request.param)
+
+@pytest.mark.parametrize('backend', ['numpy', 'pyarrow'])
+def test_apply_dtypes(benchmark, fetched, backend):
+    df = benchmark.pedantic(apply_dtypes, args=(fetched, backend), rounds=3, iterations=1)
+    before, after = (int(frame.memory_usage(deep=True).sum()) for frame in (fetched, df))
+    benchmark.extra_info.update(rows=len(df), object_bytes=before, typed_bytes=after)
+    assert after * 4 < before
+
+def test_city_aggregates(benchmark, typed):
+    # The analytics tab's per-city temperature summary, done in pandas
+    dtypes, df = typed
+    summary = benchmark(lambda: df.groupby('city', observed=True)['temperature'].agg(['mean', 'min', 'max']))
+    benchmark.extra_info['dtypes'] = dtypes
+    assert len(summary) == 2000
+
+def dates(column):
+    if column.dtype == object:
+        return column.map(lambda value: value.date())
+    return column.dt.date
+
+def test_daily_means(benchmark, typed):
+    dtypes, df = typed
+    daily = benchmark(lambda: df.groupby(['city', dates(df['data_timestamp'])], observed=True)['temperature'].mean())
+    benchmark.extra_info['dtypes'] = dtypes
+    assert len(daily) >= 2000 * 30
@@ -0,0 +1,27 @@
+import asyncio
+import pytest
+from extract import WeatherExtractor
+from synthetic import PayloadGenerator, MockWeatherAPI
+
+CITIES = 200
+CONCURRENCY = [1, 4, 16, 64]
+
+@pytest.fixture(scope='module')
+def mock_api():
+    # 50 ms per request, so a serial run is bound by latency rather than CPU
+    api = MockWeatherAPI(PayloadGenerator(cities=CITIES, hours=1), latency=0.05, jitter=0.01).start()
+    yield api
+    api.stop()
+
+@pytest.mark.parametrize('concurrency', CONCURRENCY)
+def test_async_throughput(benchmark, mock_api, concurrency):
+    extractor = WeatherExtractor(max_concurrency=concurrency, rate_limit=1e9, pool_size=concurrency)
+    extractor.base_url = mock_api.base_url
+    cities = [city['name'] for city in mock_api.generator.cities]
+
+    results = benchmark.pedantic(lambda: asyncio.run(extractor.fetch_all_cities_async(cities)),
+                                 rounds=3, iterations=1)
+    assert len(results) == CITIES
+    # There are no timings to report under --benchmark-disable
+    if benchmark.stats:
+        benchmark.extra_info['cities_per_second'] = round(CITIES / benchmark.stats.stats.mean, 1)
@@ -0,0 +1,14 @@
+import pytest
+from transform import WeatherTransformer
+
+SIZES = [1_000, 100_000, 1_000_000]
+
+@pytest.mark.parametrize('size', SIZES)
+@pytest.mark.parametrize('method', ['transform_weather_data', 'transform_weather_data_columnar'])
+def test_transform(benchmark, payloads, method, size):
+    raw_data = payloads(size)
+    transform = getattr(WeatherTransformer(), method)
+    benchmark.extra_info['records'] = size
+    # The 1M-record row transform takes several seconds, so big sizes get fewer rounds
+    df = benchmark.pedantic(transform, args=(raw_data,), rounds=max(3, 100_000 // size), iterations=1)
+    assert len(df) == size
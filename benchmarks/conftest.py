@@ -0,0 +1,14 @@
+import pytest
+from synthetic import PayloadGenerator
+
+@pytest.fixture(scope='session')
+def payload_pool():
+    """24 hours of payloads for 1,000 synthetic cities, the source for larger batches"""
+    return [payload for hour in PayloadGenerator(cities=1000, hours=24) for payload in hour]
+
+@pytest.fixture(scope='session')
+def payloads(payload_pool):
+    """Build a batch of any size by repeating the pool by reference, so big batches stay cheap"""
+    def build(size):
+        return (payload_pool * (size // len(payload_pool) + 1))[:size]
+    return build
@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import threading
+import mysql.connector
+from db import get_pool
+from config import CITY_WATERMARK_PATH
+
+class ObservationWatermarks:
+    """Per-city high-watermark of the newest observation time (API dt) loaded
+
+    OpenWeatherMap only refreshes a station every so often, so polling faster
+    than that returns the same observation again. Payloads whose dt is not newer
+    than the city's watermark are dropped before transform. Watermarks only
+    advance once MySQL has committed the observations, so a failed load is
+    retried on the next run. Batches queued in the write buffer are advanced by
+    the drainer when it loads them, and a batch moved to dead_batches never is.
+    """
+    def __init__(self, path=CITY_WATERMARK_PATH):
+        self.path = path
+        self.entries = self.load()
+        self.warmed = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable city watermark file {self.path}: {e}")
+            return {}
+
+    def save(self):
+        """Merge with the file on disk and write it atomically
+
+        Several pipelines (scheduler batches, shard processes) share the file, so
+        the newest watermark for each city wins rather than the last writer.
+        """
+        with self.lock:
+            for city, dt in self.load().items():
+                if dt > self.entries.get(city, float('-inf')):
+                    self.entries[city] = dt
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+
+    def warm(self):
+        """Raise watermarks to the observations already in weather_latest"""
+        self.warmed = True
+        try:
+            connection = get_pool().get_connection()
+        except mysql.connector.Error as e:
+            logging.warning(f"Could not warm city watermarks from the database: {e}")
+            return
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT city, data_timestamp FROM weather_latest")
+            rows = cursor.fetchall()
+            cursor.close()
+        except mysql.connector.Error as e:
+            logging.warning(f"Could not warm city watermarks from the database: {e}")
+            return
+        finally:
+            connection.close()
+
+        with self.lock:
+            for city, data_timestamp in rows:
+                # data_timestamp was written as datetime.fromtimestamp(dt), so this inverts it
+                dt = data_timestamp.timestamp()
+                if dt > self.entries.get(city, float('-inf')):
+                    self.entries[city] = dt
+
+    def filter(self, raw_data):
+        """Return (payloads with a new observation, number of unchanged payloads skipped)"""
+        if not self.warmed:
+            self.warm()
+
+        fresh = []
+        with self.lock:
+            for data in raw_data:
+                city, dt = data.get('name'), data.get('dt')
+                # Anything without a usable name or dt is left for transform to handle
+                if city is None or not isinstance(dt, (int, float)) or dt > self.entries.get(city, float('-inf')):
+                    fresh.append(data)
+        return fresh, len(raw_data) - len(fresh)
+
+    def advance(self, raw_data):
+        """Record the observations in raw_data as loaded"""
+        with self.lock:
+            for data in raw_data:
+                city, dt = data.get('name'), data.get('dt')
+                if city is not None and isinstance(dt, (int, float)) and dt > self.entries.get(city, float('-inf')):
+                    self.entries[city] = dt
+
+    def advance_loaded(self, df):
+        """Record the observations in a loaded DataFrame (as the write buffer holds them) as loaded"""
+        newest = df.groupby('city', observed=True)['data_timestamp'].max()
+        with self.lock:
+            for city, data_timestamp in newest.items():
+                # Inverts the local time transform wrote, as in warm()
+                dt = data_timestamp.to_pydatetime().timestamp()
+                if dt > self.entries.get(city, float('-inf')):
+                    self.entries[city] = dt
@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from datetime import datetime
+import mysql.connector
+from db import get_pool
+from sharding import shard_for
+from config import CITIES, CITY_POLL_MINUTES, SCHEDULE_INTERVAL_MINUTES
+
+class CityRegistry:
+    """In-memory copy of the city_registry table: which cities to poll, in what order and how often
+
+    Each city has an enabled flag, a priority and a poll interval, NULL meaning
+    CITY_POLL_MINUTES. Priority only orders the fetches within a run; how often
+    a city is polled depends on its interval alone. Cities are only checked once
+    per scheduler tick, so intervals shorter than a tick are raised to it, with
+    a warning. refresh() reloads the cache
+    only when MAX(updated_at) or the row count has changed, so edits take effect
+    on the next scheduler tick without a restart. Recording polls doesn't touch
+    updated_at, so it never forces a reload. If the table can't be read, the
+    last good copy is kept, or config.CITIES is used before the first load.
+    """
+    def __init__(self, default_interval=CITY_POLL_MINUTES * 60, tick=SCHEDULE_INTERVAL_MINUTES * 60):
+        self.default_interval = default_interval
+        self.tick = tick
+        # Cities are checked once per scheduler tick, so a poll due within half a
+        # tick counts as due now rather than waiting for the tick after
+        self.grace = tick / 2
+        self.entries = {}
+        self.version = None
+        self.lock = threading.Lock()
+
+    def fallback_entries(self):
+        return {city: {'enabled': True, 'priority': 0, 'interval': self.default_interval, 'last_polled': None}
+                for city in CITIES}
+
+    def refresh(self):
+        """Reload the cache if the table changed; returns True if it was reloaded"""
+        try:
+            connection = get_pool().get_connection()
+        except mysql.connector.Error as e:
+            return self.keep_cached(e)
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT MAX(updated_at), COUNT(*) FROM city_registry")
+            version = cursor.fetchone()
+            if version == self.version:
+                cursor.close()
+                return False
+            cursor.execute("""
+                SELECT city, enabled, priority, poll_interval_minutes, last_polled_at
+                FROM city_registry
+            """)
+            rows = cursor.fetchall()
+            cursor.close()
+        except mysql.connector.Error as e:
+            return self.keep_cached(e)
+        finally:
+            connection.close()
+
+        entries = {}
+        too_short = []
+        for city, enabled, priority, poll_interval_minutes, last_polled_at in rows:
+            interval = self.default_interval if poll_interval_minutes is None else poll_interval_minutes * 60
+            if interval < self.tick:
+                too_short.append(city)
+                interval = self.tick
+            entries[city] = {
+                'enabled': bool(enabled),
+                'priority': priority,
+                'interval': interval,
+                # last_polled_at is written in local time, so timestamp() inverts it
+                'last_polled': None if last_polled_at is None else last_polled_at.timestamp(),
+            }
+        if too_short:
+            logging.warning(f"poll_interval_minutes is below the {self.tick / 60:g} minute scheduler tick for "
+                            f"{len(too_short)} cities ({', '.join(sorted(too_short)[:10])}); "
+                            f"they will be polled every tick instead")
+        with self.lock:
+            self.entries = entries
+            self.version = version
+        logging.info(f"Loaded city registry: {sum(entry['enabled'] for entry in entries.values())} "
+                     f"of {len(entries)} cities enabled")
+        return True
+
+    def keep_cached(self, error):
+        with self.lock:
+            if self.version is None and not self.entries:
+                logging.warning(f"Could not read the city registry, polling config.CITIES: {error}")
+                self.entries = self.fallback_entries()
+            else:
+                logging.warning(f"Could not refresh the city registry, using the cached copy: {error}")
+        return False
+
+    def cities(self, batch_id=0, batches=1):
+        """Enabled cities in one scheduler batch, highest priority first"""
+        with self.lock:
+            enabled = [(city, entry['priority']) for city, entry in self.entries.items()
+                       if entry['enabled'] and shard_for(city, batches) == batch_id]
+        return [city for city, _ in sorted(enabled, key=lambda item: (-item[1], item[0]))]
+
+    def due(self, cities, now=None):
+        """The cities whose poll interval has passed since they were last polled, in the given order"""
+        now = time.time() if now is None else now
+        with self.lock:
+            return [city for city in cities
+                    if city in self.entries and (self.entries[city]['last_polled'] is None or
+                        now - self.entries[city]['last_polled'] + self.grace >= self.entries[city]['interval'])]
+
+    def mark_polled(self, cities, polled_at):
+        """Record that cities were polled at polled_at (epoch seconds)"""
+        with self.lock:
+            for city in cities:
+                if city in self.entries:
+                    self.entries[city]['last_polled'] = polled_at
+        try:
+            connection = get_pool().get_connection()
+        except mysql.connector.Error as e:
+            logging.warning(f"Could not record city polls: {e}")
+            return
+        try:
+            cursor = connection.cursor()
+            # Setting updated_at to itself stops ON UPDATE bumping it, which would force a reload
+            cursor.executemany("""
+                UPDATE city_registry SET last_polled_at = %s, updated_at = updated_at WHERE city = %s
+            """, [(datetime.fromtimestamp(polled_at), city) for city in cities])
+            connection.commit()
+            cursor.close()
+        except mysql.connector.Error as e:
+            logging.warning(f"Could not record city polls: {e}")
+        finally:
+            connection.close()
@@ -0,0 +1,193 @@
+import glob
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+import pandas as pd
+from dtypes import apply_dashboard_dtypes
+from config import PARQUET_ROOT
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+PARQUET_COLUMNS = ['city', 'country', 'temperature', 'feels_like', 'humidity', 'pressure',
+                   'weather_main', 'weather_description', 'wind_speed', 'wind_direction',
+                   'visibility', 'data_timestamp']
+
+# Rows per Parquet row group. Files are sorted by city, so each group covers
+# a narrow range of cities and its min/max statistics let DuckDB skip it
+ROW_GROUP_ROWS = 65536
+
+class ParquetSink:
+    """Writes loaded batches to a Parquet dataset partitioned by date
+
+    Files are laid out hive-style as date=YYYY-MM-DD/part-*.parquet, with rows
+    sorted by city. Each batch adds one file per date it covers, and
+    compact_day() later merges a day into a single file. Days written by
+    earlier versions, with a city_key=<city> directory per city, are read and
+    compacted into the same layout.
+    """
+    def __init__(self, root=PARQUET_ROOT):
+        self.root = root
+
+    def write_batch(self, df):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        df = df[PARQUET_COLUMNS].copy()
+        df['city'] = df['city'].astype(str)
+        df['data_timestamp'] = pd.to_datetime(df['data_timestamp'])
+        df['date'] = df['data_timestamp'].dt.strftime('%Y-%m-%d')
+        df = df.sort_values(['city', 'data_timestamp'], ignore_index=True)
+
+        ds.write_dataset(
+            pa.Table.from_pandas(df, preserve_index=False),
+            self.root,
+            format='parquet',
+            partitioning=['date'],
+            partitioning_flavor='hive',
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore',
+            max_rows_per_group=ROW_GROUP_ROWS,
+            # pyarrow refuses more than 1024 partitions per write by default,
+            # which a backfill spanning years would exceed
+            max_partitions=max(1024, df['date'].nunique())
+        )
+
+    def compact_day(self, day):
+        """Merge one day's files into a single file, de-duplicated and sorted by city
+
+        Only the files listed here are merged and deleted; a batch written
+        meanwhile lands in a new file and is kept as it is.
+        """
+        import pyarrow.parquet as pq
+
+        day_dir = os.path.join(self.root, f"date={day:%Y-%m-%d}")
+        files = day_files(day_dir)
+        if not files or (len(files) == 1 and os.path.dirname(files[0]) == day_dir):
+            return
+        # Oldest first, so keep='last' keeps the newest copy of a re-loaded row
+        files.sort(key=os.path.getmtime)
+
+        df = pd.concat([pq.read_table(path, columns=PARQUET_COLUMNS).to_pandas() for path in files],
+                       ignore_index=True)
+        df = df.drop_duplicates(subset=['city', 'data_timestamp'], keep='last')
+        df = df.sort_values(['city', 'data_timestamp'], ignore_index=True)
+
+        # The merged file appears under its final name before the originals go,
+        # so readers may briefly see rows twice (recent() de-duplicates) but never a gap
+        name = f"part-compacted-{uuid.uuid4().hex}"
+        tmp_path = os.path.join(day_dir, f".{name}.tmp")
+        df.to_parquet(tmp_path, index=False, row_group_size=ROW_GROUP_ROWS)
+        os.replace(tmp_path, os.path.join(day_dir, f"{name}.parquet"))
+        for path in files:
+            os.remove(path)
+        for city_dir in glob.glob(os.path.join(day_dir, 'city_key=*')):
+            try:
+                os.rmdir(city_dir)
+            except OSError:
+                # A writer from an earlier version added a file since the listing
+                pass
+        logging.info(f"Compacted Parquet partition for {day:%Y-%m-%d} ({len(files)} files)")
+
+def day_files(day_dir):
+    """The Parquet files of one date partition, including city directories from the old layout"""
+    return (glob.glob(os.path.join(day_dir, '*.parquet'))
+            + glob.glob(os.path.join(day_dir, 'city_key=*', '*.parquet')))
+
+def quote(value):
+    return "'" + value.replace("'", "''") + "'"
+
+class ColumnarStore:
+    """Runs the dashboard's historical and analytics queries with DuckDB over the Parquet dataset"""
+    def __init__(self, root=PARQUET_ROOT):
+        if duckdb is None:
+            raise ImportError("The duckdb package is required for the columnar dashboard backend")
+        self.root = root
+
+    def query(self, sql, params):
+        # A connection per query keeps this safe to call from any Streamlit thread
+        connection = duckdb.connect()
+        try:
+            return apply_dashboard_dtypes(connection.execute(sql, params).df())
+        finally:
+            connection.close()
+
+    def recent(self, since, columns):
+        """Subquery over observations newer than since, de-duplicated on (city, data_timestamp)"""
+        # Only the date partitions in range are listed and read, so older
+        # days cost nothing however much history has built up
+        first = f"date={since:%Y-%m-%d}"
+        try:
+            days = sorted(name for name in os.listdir(self.root) if name.startswith('date=') and name >= first)
+        except FileNotFoundError:
+            days = []
+        files = [path for day in days for path in day_files(os.path.join(self.root, day))]
+        files = files or [f"{self.root}/**/*.parquet"]
+        source = f"read_parquet([{', '.join(quote(path) for path in files)}], union_by_name = true, hive_partitioning = false)"
+        return (f"SELECT DISTINCT ON (city, data_timestamp) {', '.join(columns)} FROM {source} "
+                f"WHERE data_timestamp >= TIMESTAMP '{since:%Y-%m-%d %H:%M:%S}'")
+
+    def historical(self, days, limit=None):
+        since = datetime.now() - timedelta(days=days)
+        sql = f"""
+            SELECT city, temperature, humidity, pressure, data_timestamp
+            FROM ({self.recent(since, ['city', 'temperature', 'humidity', 'pressure', 'data_timestamp'])})
+            ORDER BY data_timestamp DESC
+        """
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return self.query(sql, [])
+
+    def record_count(self, days):
+        since = datetime.now() - timedelta(days=days)
+        sql = f"SELECT COUNT(*) as total_records FROM ({self.recent(since, ['city', 'data_timestamp'])})"
+        return self.query(sql, [])
+
+    def temperature_trend(self, days, bucket_hours, anchor):
+        since = datetime.now() - timedelta(days=days)
+        sql = f"""
+            SELECT city,
+                   time_bucket(to_hours(?), data_timestamp, ?::TIMESTAMP) as data_timestamp,
+                   AVG(temperature) as temperature
+            FROM ({self.recent(since, ['city', 'temperature', 'data_timestamp'])})
+            GROUP BY ALL
+            ORDER BY city, data_timestamp
+        """
+        return self.query(sql, [bucket_hours, anchor])
+
+    def analytics_queries(self):
+        week = self.recent(datetime.now() - timedelta(days=7), ['city', 'temperature', 'weather_main', 'data_timestamp'])
+        day = self.recent(datetime.now() - timedelta(hours=24), ['city', 'temperature', 'humidity', 'data_timestamp'])
+        queries = {
+            'avg_temp': f"""
+                SELECT city, AVG(temperature) as avg_temp,
+                       MIN(temperature) as min_temp, MAX(temperature) as max_temp
+                FROM ({week})
+                GROUP BY city
+                ORDER BY avg_temp DESC
+            """,
+            'weather_distribution': f"""
+                SELECT weather_main, COUNT(*) as count
+                FROM ({week})
+                GROUP BY weather_main
+                ORDER BY count DESC
+            """,
+            'hourly_trends': f"""
+                SELECT hour(data_timestamp) as hour,
+                       AVG(temperature) as avg_temp,
+                       AVG(humidity) as avg_humidity
+                FROM ({day})
+                GROUP BY hour(data_timestamp)
+                ORDER BY hour
+            """
+        }
+        return queries
+
+    def analytics_item(self, key):
+        return self.query(self.analytics_queries()[key], [])
+
+    def analytics(self):
+        return {key: self.query(sql, []) for key, sql in self.analytics_queries().items()}
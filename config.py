@@ -27,3 +27,92 @@ except:
     OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY')
     OPENWEATHER_BASE_URL = 'https://api.openweathermap.org/data/2.5/weather'
 CITIES = ['London', 'New York', 'Tokyo', 'Mumbai', 'Sydney']
+
+# Extraction settings
+EXTRACT_ENGINE = os.getenv('EXTRACT_ENGINE', 'sync')  # 'sync', 'async' or 'group'
+MAX_CONCURRENCY = int(os.getenv('MAX_CONCURRENCY', 10))
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT', 10))
+# OpenWeatherMap free tier quota: 60 calls per minute, shared by every request to the API host
+API_RATE_LIMIT = float(os.getenv('API_RATE_LIMIT', 60))
+
+# HTTP session settings
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', MAX_CONCURRENCY))
+MAX_RETRIES = int(os.getenv('MAX_RETRIES', 3))
+RETRY_BACKOFF = float(os.getenv('RETRY_BACKOFF', 0.5))  # base delay in seconds
+RETRY_MAX_BACKOFF = float(os.getenv('RETRY_MAX_BACKOFF', 30))  # cap on backoff and Retry-After delays
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', 60))
+
+# Group endpoint settings (EXTRACT_ENGINE=group)
+OPENWEATHER_GROUP_URL = OPENWEATHER_BASE_URL.rsplit('/', 1)[0] + '/group'
+GROUP_BATCH_SIZE = 20  # API maximum per group call
+CITY_ID_CACHE_PATH = os.getenv('CITY_ID_CACHE_PATH', 'city_ids.json')
+CITY_ID_CACHE_TTL = int(os.getenv('CITY_ID_CACHE_TTL', 30 * 24 * 3600))  # seconds
+
+# Pipeline settings
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'batch')  # 'batch' or 'streaming'
+CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', 500))  # records per chunk in streaming mode
+
+# Loader settings
+LOAD_STRATEGY = os.getenv('LOAD_STRATEGY', 'auto')  # 'auto', 'executemany', 'multirow' or 'infile'
+MULTIROW_THRESHOLD = int(os.getenv('MULTIROW_THRESHOLD', 1000))  # rows before switching to multi-row INSERT
+INFILE_THRESHOLD = int(os.getenv('INFILE_THRESHOLD', 50000))  # rows before switching to LOAD DATA
+# LOAD DATA LOCAL INFILE must also be enabled on the server (local_infile=ON)
+LOCAL_INFILE = os.getenv('LOCAL_INFILE', 'false').lower() == 'true'
+# Recently loaded (city, data_timestamp) keys remembered to skip unchanged rows
+LOADED_KEYS_CACHE_SIZE = int(os.getenv('LOADED_KEYS_CACHE_SIZE', 100000))
+
+# Database connection pool settings
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))  # seconds to wait for a free connection
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 3600))  # seconds before a connection is recycled
+
+# Partition maintenance (only applies once weather_data is partitioned, see migrate.py)
+PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', 3))
+RETENTION_MONTHS = int(os.getenv('RETENTION_MONTHS', 0))  # 0 keeps raw data forever
+
+# Dashboard query cache (results are also invalidated whenever the ETL loads new data)
+QUERY_CACHE_TTL = int(os.getenv('QUERY_CACHE_TTL', 300))  # seconds
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv('QUERY_CACHE_MAX_ENTRIES', 256))
+WATERMARK_POLL_SECONDS = int(os.getenv('WATERMARK_POLL_SECONDS', 10))
+
+# Columnar (Parquet + DuckDB) analytics store
+PARQUET_SINK = os.getenv('PARQUET_SINK', 'false').lower() == 'true'  # also write each loaded batch to Parquet
+PARQUET_ROOT = os.getenv('PARQUET_ROOT', 'weather_parquet')
+DASHBOARD_BACKEND = os.getenv('DASHBOARD_BACKEND', 'mysql')  # 'mysql' or 'duckdb'
+# Dashboard queries run concurrently on this many threads (each borrows a DB_POOL_SIZE connection)
+DASHBOARD_QUERY_WORKERS = int(os.getenv('DASHBOARD_QUERY_WORKERS', 5))
+# 'numpy' or 'pyarrow' (Arrow-backed numbers and timestamps) for dashboard query results
+DASHBOARD_DTYPE_BACKEND = os.getenv('DASHBOARD_DTYPE_BACKEND', 'numpy')
+
+# Sharded runner: split CITIES across worker processes (1 runs everything in-process)
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', 1))
+SLOW_SHARD_FACTOR = float(os.getenv('SLOW_SHARD_FACTOR', 2.0))  # flag shards slower than this x the median
+
+# Scheduler: every interval, each city batch runs once at its own evenly spaced offset
+# and polls its cities that are due (the shortest per-city poll interval possible)
+SCHEDULE_INTERVAL_MINUTES = int(os.getenv('SCHEDULE_INTERVAL_MINUTES', 15))
+SCHEDULE_BATCHES = int(os.getenv('SCHEDULE_BATCHES', 4))
+# Poll interval for city_registry rows without their own poll_interval_minutes
+CITY_POLL_MINUTES = int(os.getenv('CITY_POLL_MINUTES', 60))
+
+# Change detection: skip payloads whose observation time (dt) hasn't advanced since the last load
+CHANGE_DETECTION = os.getenv('CHANGE_DETECTION', 'true').lower() == 'true'
+CITY_WATERMARK_PATH = os.getenv('CITY_WATERMARK_PATH', 'city_watermarks.json')
+
+# Prometheus metrics endpoint served by etl_pipeline.py (0 disables it)
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+
+# Write buffer: queue transformed batches in a local SQLite file and load them from a background thread
+WRITE_BUFFER = os.getenv('WRITE_BUFFER', 'false').lower() == 'true'
+WRITE_BUFFER_PATH = os.getenv('WRITE_BUFFER_PATH', 'write_buffer.sqlite3')
+DRAIN_BATCH_ROWS = int(os.getenv('DRAIN_BATCH_ROWS', 50000))  # max rows per bulk load from the buffer
+DRAIN_INTERVAL = float(os.getenv('DRAIN_INTERVAL', 5))  # seconds between checks when the buffer is empty
+# Failed loads MySQL rejected (not connection errors) before a batch is moved to dead_batches
+DRAIN_MAX_ATTEMPTS = int(os.getenv('DRAIN_MAX_ATTEMPTS', 3))
+
+# Raw payload archive (replay with archive.py)
+ARCHIVE = os.getenv('ARCHIVE', 'false').lower() == 'true'
+ARCHIVE_ROOT = os.getenv('ARCHIVE_ROOT', 'raw_archive')
+# Records per load when replaying; large enough for a multi-row INSERT or LOAD DATA
+REPLAY_CHUNK_SIZE = int(os.getenv('REPLAY_CHUNK_SIZE', 50000))
@@ -1,12 +1,37 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pandas as pd
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import mysql.connector
 from datetime import datetime, timedelta
-import time
-from config import DB_CONFIG
+from config import (DB_CONFIG, QUERY_CACHE_TTL, QUERY_CACHE_MAX_ENTRIES, WATERMARK_POLL_SECONDS,
+                    DASHBOARD_BACKEND, DASHBOARD_QUERY_WORKERS, DASHBOARD_DTYPE_BACKEND)
+from columnar import ColumnarStore
+from db import get_pool
+from downsample import downsample_series
+from dtypes import apply_dashboard_dtypes
+
+AUTO_REFRESH_SECONDS = 30
+# Roughly the trend chart's width in pixels; more points per series than this can't be seen
+TREND_CHART_MAX_POINTS = 700
+# About a week of hourly points per city; wider ranges are averaged into coarser buckets
+TREND_SERIES_BUCKETS = 168
+# Bucket sizes that divide a day, so every range's buckets start at local midnight
+TREND_BUCKET_HOURS = (1, 2, 3, 4, 6, 8, 12, 24)
+
+def trend_bucket_hours(days):
+    """The smallest bucket that keeps a days-long series within TREND_SERIES_BUCKETS points"""
+    return next((hours for hours in TREND_BUCKET_HOURS if days * 24 / hours <= TREND_SERIES_BUCKETS),
+                TREND_BUCKET_HOURS[-1])
+
+def trend_anchor(days):
+    """Local midnight at the start of the range, which trend buckets are counted from"""
+    return datetime.combine((datetime.now() - timedelta(days=days)).date(), datetime.min.time())
 
 # Configure Streamlit page
 st.set_page_config(
@@ -16,58 +41,224 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+ANALYTICS_QUERIES = {
+    'avg_temp': """
+        SELECT city, SUM(temp_sum) / SUM(temp_count) as avg_temp, 
+               MIN(temp_min) as min_temp, MAX(temp_max) as max_temp
+        FROM weather_hourly 
+        WHERE hour_start >= DATE_SUB(NOW(), INTERVAL 7 DAY)
+        GROUP BY city
+        ORDER BY avg_temp DESC
+    """,
+    'weather_distribution': """
+        SELECT weather_main, SUM(observations) as count
+        FROM weather_condition_hourly 
+        WHERE hour_start >= DATE_SUB(NOW(), INTERVAL 7 DAY)
+        GROUP BY weather_main
+        ORDER BY count DESC
+    """,
+    'hourly_trends': """
+        SELECT HOUR(hour_start) as hour, 
+               SUM(temp_sum) / SUM(temp_count) as avg_temp,
+               SUM(humidity_sum) / SUM(humidity_count) as avg_humidity
+        FROM weather_hourly 
+        WHERE hour_start >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
+        GROUP BY HOUR(hour_start)
+        ORDER BY hour
+    """
+}
+
+class NoConnectionError(Exception):
+    """Raised when no database connection could be borrowed (already reported)"""
+
+# Cached at module level so every viewer session in this process shares results.
+# Arguments starting with an underscore are not part of the cache key.
+@st.cache_data(ttl=WATERMARK_POLL_SECONDS, show_spinner=False)
+def load_watermark(_dashboard):
+    return _dashboard.read_watermark()
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES, show_spinner=False)
+def load_query(_dashboard, query, params, watermark):
+    return _dashboard.query_db(query, params)
+
+@st.cache_resource
+def get_query_executor():
+    """Thread pool shared by all sessions for running independent dashboard queries concurrently"""
+    return ThreadPoolExecutor(max_workers=DASHBOARD_QUERY_WORKERS, thread_name_prefix='dashboard-query')
+
+@st.cache_data(ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES, show_spinner=False)
+def load_columnar(_dashboard, method, args, watermark):
+    return getattr(_dashboard.columnar, method)(*args)
+
 class WeatherDashboard:
     def __init__(self):
         self.db_config = DB_CONFIG
+        # Historical and analytics scans can be served from Parquet; current conditions stay on MySQL
+        self.columnar = ColumnarStore() if DASHBOARD_BACKEND == 'duckdb' else None
+        # Streamlit calls only work on the script thread, so errors raised in
+        # query threads are kept here and shown when their result is collected
+        self.script_thread = threading.current_thread()
+        self.deferred_errors = []
+        self.shown_errors = set()
+        self.lock = threading.Lock()
+    
+    def report_error(self, message):
+        with self.lock:
+            self.deferred_errors.append(message)
+        if threading.current_thread() is self.script_thread:
+            self.show_deferred_errors()
+    
+    def show_deferred_errors(self):
+        with self.lock:
+            messages, self.deferred_errors = self.deferred_errors, []
+        # Parallel queries tend to fail the same way; show each message once
+        for message in messages:
+            if message not in self.shown_errors:
+                self.shown_errors.add(message)
+                st.error(message)
+    
+    def submit(self, method, *args):
+        """Start a data method on the query thread pool and return its future
+
+        The session's ScriptRunContext is attached to the pool thread for the
+        call, as st.cache_data and other Streamlit calls need one to run.
+        """
+        ctx = get_script_run_ctx(suppress_warning=True)
+        def run():
+            # Pool threads are shared by sessions, so every call attaches its own
+            if ctx is not None:
+                add_script_run_ctx(threading.current_thread(), ctx)
+            return method(*args)
+        return get_query_executor().submit(run)
+    
+    def result(self, future):
+        """Wait for a submitted query and show any errors it hit"""
+        value = future.result()
+        self.show_deferred_errors()
+        return value
     
     def get_connection(self):
-        """Create database connection"""
+        """Borrow a connection from the shared pool"""
         try:
-            return mysql.connector.connect(**self.db_config)
+            return get_pool().get_connection()
         except mysql.connector.Error as e:
-            st.error(f"Database connection error: {e}")
+            self.report_error(f"Database connection error: {e}")
             return None
     
-    def fetch_data(self, query, params=None):
-        """Execute query and return DataFrame"""
+    def query_db(self, query, params=None):
+        """Execute query against the database, raising on failure so errors are never cached"""
         connection = self.get_connection()
         if not connection:
-            return pd.DataFrame()
+            raise NoConnectionError()
         
         try:
-            df = pd.read_sql(query, connection, params=params)
-            return df
-        except Exception as e:
-            st.error(f"Error fetching data: {e}")
-            return pd.DataFrame()
+            if DASHBOARD_DTYPE_BACKEND == 'pyarrow':
+                df = pd.read_sql(query, connection, params=params, dtype_backend='pyarrow')
+            else:
+                df = pd.read_sql(query, connection, params=params)
+            # Typed once here, so cached results are compact and charts never see object columns
+            return apply_dashboard_dtypes(df)
         finally:
             connection.close()
     
+    def read_watermark(self):
+        """Return when the ETL last committed a load, or None if unknown"""
+        try:
+            watermark = self.query_db("SELECT last_load_at FROM etl_watermark WHERE id = 1")
+        except Exception:
+            return None
+        return None if watermark.empty else str(watermark.iloc[0, 0])
+    
+    def get_watermark(self):
+        """Return the (briefly cached) time of the last ETL load"""
+        return load_watermark(self)
+    
+    def fetch_data(self, query, params=None):
+        """Execute query and return DataFrame, shared through a cache keyed by the ETL watermark"""
+        try:
+            return load_query(self, query, params, self.get_watermark())
+        except NoConnectionError:
+            return pd.DataFrame()
+        except Exception as e:
+            self.report_error(f"Error fetching data: {e}")
+            return pd.DataFrame()
+    
+    def fetch_columnar(self, method, *args):
+        """Run a ColumnarStore query through the same watermark-keyed cache as fetch_data"""
+        try:
+            return load_columnar(self, method, args, self.get_watermark())
+        except Exception as e:
+            self.report_error(f"Error fetching data: {e}")
+            return pd.DataFrame()
+    
     def get_latest_data(self):
         """Get the most recent weather data for all cities"""
         query = """
-        SELECT DISTINCT city, country, temperature, feels_like, humidity, 
+        SELECT city, country, temperature, feels_like, humidity, 
                pressure, weather_main, weather_description, wind_speed, 
                wind_direction, visibility, data_timestamp
-        FROM weather_data w1
-        WHERE data_timestamp = (
-            SELECT MAX(data_timestamp) 
-            FROM weather_data w2 
-            WHERE w2.city = w1.city
-        )
+        FROM weather_latest
         ORDER BY city
         """
         return self.fetch_data(query)
     
-    def get_historical_data(self, days=7):
-        """Get historical data for the last N days"""
+    def get_historical_data(self, days=7, limit=None):
+        """Get historical data for the last N days (most recent first)"""
+        if self.columnar is not None:
+            return self.fetch_columnar('historical', days, limit)
         query = """
         SELECT city, temperature, humidity, pressure, data_timestamp
         FROM weather_data 
         WHERE data_timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
         ORDER BY data_timestamp DESC
         """
-        return self.fetch_data(query, (days,))
+        if limit is None:
+            return self.fetch_data(query, (days,))
+        return self.fetch_data(query + " LIMIT %s", (days, limit))
+    
+    def get_record_count(self, days=7):
+        """Count observations in the last N days from the hourly rollups"""
+        if self.columnar is not None:
+            df = self.fetch_columnar('record_count', days)
+            return 0 if df.empty else int(df['total_records'].iloc[0])
+        query = """
+        SELECT COALESCE(SUM(observations), 0) as total_records
+        FROM weather_hourly
+        WHERE hour_start >= DATE_SUB(NOW(), INTERVAL %s DAY)
+        """
+        df = self.fetch_data(query, (days,))
+        return 0 if df.empty else int(df['total_records'].iloc[0])
+    
+    def get_temperature_trend(self, days=7, max_points=TREND_CHART_MAX_POINTS):
+        """Get per-city temperature series downsampled to at most max_points each
+
+        The database averages hourly rollups into buckets of trend_bucket_hours(days),
+        counted in whole hours from local midnight so they line up with the
+        local day in any time zone, including half-hour offsets. LTTB then
+        picks the points that best preserve the shape of each line.
+        """
+        bucket_hours = trend_bucket_hours(days)
+        anchor = trend_anchor(days)
+        if self.columnar is not None:
+            df = self.fetch_columnar('temperature_trend', days, bucket_hours, anchor)
+            if df.empty:
+                return df
+            return downsample_series(df, 'data_timestamp', 'temperature', 'city', max_points)
+        query = """
+        SELECT city,
+               TIMESTAMPADD(HOUR, FLOOR(TIMESTAMPDIFF(HOUR, %s, hour_start) / %s) * %s, %s) as data_timestamp,
+               SUM(temp_sum) / SUM(temp_count) as temperature
+        FROM weather_hourly
+        WHERE hour_start >= DATE_SUB(NOW(), INTERVAL %s DAY)
+        GROUP BY city, data_timestamp
+        ORDER BY city, data_timestamp
+        """
+        # Grouping by the alias keeps ONLY_FULL_GROUP_BY happy; grouping by the
+        # inner FLOOR() alone is rejected because the selected expression differs
+        df = self.fetch_data(query, (anchor, bucket_hours, bucket_hours, anchor, days))
+        if df.empty:
+            return df
+        return downsample_series(df, 'data_timestamp', 'temperature', 'city', max_points)
     
     def get_city_data(self, city, days=7):
         """Get data for a specific city"""
@@ -78,73 +269,21 @@ class WeatherDashboard:
         """
         return self.fetch_data(query, (city, days))
     
+    def get_analytics_item(self, key):
+        """Get one analytics dataset ('avg_temp', 'weather_distribution' or 'hourly_trends')"""
+        if self.columnar is not None:
+            return self.fetch_columnar('analytics_item', key)
+        return self.fetch_data(ANALYTICS_QUERIES[key])
+    
     def get_analytics_data(self):
-        """Get analytics data"""
-        queries = {
-            'avg_temp': """
-                SELECT city, AVG(temperature) as avg_temp, 
-                       MIN(temperature) as min_temp, MAX(temperature) as max_temp
-                FROM weather_data 
-                WHERE data_timestamp >= DATE_SUB(NOW(), INTERVAL 7 DAY)
-                GROUP BY city
-                ORDER BY avg_temp DESC
-            """,
-            'weather_distribution': """
-                SELECT weather_main, COUNT(*) as count
-                FROM weather_data 
-                WHERE data_timestamp >= DATE_SUB(NOW(), INTERVAL 7 DAY)
-                GROUP BY weather_main
-                ORDER BY count DESC
-            """,
-            'hourly_trends': """
-                SELECT HOUR(data_timestamp) as hour, 
-                       AVG(temperature) as avg_temp,
-                       AVG(humidity) as avg_humidity
-                FROM weather_data 
-                WHERE data_timestamp >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
-                GROUP BY HOUR(data_timestamp)
-                ORDER BY hour
-            """
-        }
-        
-        return {key: self.fetch_data(query) for key, query in queries.items()}
+        """Get analytics data from the hourly rollup tables maintained by the ETL"""
+        futures = {key: self.submit(self.get_analytics_item, key) for key in ANALYTICS_QUERIES}
+        return {key: self.result(future) for key, future in futures.items()}
 
-def main():
-    # Initialize dashboard
-    dashboard = WeatherDashboard()
-    
-    # Header
-    st.title("🌤️ Weather Analytics Dashboard")
-    st.markdown("---")
-    
-    # Sidebar
-    st.sidebar.header("🎛️ Controls")
-    
-    # Auto-refresh option
-    auto_refresh = st.sidebar.checkbox("🔄 Auto Refresh (30s)")
-    if auto_refresh:
-        time.sleep(30)
-        st.rerun()
-    
-    # Manual refresh button
-    if st.sidebar.button("🔄 Refresh Data"):
-        st.rerun()
-    
-    # Date range selector
-    days_range = st.sidebar.selectbox(
-        "📅 Data Range",
-        [1, 3, 7, 14, 30],
-        index=2,
-        format_func=lambda x: f"Last {x} day{'s' if x > 1 else ''}"
-    )
-    
-    # Get data
+def render_current_conditions(dashboard, total_records):
+    """Key metrics and current weather cards; cheap to poll since weather_latest is one row per city"""
     latest_data = dashboard.get_latest_data()
-    historical_data = dashboard.get_historical_data(days_range)
-    analytics_data = dashboard.get_analytics_data()
-    
     if latest_data.empty:
-        st.error("❌ No data available. Make sure your ETL pipeline is running!")
         return
     
     # Main content
@@ -164,7 +303,6 @@ def main():
         st.metric("🏙️ Cities Tracked", cities_count)
     
     with col4:
-        total_records = len(historical_data)
         st.metric("📊 Total Records", total_records)
     
     st.markdown("---")
@@ -203,85 +341,73 @@ def main():
                     <h1>{row['temperature']:.1f}°C</h1>
                     <p>Feels like {row['feels_like']:.1f}°C</p>
                     <p>{row['weather_description'].title()}</p>
-                    <small>💧 {row['humidity']}% | 💨 {row['wind_speed']:.1f} m/s</small>
+                    <small>💧 {row['humidity']:.0f}% | 💨 {row['wind_speed']:.1f} m/s</small>
                 </div>
                 """, unsafe_allow_html=True)
     
     st.markdown("---")
-    
-    # Charts Section
-    chart_col1, chart_col2 = st.columns(2)
-    
-    with chart_col1:
-        st.subheader("📈 Temperature Trends")
-        if not historical_data.empty:
-            fig = px.line(
-                historical_data, 
-                x='data_timestamp', 
-                y='temperature', 
-                color='city',
-                title="Temperature Over Time"
-            )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
-    
-    with chart_col2:
-        st.subheader("💧 Humidity vs Temperature")
-        if not latest_data.empty:
-            fig = px.scatter(
-                latest_data, 
-                x='temperature', 
-                y='humidity',
-                size='pressure',
-                color='city',
-                title="Current Humidity vs Temperature",
-                hover_data=['weather_main']
-            )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
-    
-    # Analytics Section
-    st.markdown("---")
-    st.subheader("📊 Analytics")
-    
-    analytics_col1, analytics_col2, analytics_col3 = st.columns(3)
-    
-    with analytics_col1:
-        st.write("**🌡️ Temperature Analytics**")
-        if not analytics_data['avg_temp'].empty:
-            fig = px.bar(
-                analytics_data['avg_temp'], 
-                x='city', 
-                y='avg_temp',
-                title=f"Average Temperature (Last {days_range} days)"
-            )
-            fig.update_layout(height=300)
-            st.plotly_chart(fig, use_container_width=True)
-    
-    with analytics_col2:
-        st.write("**🌤️ Weather Distribution**")
-        if not analytics_data['weather_distribution'].empty:
-            fig = px.pie(
-                analytics_data['weather_distribution'], 
-                values='count', 
-                names='weather_main',
-                title="Weather Conditions Distribution"
-            )
-            fig.update_layout(height=300)
-            st.plotly_chart(fig, use_container_width=True)
-    
-    with analytics_col3:
-        st.write("**⏰ Hourly Trends**")
-        if not analytics_data['hourly_trends'].empty:
-            fig = px.line(
-                analytics_data['hourly_trends'], 
-                x='hour', 
-                y='avg_temp',
-                title="Average Hourly Temperature"
-            )
-            fig.update_layout(height=300)
-            st.plotly_chart(fig, use_container_width=True)
-    
+
+def render_trend_chart(trend_data):
+    if not trend_data.empty:
+        fig = px.line(
+            trend_data, 
+            x='data_timestamp', 
+            y='temperature', 
+            color='city',
+            title="Temperature Over Time"
+        )
+        fig.update_layout(height=400)
+        st.plotly_chart(fig, use_container_width=True)
+
+def render_humidity_scatter(latest_data):
+    if not latest_data.empty:
+        fig = px.scatter(
+            latest_data, 
+            x='temperature', 
+            y='humidity',
+            size='pressure',
+            color='city',
+            title="Current Humidity vs Temperature",
+            hover_data=['weather_main']
+        )
+        fig.update_layout(height=400)
+        st.plotly_chart(fig, use_container_width=True)
+
+def render_avg_temp(avg_temp, days_range):
+    if not avg_temp.empty:
+        fig = px.bar(
+            avg_temp, 
+            x='city', 
+            y='avg_temp',
+            title=f"Average Temperature (Last {days_range} days)"
+        )
+        fig.update_layout(height=300)
+        st.plotly_chart(fig, use_container_width=True)
+
+def render_weather_distribution(weather_distribution):
+    if not weather_distribution.empty:
+        fig = px.pie(
+            weather_distribution, 
+            values='count', 
+            names='weather_main',
+            title="Weather Conditions Distribution"
+        )
+        fig.update_layout(height=300)
+        st.plotly_chart(fig, use_container_width=True)
+
+def render_hourly_trends(hourly_trends):
+    if not hourly_trends.empty:
+        fig = px.line(
+            hourly_trends, 
+            x='hour', 
+            y='avg_temp',
+            title="Average Hourly Temperature"
+        )
+        fig.update_layout(height=300)
+        st.plotly_chart(fig, use_container_width=True)
+
+def render_details(dashboard, cities, recent_data, days_range):
+    """Detailed data table; as a fragment, changing the city only reruns this section"""
     # Detailed Data Table
     st.markdown("---")
     st.subheader("📋 Detailed Data")
@@ -289,11 +415,11 @@ def main():
     # City selector
     selected_city = st.selectbox(
         "Select City for Detailed View:",
-        ["All Cities"] + list(latest_data['city'].unique())
+        ["All Cities"] + cities
     )
 
     if selected_city == "All Cities":
-        display_data = historical_data.head(50)
+        display_data = recent_data
     else:
         display_data = dashboard.get_city_data(selected_city, days_range)
 
@@ -314,6 +440,131 @@ def main():
             # Fallback: show all columns if none of the desired ones exist
             st.dataframe(display_data, use_container_width=True)
 
+def watch_for_new_data(dashboard):
+    """Rerun the whole page only once the ETL has loaded data newer than what is shown"""
+    if dashboard.get_watermark() != st.session_state.get('rendered_watermark'):
+        st.rerun()
+
+def main():
+    # Initialize dashboard
+    dashboard = WeatherDashboard()
+    
+    # Header
+    st.title("🌤️ Weather Analytics Dashboard")
+    st.markdown("---")
+    
+    # Sidebar
+    st.sidebar.header("🎛️ Controls")
+    
+    # Auto-refresh option
+    auto_refresh = st.sidebar.checkbox("🔄 Auto Refresh (30s)")
+    
+    # Manual refresh button
+    if st.sidebar.button("🔄 Refresh Data"):
+        load_watermark.clear()
+        st.rerun()
+    
+    # Date range selector
+    days_range = st.sidebar.selectbox(
+        "📅 Data Range",
+        [1, 3, 7, 14, 30],
+        index=2,
+        format_func=lambda x: f"Last {x} day{'s' if x > 1 else ''}"
+    )
+    
+    # History and analytics are only redrawn when the ETL watermark advances;
+    # the timer runs in a fragment so it never blocks the session
+    st.session_state['rendered_watermark'] = dashboard.get_watermark()
+    if auto_refresh:
+        st.fragment(watch_for_new_data, run_every=AUTO_REFRESH_SECONDS)(dashboard)
+    
+    # Every independent query starts now, and each section renders as soon as
+    # the data it needs arrives, so the page waits for the slowest query
+    # rather than the sum of all of them
+    started = time.monotonic()
+    futures = {
+        'latest': dashboard.submit(dashboard.get_latest_data),
+        'trend': dashboard.submit(dashboard.get_temperature_trend, days_range),
+        'recent': dashboard.submit(dashboard.get_historical_data, days_range, 50),
+        'total_records': dashboard.submit(dashboard.get_record_count, days_range),
+    }
+    for key in ANALYTICS_QUERIES:
+        futures[key] = dashboard.submit(dashboard.get_analytics_item, key)
+    
+    # Lay out the page up front with a placeholder per section
+    current_placeholder = st.empty()
+    
+    # Charts Section
+    chart_col1, chart_col2 = st.columns(2)
+    
+    with chart_col1:
+        st.subheader("📈 Temperature Trends")
+        trend_placeholder = st.empty()
+    
+    with chart_col2:
+        st.subheader("💧 Humidity vs Temperature")
+        scatter_placeholder = st.empty()
+    
+    # Analytics Section
+    st.markdown("---")
+    st.subheader("📊 Analytics")
+    
+    analytics_col1, analytics_col2, analytics_col3 = st.columns(3)
+    
+    with analytics_col1:
+        st.write("**🌡️ Temperature Analytics**")
+        avg_temp_placeholder = st.empty()
+    
+    with analytics_col2:
+        st.write("**🌤️ Weather Distribution**")
+        distribution_placeholder = st.empty()
+    
+    with analytics_col3:
+        st.write("**⏰ Hourly Trends**")
+        hourly_placeholder = st.empty()
+    
+    details_placeholder = st.empty()
+    
+    refresh_every = AUTO_REFRESH_SECONDS if auto_refresh else None
+    sections = [
+        (current_placeholder, ['latest', 'total_records'],
+         lambda data: st.fragment(render_current_conditions, run_every=refresh_every)(dashboard, data['total_records'])),
+        (trend_placeholder, ['trend'], lambda data: render_trend_chart(data['trend'])),
+        (scatter_placeholder, ['latest'], lambda data: render_humidity_scatter(data['latest'])),
+        (avg_temp_placeholder, ['avg_temp'], lambda data: render_avg_temp(data['avg_temp'], days_range)),
+        (distribution_placeholder, ['weather_distribution'],
+         lambda data: render_weather_distribution(data['weather_distribution'])),
+        (hourly_placeholder, ['hourly_trends'], lambda data: render_hourly_trends(data['hourly_trends'])),
+        (details_placeholder, ['latest', 'recent'],
+         lambda data: st.fragment(render_details)(dashboard, list(data['latest']['city'].unique()),
+                                                  data['recent'], days_range)),
+    ]
+    for placeholder, _, _ in sections:
+        placeholder.caption("⏳ Loading...")
+    
+    data = {}
+    first_paint = None
+    keys = {future: key for key, future in futures.items()}
+    for future in as_completed(keys):
+        key = keys[future]
+        data[key] = dashboard.result(future)
+        
+        if key == 'latest' and data['latest'].empty:
+            for placeholder, _, _ in sections:
+                placeholder.empty()
+            st.error("❌ No data available. Make sure your ETL pipeline is running!")
+            return
+        
+        for section in [section for section in sections if all(need in data for need in section[1])]:
+            placeholder, _, render = section
+            with placeholder.container():
+                render(data)
+            sections.remove(section)
+            if first_paint is None:
+                first_paint = time.monotonic() - started
+    
+    # Read by the load test to measure time to first section and full page
+    st.session_state['load_timings'] = {'first_section': first_paint, 'total': time.monotonic() - started}
     
     # Footer
     st.markdown("---")
@@ -0,0 +1,165 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import mysql.connector
+from config import DB_CONFIG, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_MAX_LIFETIME, LOCAL_INFILE
+
+class PooledConnection:
+    """Connection checked out of a ConnectionPool; close() returns it to the pool"""
+    def __init__(self, pool, connection, created_at):
+        self._pool = pool
+        self._connection = connection
+        self._created_at = created_at
+        self._returned = False
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def close(self):
+        if not self._returned:
+            self._returned = True
+            self._pool.release(self._connection, self._created_at)
+
+class ConnectionPool:
+    """Thread-safe MySQL connection pool with health checks and connection recycling"""
+    def __init__(self, db_config=DB_CONFIG, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                 max_lifetime=DB_POOL_MAX_LIFETIME, **connect_args):
+        self.db_config = dict(db_config, **connect_args)
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.closed = False
+
+        # LIFO so the most recently used (warmest) connection is handed out first
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.stats = {
+            'checkouts': 0,
+            'connections_created': 0,
+            'connections_recycled': 0,
+            'failed_health_checks': 0,
+            'checkout_timeouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    def get_connection(self):
+        """Borrow a healthy connection, waiting up to timeout seconds for a free slot"""
+        if self.closed:
+            raise mysql.connector.errors.PoolError("Connection pool is closed")
+
+        started = time.monotonic()
+        if not self.slots.acquire(timeout=self.timeout):
+            self.increment('checkout_timeouts')
+            raise mysql.connector.errors.PoolError(
+                f"No free connection after {self.timeout}s (pool size {self.size})")
+        waited = time.monotonic() - started
+
+        try:
+            connection, created_at = self.checkout_idle()
+            if connection is None:
+                connection = mysql.connector.connect(**self.db_config)
+                created_at = time.monotonic()
+                self.increment('connections_created')
+        except Exception:
+            self.slots.release()
+            raise
+
+        with self.lock:
+            self.stats['checkouts'] += 1
+            self.stats['wait_time_total'] += waited
+            self.stats['wait_time_max'] = max(self.stats['wait_time_max'], waited)
+        return PooledConnection(self, connection, created_at)
+
+    def checkout_idle(self):
+        """Return an idle connection that is alive and within its lifetime, if any"""
+        while True:
+            try:
+                connection, created_at = self.idle.get_nowait()
+            except queue.Empty:
+                return None, None
+
+            if time.monotonic() - created_at > self.max_lifetime:
+                self.increment('connections_recycled')
+                self.discard(connection)
+                continue
+
+            try:
+                connection.ping(reconnect=False)
+            except mysql.connector.Error:
+                self.increment('failed_health_checks')
+                self.discard(connection)
+                continue
+
+            return connection, created_at
+
+    def release(self, connection, created_at):
+        """Return a connection to the pool, discarding it if it is no longer reusable"""
+        try:
+            if self.closed or time.monotonic() - created_at > self.max_lifetime:
+                self.discard(connection)
+                return
+            try:
+                if connection.in_transaction:
+                    connection.rollback()
+            except mysql.connector.Error:
+                self.discard(connection)
+                return
+            self.idle.put((connection, created_at))
+        finally:
+            self.slots.release()
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except mysql.connector.Error:
+            pass
+
+    def increment(self, counter):
+        with self.lock:
+            self.stats[counter] += 1
+
+    def get_stats(self):
+        """Return checkout counts and wait times for sizing the pool"""
+        with self.lock:
+            stats = dict(self.stats)
+        stats['idle'] = self.idle.qsize()
+        stats['wait_time_avg'] = stats['wait_time_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
+
+    def close(self, timeout=DB_POOL_TIMEOUT):
+        """Stop lending connections, wait for borrowed ones to come back, then close all"""
+        self.closed = True
+
+        deadline = time.monotonic() + timeout
+        drained = 0
+        while drained < self.size and self.slots.acquire(timeout=max(0, deadline - time.monotonic())):
+            drained += 1
+        if drained < self.size:
+            logging.warning(f"Closing pool with {self.size - drained} connections still checked out")
+
+        while True:
+            try:
+                connection, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(connection)
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        # Connections must not be shared with a forked parent process
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ConnectionPool(allow_local_infile=LOCAL_INFILE)
+            _pool_pid = os.getpid()
+            atexit.register(_pool.close)
+        return _pool
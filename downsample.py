@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: indices of the threshold points that best keep the shape of y(x)"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    return lttb_many(x[np.newaxis], y[np.newaxis], threshold)[0]
+
+def lttb_many(x, y, threshold):
+    """LTTB over several series of equal length at once, one per row of x and y
+
+    The buckets depend only on the length, so every series is walked bucket by
+    bucket in the same loop and the cost no longer grows with the series count.
+    Returns a (rows, threshold) array of indices into each row.
+    """
+    rows, n = x.shape
+    series = np.arange(rows)
+
+    # First and last points are always kept; the rest is split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = np.empty((rows, threshold), dtype=int)
+    keep[:, 0], keep[:, -1] = 0, n - 1
+
+    selected = np.zeros(rows, dtype=int)
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[:, end:next_end].mean(axis=1, keepdims=True)
+        next_y = y[:, end:next_end].mean(axis=1, keepdims=True)
+        selected_x = x[series, selected][:, np.newaxis]
+        selected_y = y[series, selected][:, np.newaxis]
+
+        # Pick the point forming the largest triangle with the previous pick and the next bucket's average
+        area = np.abs((selected_x - next_x) * (y[:, start:end] - selected_y)
+                      - (selected_x - x[:, start:end]) * (next_y - selected_y))
+        selected = start + np.argmax(area, axis=1)
+        keep[:, i + 1] = selected
+
+    return keep
+
+def downsample_series(df, x, y, group, max_points):
+    """Apply LTTB to each group (e.g. city) of a long-format frame sorted by x
+
+    Groups with the same number of points are downsampled together, so a chart
+    of a hundred cities costs about as much as one. Rows keep their order in df.
+    """
+    if df.empty:
+        return df
+    x_values = df[x]
+    if not pd.api.types.is_numeric_dtype(x_values):
+        x_values = pd.to_datetime(x_values).astype('int64')
+    x_values = x_values.to_numpy(dtype='float64')
+    y_values = df[y].to_numpy(dtype='float64')
+
+    by_length = {}
+    for positions in df.groupby(group, sort=False, observed=True).indices.values():
+        by_length.setdefault(len(positions), []).append(positions)
+
+    kept = []
+    for length, groups in by_length.items():
+        positions = np.vstack(groups)
+        if max_points >= length or max_points < 3:
+            kept.append(positions.ravel())
+            continue
+        picked = lttb_many(x_values[positions], y_values[positions], max_points)
+        kept.append(np.take_along_axis(positions, picked, axis=1).ravel())
+    return df.iloc[np.sort(np.concatenate(kept))].reset_index(drop=True)
@@ -0,0 +1,60 @@
+import pandas as pd
+from config import DASHBOARD_DTYPE_BACKEND
+
+# The column dtype contract shared by the transformer, the loader and the
+# dashboard, so a frame looks the same whichever stage produced it
+OUTPUT_COLUMNS = ['city', 'country', 'temperature', 'feels_like', 'humidity', 'pressure',
+                  'weather_main', 'weather_description', 'wind_speed', 'wind_direction',
+                  'visibility', 'data_timestamp']
+MEASUREMENT_COLUMNS = ['temperature', 'feels_like', 'humidity', 'pressure',
+                       'wind_speed', 'wind_direction', 'visibility']
+# Aggregates the dashboard reads back from the rollups
+AGGREGATE_COLUMNS = ['avg_temp', 'min_temp', 'max_temp', 'avg_humidity']
+CATEGORY_COLUMNS = ['city', 'country', 'weather_main']
+TIMESTAMP_COLUMNS = ['data_timestamp', 'recorded_at']
+
+FLOAT_DTYPES = {'numpy': 'float32', 'pyarrow': 'float32[pyarrow]'}
+TIMESTAMP_DTYPES = {'numpy': 'datetime64[ns]', 'pyarrow': 'timestamp[ns][pyarrow]'}
+
+def apply_dtypes(df, backend='numpy'):
+    """Cast the contract's columns present in df: float32 measurements, categories, datetimes
+
+    Columns outside the contract (ids, counts, hours) are left as they are.
+    backend='pyarrow' keeps numbers and timestamps Arrow-backed.
+    """
+    float_columns = [col for col in MEASUREMENT_COLUMNS + AGGREGATE_COLUMNS if col in df.columns]
+    category_columns = [col for col in CATEGORY_COLUMNS if col in df.columns]
+    timestamp_columns = [col for col in TIMESTAMP_COLUMNS if col in df.columns]
+    if not (float_columns or category_columns or timestamp_columns):
+        return df
+
+    df = df.copy()
+    for col in float_columns:
+        # MySQL DECIMAL arrives as Decimal objects, which only cast through float64
+        if df[col].dtype == object:
+            df[col] = df[col].astype('float64')
+        df[col] = df[col].astype(FLOAT_DTYPES[backend])
+    for col in category_columns:
+        df[col] = df[col].astype('category')
+    for col in timestamp_columns:
+        df[col] = pd.to_datetime(df[col]).astype(TIMESTAMP_DTYPES[backend])
+    return df
+
+def apply_dashboard_dtypes(df):
+    return apply_dtypes(df, DASHBOARD_DTYPE_BACKEND)
+
+def sql_rows(df, columns):
+    """Rows of df as plain tuples for a DB driver, with timestamps formatted as text
+
+    to_records() on a datetime64 column yields integer nanoseconds, which the
+    MySQL driver would store as numbers, so timestamps are formatted first.
+    float32 values are widened with their float32 noise rounded away
+    (3.1 rather than 3.0999999046), well below the schema's 2 decimals.
+    """
+    df = df[columns].copy()
+    for col in columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+        elif df[col].dtype == 'float32':
+            df[col] = df[col].astype('float64').round(4)
+    return df.to_records(index=False).tolist()
@@ -1,11 +1,30 @@
+import argparse
+import asyncio
+import cProfile
 import logging
+import pstats
+import mysql.connector
 import schedule
+import sqlite3
 import time
 import sys
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from extract import WeatherExtractor
 from transform import WeatherTransformer
 from load import WeatherLoader
+from db import get_pool
+from migrate import SchemaMigrator
+from columnar import ParquetSink
+from change_detection import ObservationWatermarks
+from metrics import RunMetrics, start_metrics_server
+from sharding import ShardedRunner
+from scheduler import BatchScheduler
+from write_buffer import WriteBuffer, BufferDrainer
+from archive import RawArchive
+from city_registry import CityRegistry
+from config import (CITIES, EXTRACT_ENGINE, PIPELINE_MODE, CHUNK_SIZE, PARQUET_SINK, SHARD_WORKERS,
+                    SCHEDULE_BATCHES, SCHEDULE_INTERVAL_MINUTES, CHANGE_DETECTION, METRICS_PORT,
+                    WRITE_BUFFER, ARCHIVE)
 
 # Configure logging with rotation
 from logging.handlers import RotatingFileHandler
@@ -25,31 +44,160 @@ logger.addHandler(file_handler)
 logger.addHandler(console_handler)
 
 class WeatherETLPipeline:
-    def __init__(self):
+    def __init__(self, engine=EXTRACT_ENGINE, mode=PIPELINE_MODE, chunk_size=CHUNK_SIZE, cities=None):
+        if engine not in ('sync', 'async', 'group'):
+            raise ValueError(f"Unknown extract engine: {engine}")
+        if mode not in ('batch', 'streaming'):
+            raise ValueError(f"Unknown pipeline mode: {mode}")
+        self.engine = engine
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.cities = cities  # None means all configured cities
         self.extractor = WeatherExtractor()
         self.transformer = WeatherTransformer()
         self.loader = WeatherLoader()
+        self.watermarks = ObservationWatermarks() if CHANGE_DETECTION else None
+        # Loads go through the local write buffer when enabled; main() runs the drainer
+        self.buffer = WriteBuffer() if WRITE_BUFFER else None
+        self.archive = RawArchive() if ARCHIVE else None
         self.failure_count = 0
         self.max_failures = 5
     
+    def extract(self):
+        """Fetch raw data for all cities using the configured engine"""
+        if self.engine == 'async':
+            return asyncio.run(self.extractor.fetch_all_cities_async(self.cities))
+        if self.engine == 'group':
+            return self.extractor.fetch_all_cities_grouped(self.cities)
+        return self.extractor.fetch_all_cities(self.cities)
+    
+    def iter_raw(self):
+        """Yield raw records one at a time using the configured engine"""
+        if self.engine == 'group':
+            yield from self.extractor.iter_cities_grouped(self.cities)
+        elif self.engine == 'sync':
+            yield from self.extractor.iter_cities(self.cities)
+        else:
+            # Step the async generator from this thread; in-flight requests are
+            # bounded by the extractor, so nothing piles up between chunks
+            loop = asyncio.new_event_loop()
+            records = self.extractor.iter_cities_async(self.cities)
+            try:
+                while True:
+                    try:
+                        yield loop.run_until_complete(records.__anext__())
+                    except StopAsyncIteration:
+                        break
+            finally:
+                loop.run_until_complete(records.aclose())
+                loop.close()
+    
+    def iter_chunks(self):
+        """Group raw records into lists of at most chunk_size"""
+        chunk = []
+        for data in self.iter_raw():
+            chunk.append(data)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    
+    def filter_unchanged(self, raw_data):
+        """Drop payloads whose observation was already loaded; returns (payloads, skipped)"""
+        if self.watermarks is None:
+            return raw_data, 0
+        return self.watermarks.filter(raw_data)
+    
+    def mark_loaded(self, raw_data):
+        if self.watermarks is not None:
+            self.watermarks.advance(raw_data)
+    
+    def save_watermarks(self):
+        if self.watermarks is None:
+            return
+        try:
+            self.watermarks.save()
+        except OSError as e:
+            logging.warning(f"Could not save city watermarks: {e}")
+    
+    def archive_raw(self, raw_data):
+        """Keep the untouched payloads so they can be re-transformed later"""
+        if self.archive is None:
+            return
+        try:
+            self.archive.append(raw_data)
+        except (OSError, sqlite3.Error) as e:
+            logging.error(f"Could not archive raw payloads: {e}")
+    
+    def store(self, df, raw_data):
+        """Queue df in the write buffer, or load it directly if there is none or it fails
+
+        Only a direct load marks raw_data as loaded; the drainer advances the
+        watermarks for buffered batches once MySQL has committed them.
+        """
+        if self.buffer is not None:
+            try:
+                self.buffer.enqueue(df)
+                return True
+            except sqlite3.Error as e:
+                logging.error(f"Could not buffer batch, loading directly: {e}")
+        success = self.loader.load_data(df)
+        if success:
+            self.mark_loaded(raw_data)
+        return success
+    
     def run_pipeline(self):
         """Execute the complete ETL pipeline with error recovery"""
+        run = RunMetrics(len(CITIES if self.cities is None else self.cities))
+        failures_before = self.failure_count
+        try:
+            if self.mode == 'streaming':
+                self.run_pipeline_streaming(run)
+            else:
+                self.run_pipeline_batch(run)
+        finally:
+            status = 'failed' if self.failure_count > failures_before else 'success'
+            run.finish(status, self.loader.get_connection())
+    
+    def run_pipeline_batch(self, run):
+        """Extract everything, then transform and load it as one batch"""
         logging.info(f"Starting ETL pipeline at {datetime.now()}")
         
         try:
             # Extract
             logging.info("Extracting weather data...")
-            raw_data = self.extractor.fetch_all_cities()
+            http_before = self.extractor.get_stats()
+            with run.stage('extract'):
+                raw_data = self.extract()
+            http_stats = {key: value - http_before[key]
+                          for key, value in self.extractor.get_stats().items()}
+            logging.info(f"HTTP stats: {http_stats}")
             
             if not raw_data:
                 logging.warning("No data extracted")
                 self.failure_count += 1
                 return
             
+            run.add_rows('extracted', len(raw_data))
+            raw_data, skipped = self.filter_unchanged(raw_data)
+            run.add_rows('skipped', skipped)
+            if skipped:
+                logging.info(f"Skipped {skipped} unchanged records")
+            if not raw_data:
+                logging.info("No new observations since the last run")
+                self.failure_count = 0
+                return
+            self.archive_raw(raw_data)
+            
             # Transform
             logging.info("Transforming data...")
-            df = self.transformer.transform_weather_data(raw_data)
-            df = self.transformer.validate_data(df)
+            with run.stage('transform'):
+                df = self.transformer.transform_weather_data_columnar(raw_data)
+            run.add_rows('validate_in', len(df))
+            with run.stage('validate'):
+                df = self.transformer.validate_data(df)
+            run.add_rows('validate_out', len(df))
             
             if df.empty:
                 logging.warning("No valid data after transformation")
@@ -58,10 +206,15 @@ class WeatherETLPipeline:
             
             # Load
             logging.info("Loading data into database...")
-            success = self.loader.load_data(df)
+            with run.stage('load'):
+                success = self.store(df, raw_data)
             
+            logging.info(f"DB pool stats: {get_pool().get_stats()}")
             if success:
-                logging.info(f"ETL pipeline completed successfully. Processed {len(df)} records.")
+                run.add_rows('loaded', len(df))
+                self.save_watermarks()
+                logging.info(f"ETL pipeline completed successfully. Processed {len(df)} records "
+                             f"({skipped} unchanged records skipped).")
                 self.failure_count = 0  # Reset failure count on success
             else:
                 logging.error("ETL pipeline failed during loading")
@@ -71,30 +224,169 @@ class WeatherETLPipeline:
             logging.error(f"ETL pipeline failed: {e}")
             self.failure_count += 1
         
-        # Check if too many failures
+        self.check_failures()
+    
+    def run_pipeline_streaming(self, run):
+        """Execute the ETL pipeline chunk by chunk so memory stays bounded"""
+        logging.info(f"Starting streaming ETL pipeline at {datetime.now()} (chunk size {self.chunk_size})")
+        extracted = loaded = skipped = failed_chunks = 0
+        
+        try:
+            chunks = self.iter_chunks()
+            while True:
+                # Time spent waiting for the next chunk is extraction time
+                with run.stage('extract'):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                
+                extracted += len(chunk)
+                chunk, chunk_skipped = self.filter_unchanged(chunk)
+                skipped += chunk_skipped
+                if not chunk:
+                    continue
+                self.archive_raw(chunk)
+                
+                with run.stage('transform'):
+                    df = self.transformer.transform_weather_data_columnar(chunk)
+                run.add_rows('validate_in', len(df))
+                with run.stage('validate'):
+                    df = self.transformer.validate_data(df)
+                run.add_rows('validate_out', len(df))
+                
+                if df.empty:
+                    continue
+                
+                with run.stage('load'):
+                    success = self.store(df, chunk)
+                if success:
+                    loaded += len(df)
+                else:
+                    failed_chunks += 1
+                del chunk
+            
+            self.save_watermarks()
+            run.add_rows('extracted', extracted)
+            run.add_rows('skipped', skipped)
+            run.add_rows('loaded', loaded)
+            logging.info(f"DB pool stats: {get_pool().get_stats()}")
+            if skipped:
+                logging.info(f"Skipped {skipped} of {extracted} records as unchanged")
+            if not extracted:
+                logging.warning("No data extracted")
+                self.failure_count += 1
+            elif failed_chunks or not (loaded or skipped):
+                logging.error(f"Streaming ETL pipeline loaded {loaded} of {extracted} records "
+                              f"({failed_chunks} chunks failed)")
+                self.failure_count += 1
+            else:
+                logging.info(f"Streaming ETL pipeline completed successfully. Processed {loaded} records.")
+                self.failure_count = 0
+                
+        except Exception as e:
+            logging.error(f"ETL pipeline failed: {e}")
+            self.failure_count += 1
+        
+        self.check_failures()
+    
+    def check_failures(self):
+        """Stop the process after too many consecutive failed runs"""
         if self.failure_count >= self.max_failures:
             logging.critical(f"Too many failures ({self.failure_count}). Stopping pipeline.")
             sys.exit(1)
 
+def maintain_schema(migrator):
+    """Apply pending migrations and partition maintenance without crashing the scheduler"""
+    try:
+        migrator.migrate()
+        migrator.maintain_partitions()
+    except mysql.connector.Error as e:
+        logging.error(f"Schema maintenance failed: {e}")
+
+def compact_parquet():
+    """Merge yesterday's small per-batch Parquet files into one file per city"""
+    try:
+        ParquetSink().compact_day(date.today() - timedelta(days=1))
+    except Exception as e:
+        logging.error(f"Parquet compaction failed: {e}")
+
+def build_jobs():
+    """One pipeline per scheduled city batch (a single sharded runner when SHARD_WORKERS > 1)
+
+    The scheduler gives each job its due cities from the city registry before every run.
+    """
+    if SHARD_WORKERS > 1:
+        return [ShardedRunner(WeatherETLPipeline, cities=[])]
+    return [WeatherETLPipeline(cities=[]) for _ in range(SCHEDULE_BATCHES)]
+
+def profile_run(path):
+    """Run the pipeline once for all enabled cities under cProfile and dump the stats to path
+
+    The run loads directly even with WRITE_BUFFER set: no drainer runs for a
+    one-off profile, and the load belongs in the profile anyway.
+    """
+    registry = CityRegistry()
+    registry.refresh()
+    pipeline = WeatherETLPipeline(cities=registry.cities())
+    pipeline.buffer = None
+    profiler = cProfile.Profile()
+    profiler.runcall(pipeline.run_pipeline)
+    profiler.dump_stats(path)
+    logging.info(f"Profile written to {path} (view with: python -m pstats {path})")
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+
 def main():
-    pipeline = WeatherETLPipeline()
+    parser = argparse.ArgumentParser(description="Weather ETL pipeline")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="run the pipeline once under cProfile, write the stats to PATH and exit")
+    args = parser.parse_args()
+    
+    migrator = SchemaMigrator()
+    
+    # Bring the schema up to date before the first load
+    maintain_schema(migrator)
+    
+    if args.profile:
+        profile_run(args.profile)
+        return
+    
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    
+    # One drainer per host loads everything pipelines (and shard workers) have buffered
+    drainer = None
+    if WRITE_BUFFER:
+        drainer = BufferDrainer(WriteBuffer(), WeatherLoader(),
+                                watermarks=ObservationWatermarks() if CHANGE_DETECTION else None)
+        drainer.start()
     
-    # Run immediately
-    pipeline.run_pipeline()
+    # City batches are spread across the interval; batches that missed a run
+    # while the pipeline was down run immediately
+    scheduler = BatchScheduler(build_jobs(), registry=CityRegistry())
+    scheduler.start()
     
-    # Schedule to run every hour
-    schedule.every().hour.do(pipeline.run_pipeline)
+    # Maintenance jobs stay on the simple schedule
+    schedule.every().day.do(maintain_schema, migrator)
+    if PARQUET_SINK:
+        schedule.every().day.at("00:30").do(compact_parquet)
     
-    logging.info("ETL pipeline started. Scheduled to run every hour.")
+    logging.info(f"ETL pipeline started. {len(scheduler.jobs)} batches scheduled every "
+                 f"{SCHEDULE_INTERVAL_MINUTES} minutes.")
     logging.info("Press Ctrl+C to stop gracefully.")
     
+    last_heartbeat = datetime.now().hour
     try:
         while True:
+            if not scheduler.run_pending():
+                logging.critical("A batch failed too many times in a row. Stopping pipeline.")
+                scheduler.close()
+                sys.exit(1)
             schedule.run_pending()
-            time.sleep(60)
+            time.sleep(min(60, max(1, scheduler.seconds_until_next())))
             
             # Heartbeat log every hour
-            if datetime.now().minute == 0:
+            if datetime.now().hour != last_heartbeat:
+                last_heartbeat = datetime.now().hour
                 logging.info(f"ETL scheduler heartbeat: {datetime.now()}")
                 
     except KeyboardInterrupt:
@@ -102,6 +394,10 @@ def main():
     except Exception as e:
         logging.critical(f"ETL scheduler crashed: {e}")
         raise
+    finally:
+        # Whatever stops the scheduler, the current drain finishes and the rest stays on disk
+        if drainer is not None:
+            drainer.stop(timeout=60)
 
 if __name__ == "__main__":
     main()
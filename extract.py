@@ -1,11 +1,174 @@
+import asyncio
+import json
+import os
 import requests
 import logging
-from config import OPENWEATHER_API_KEY, OPENWEATHER_BASE_URL, CITIES
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from metrics import FETCH_SECONDS
+from config import (OPENWEATHER_API_KEY, OPENWEATHER_BASE_URL, CITIES,
+                    MAX_CONCURRENCY, REQUEST_TIMEOUT, API_RATE_LIMIT,
+                    HTTP_POOL_SIZE, MAX_RETRIES, RETRY_BACKOFF, RETRY_MAX_BACKOFF,
+                    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT,
+                    OPENWEATHER_GROUP_URL, GROUP_BATCH_SIZE, CITY_ID_CACHE_PATH,
+                    CITY_ID_CACHE_TTL)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised when a request is rejected because the endpoint's breaker is open"""
+
+class CircuitBreaker:
+    """Fail fast on an endpoint after repeated failures until a cool-down has passed"""
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if a request may be sent (closed, or a half-open trial)"""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        """Record a failure and return True if it tripped the breaker open"""
+        with self.lock:
+            self.failures += 1
+            half_open = self.trial_in_flight
+            self.trial_in_flight = False
+            if half_open or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+class TokenBucket:
+    """Thread-safe token bucket that spaces out requests to stay under an API quota"""
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a token is available and consume it"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            # Reserve the token now and sleep outside the lock, so waiting
+            # callers queue up in order instead of polling
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+# The quota belongs to the API key, so every extractor and engine in the
+# process shares one bucket per API host and rate
+RATE_LIMITERS = {}
+RATE_LIMITERS_LOCK = threading.Lock()
+
+def get_rate_limiter(url, rate_per_minute, burst):
+    """Return the process-wide token bucket for the host of a URL at rate_per_minute
+
+    Keying on the rate too means an extractor never runs at a rate set by
+    another, such as a shard worker's share of the quota against a bucket
+    forked from the full-rate parent. Callers at the same rate share the
+    bucket, which holds the largest burst any of them asked for.
+    """
+    key = (urlparse(url).netloc, rate_per_minute)
+    with RATE_LIMITERS_LOCK:
+        if key not in RATE_LIMITERS:
+            RATE_LIMITERS[key] = TokenBucket(rate_per_minute, burst)
+        limiter = RATE_LIMITERS[key]
+    with limiter.lock:
+        limiter.capacity = max(limiter.capacity, burst)
+    return limiter
+
+class CityIdCache:
+    """City name to OpenWeatherMap city ID mapping, persisted to a local JSON file"""
+    def __init__(self, path=CITY_ID_CACHE_PATH, ttl=CITY_ID_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable city ID cache {self.path}: {e}")
+            return {}
+
+    def save(self):
+        """Merge with the file on disk and write it atomically
+
+        Shard processes and scheduler batches share the file, so the most
+        recently resolved ID for each city wins rather than the last writer.
+        """
+        with self.lock:
+            for city, entry in self.load().items():
+                if entry['resolved_at'] > self.entries.get(city, {}).get('resolved_at', float('-inf')):
+                    self.entries[city] = entry
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+
+    def get(self, city):
+        """Return the cached ID for a city, or None if missing or expired"""
+        entry = self.entries.get(city)
+        if entry and time.time() - entry['resolved_at'] < self.ttl:
+            return entry['id']
+        return None
+
+    def set(self, city, city_id):
+        self.entries[city] = {'id': city_id, 'resolved_at': time.time()}
 
 class WeatherExtractor:
-    def __init__(self):
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, timeout=REQUEST_TIMEOUT,
+                 rate_limit=API_RATE_LIMIT, pool_size=HTTP_POOL_SIZE, max_retries=MAX_RETRIES):
         self.api_key = OPENWEATHER_API_KEY
         self.base_url = OPENWEATHER_BASE_URL
+        self.group_url = OPENWEATHER_GROUP_URL
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.rate_limit = rate_limit
+        self.max_retries = max_retries
+
+        # Keep-alive session so each city reuses a pooled TCP/TLS connection
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+        self.id_cache = CityIdCache()
+        self.breakers = {}
+        self.counters = {'retries': 0, 'breaker_trips': 0, 'breaker_rejections': 0}
+        self.lock = threading.Lock()
         
     def fetch_weather_data(self, city):
         """Fetch weather data for a specific city"""
@@ -16,22 +179,212 @@ class WeatherExtractor:
                 'units': 'metric'
             }
             
-            response = requests.get(self.base_url, params=params)
-            response.raise_for_status()
-            
-            return response.json()
+            started = time.monotonic()
+            try:
+                return self.get_json(self.base_url, params)
+            finally:
+                FETCH_SECONDS.observe(time.monotonic() - started, city)
             
         except requests.exceptions.RequestException as e:
             logging.error(f"Error fetching data for {city}: {e}")
             return None
     
-    def fetch_all_cities(self):
+    def get_json(self, url, params):
+        """GET a JSON endpoint with rate limiting, retry, backoff and per-endpoint circuit breaking"""
+        breaker = self.get_breaker(url)
+        limiter = get_rate_limiter(url, self.rate_limit, self.max_concurrency)
+
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow_request():
+                self.increment('breaker_rejections')
+                raise CircuitOpenError(f"Circuit open for {urlparse(url).path}")
+
+            # Every attempt, retries included, counts against the quota
+            limiter.acquire()
+            retry_after = None
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                # Any transport failure must reach the breaker, or a failed
+                # half-open trial would leave it rejecting every later call
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    # Other client errors (e.g. unknown city) say nothing about API health
+                    breaker.record_success()
+                    response.raise_for_status()
+                    return response.json()
+                retry_after = self.parse_retry_after(response.headers.get('Retry-After'))
+                error = requests.exceptions.HTTPError(
+                    f"{response.status_code} Error for url: {response.url}", response=response)
+
+            if breaker.record_failure():
+                self.increment('breaker_trips')
+                logging.warning(f"Circuit breaker opened for {urlparse(url).path}")
+            if attempt == self.max_retries:
+                raise error
+
+            self.increment('retries')
+            if retry_after is None:
+                # Exponential backoff with full jitter
+                retry_after = random.uniform(0, min(RETRY_MAX_BACKOFF, RETRY_BACKOFF * 2 ** attempt))
+            # A server asking for minutes would stall the whole run, so cap it;
+            # if it's still unhealthy the breaker takes over
+            time.sleep(min(retry_after, RETRY_MAX_BACKOFF))
+
+    def get_breaker(self, url):
+        """Return the circuit breaker for the endpoint (host and path) of a URL"""
+        parsed = urlparse(url)
+        endpoint = f"{parsed.netloc}{parsed.path}"
+        with self.lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+            return self.breakers[endpoint]
+
+    @staticmethod
+    def parse_retry_after(value):
+        """Convert a Retry-After header (seconds or HTTP date) to a delay in seconds"""
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    def increment(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def get_stats(self):
+        """Return cumulative HTTP counters for this extractor"""
+        requests_sent = 0
+        connections_opened = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                requests_sent += pool.num_requests
+                connections_opened += pool.num_connections
+
+        with self.lock:
+            stats = dict(self.counters)
+        stats['requests'] = requests_sent
+        stats['connections_opened'] = connections_opened
+        stats['connections_reused'] = requests_sent - connections_opened
+        return stats
+
+    def fetch_all_cities(self, cities=None):
         """Fetch weather data for all configured cities"""
         weather_data = []
         
-        for city in CITIES:
+        for city in CITIES if cities is None else cities:
             data = self.fetch_weather_data(city)
             if data:
                 weather_data.append(data)
                 
         return weather_data
+
+    def fetch_group(self, city_ids):
+        """Fetch weather data for up to GROUP_BATCH_SIZE city IDs in one call"""
+        try:
+            params = {
+                'id': ','.join(str(city_id) for city_id in city_ids),
+                'appid': self.api_key,
+                'units': 'metric'
+            }
+
+            started = time.monotonic()
+            try:
+                return self.get_json(self.group_url, params).get('list', [])
+            finally:
+                # Group calls cover many cities, so they get their own series
+                FETCH_SECONDS.observe(time.monotonic() - started, '(group)')
+
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Error fetching group of {len(city_ids)} cities: {e}")
+            return []
+
+    def iter_cities(self, cities=None):
+        """Yield weather data for each city one at a time"""
+        for city in CITIES if cities is None else cities:
+            data = self.fetch_weather_data(city)
+            if data:
+                yield data
+
+    def iter_cities_grouped(self, cities=None):
+        """Yield weather data for all cities through the multi-city group endpoint"""
+        cities = CITIES if cities is None else cities
+        cities_by_id = {}
+
+        for city in cities:
+            city_id = self.id_cache.get(city)
+            if city_id is not None:
+                cities_by_id[city_id] = city
+                continue
+
+            # Resolve unknown names with a per-city call and keep its payload
+            data = self.fetch_weather_data(city)
+            if data:
+                self.id_cache.set(city, data['id'])
+                yield data
+
+        self.id_cache.save()
+
+        city_ids = list(cities_by_id)
+        for start in range(0, len(city_ids), GROUP_BATCH_SIZE):
+            batch = city_ids[start:start + GROUP_BATCH_SIZE]
+            results = self.fetch_group(batch)
+            yield from results
+
+            # Fall back to per-city calls for anything the batch did not return
+            returned = {data.get('id') for data in results}
+            missing = [cities_by_id[city_id] for city_id in batch if city_id not in returned]
+            if missing:
+                logging.warning(f"Group call missed {len(missing)} of {len(batch)} cities, fetching individually")
+            yield from self.iter_cities(missing)
+
+    def fetch_all_cities_grouped(self, cities=None):
+        """Fetch weather data for all cities through the multi-city group endpoint"""
+        return list(self.iter_cities_grouped(cities))
+
+    async def iter_cities_async(self, cities=None):
+        """Yield weather data for each city as soon as its request completes"""
+        cities = iter(CITIES if cities is None else cities)
+        loop = asyncio.get_running_loop()
+
+        async def fetch(city):
+            # get_json waits for the host's rate limiter on the worker thread
+            return await loop.run_in_executor(executor, self.fetch_weather_data, city)
+
+        # Keep at most max_concurrency requests in flight; a new one starts only
+        # when a result has been handed to the consumer, so memory stays bounded
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            pending = set()
+            try:
+                while True:
+                    for city in cities:
+                        pending.add(asyncio.create_task(fetch(city)))
+                        if len(pending) >= self.max_concurrency:
+                            break
+                    if not pending:
+                        return
+
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        data = task.result()
+                        if data:
+                            yield data
+            finally:
+                for task in pending:
+                    task.cancel()
+
+    async def fetch_all_cities_async(self, cities=None):
+        """Fetch weather data for all configured cities concurrently"""
+        return [data async for data in self.iter_cities_async(cities)]
@@ -1,54 +1,251 @@
 import mysql.connector
 import pandas as pd
 import logging
-from config import DB_CONFIG
+import os
+import tempfile
+from collections import OrderedDict
+from db import get_pool
+from rollups import previous_observations, apply_rollup_deltas
+from migrate import add_unique_city_timestamp
+from columnar import ParquetSink
+from dtypes import sql_rows
+from config import (DB_CONFIG, LOAD_STRATEGY, MULTIROW_THRESHOLD, INFILE_THRESHOLD,
+                    LOCAL_INFILE, LOADED_KEYS_CACHE_SIZE, PARQUET_SINK)
+
+COLUMNS = ['city', 'country', 'temperature', 'feels_like', 'humidity', 'pressure',
+           'weather_main', 'weather_description', 'wind_speed', 'wind_direction',
+           'visibility', 'data_timestamp']
+KEY_COLUMNS = ['city', 'data_timestamp']
+
+# Rows that hit the (city, data_timestamp) unique key update the stored observation
+UPSERT_CLAUSE = "ON DUPLICATE KEY UPDATE " + ', '.join(
+    f"{col} = VALUES({col})" for col in COLUMNS if col not in KEY_COLUMNS)
+
+# Where load_infile puts a batch before upserting it; weather_data's columns without keys
+STAGING_TABLE_SQL = """
+    CREATE TEMPORARY TABLE weather_data_staging (
+        city VARCHAR(100) NOT NULL,
+        country VARCHAR(50),
+        temperature DECIMAL(5,2),
+        feels_like DECIMAL(5,2),
+        humidity INT,
+        pressure INT,
+        weather_main VARCHAR(50),
+        weather_description VARCHAR(100),
+        wind_speed DECIMAL(5,2),
+        wind_direction INT,
+        visibility INT,
+        data_timestamp DATETIME
+    )
+"""
+
+# Only overwrite a city's latest row with an observation at least as new;
+# data_timestamp is assigned last because MySQL applies assignments in order
+LATEST_UPSERT_CLAUSE = "ON DUPLICATE KEY UPDATE " + ', '.join(
+    f"{col} = IF(VALUES(data_timestamp) >= data_timestamp, VALUES({col}), {col})"
+    for col in COLUMNS if col != 'city')
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used key"""
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+
+    def get(self, key):
+        if key not in self.data:
+            return None
+        self.data.move_to_end(key)
+        return self.data[key]
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
 
 class WeatherLoader:
-    def __init__(self):
+    def __init__(self, strategy=LOAD_STRATEGY):
+        if strategy not in ('auto', 'executemany', 'multirow', 'infile'):
+            raise ValueError(f"Unknown load strategy: {strategy}")
         self.db_config = DB_CONFIG
+        self.strategy = strategy
+        self.max_allowed_packet = None
+        self.loaded_keys = LRUCache(LOADED_KEYS_CACHE_SIZE)
+        self.parquet_sink = ParquetSink() if PARQUET_SINK else None
+        # Why the last load_data call failed, for callers deciding whether to retry
+        self.last_error = None
+        self.unique_key_checked = False
     
     def get_connection(self):
-        """Create database connection"""
+        """Borrow a connection from the shared pool"""
         try:
-            connection = mysql.connector.connect(**self.db_config)
+            connection = get_pool().get_connection()
             return connection
         except mysql.connector.Error as e:
             logging.error(f"Database connection error: {e}")
+            self.last_error = e
             return None
     
+    def choose_strategy(self, row_count):
+        """Pick the load strategy for a batch of the given size"""
+        if self.strategy != 'auto':
+            return self.strategy
+        if LOCAL_INFILE and row_count >= INFILE_THRESHOLD:
+            return 'infile'
+        if row_count >= MULTIROW_THRESHOLD:
+            return 'multirow'
+        return 'executemany'
+    
+    def row_keys(self, df):
+        """Return the (city, data_timestamp) key and a content hash for each row"""
+        hashes = pd.util.hash_pandas_object(df[COLUMNS], index=False).tolist()
+        keys = zip(df['city'].astype(str), df['data_timestamp'].astype(str))
+        return list(zip(keys, hashes))
+    
     def load_data(self, df):
-        """Load transformed data into MySQL database"""
+        """Upsert transformed data into MySQL database, skipping rows already loaded"""
+        self.last_error = None
+        row_keys = self.row_keys(df)
+        changed = [self.loaded_keys.get(key) != row_hash for key, row_hash in row_keys]
+        skipped = len(changed) - sum(changed)
+        if skipped:
+            df = df[changed]
+            row_keys = [row_key for row_key, keep in zip(row_keys, changed) if keep]
+            logging.info(f"Skipping {skipped} records already loaded")
+        if df.empty:
+            return True
+        
         connection = self.get_connection()
         if not connection:
             return False
         
         try:
             cursor = connection.cursor()
+            if not self.unique_key_checked:
+                # Upserts only de-duplicate once the unique key exists, so a
+                # database that migrate.py hasn't brought up to date gets it here
+                add_unique_city_timestamp(cursor)
+                self.unique_key_checked = True
+            strategy = self.choose_strategy(len(df))
+            # The rollups need the rows' stored values from before the upsert
+            previous = previous_observations(cursor, df)
             
-            # Prepare insert query
-            insert_query = """
-                INSERT INTO weather_data 
-                (city, country, temperature, feels_like, humidity, pressure, 
-                 weather_main, weather_description, wind_speed, wind_direction, 
-                 visibility, data_timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            
-            # Convert DataFrame to list of tuples
-            data_tuples = df.to_records(index=False).tolist()
-            
-            # Execute batch insert
-            cursor.executemany(insert_query, data_tuples)
+            if strategy == 'infile':
+                self.load_infile(cursor, df)
+            elif strategy == 'multirow':
+                self.load_multirow(cursor, df)
+            else:
+                self.load_executemany(cursor, df)
+            self.update_latest(cursor, df)
+            self.update_rollups(cursor, df, previous)
+            # Lets dashboards invalidate cached results once this commit is visible
+            cursor.execute("""
+                INSERT INTO etl_watermark (id, last_load_at) VALUES (1, NOW(6))
+                ON DUPLICATE KEY UPDATE last_load_at = NOW(6)
+            """)
             connection.commit()
             
-            logging.info(f"Successfully loaded {len(data_tuples)} records")
+            for key, row_hash in row_keys:
+                self.loaded_keys.put(key, row_hash)
+            
+            logging.info(f"Successfully loaded {len(df)} records ({strategy})")
+            self.write_parquet(df)
             return True
             
         except mysql.connector.Error as e:
             logging.error(f"Error loading data: {e}")
+            self.last_error = e
             connection.rollback()
             return False
             
         finally:
             cursor.close()
             connection.close()
+    
+    def load_executemany(self, cursor, df):
+        """Upsert rows with a single parameterized statement per row"""
+        insert_query = f"""
+            INSERT INTO weather_data ({', '.join(COLUMNS)})
+            VALUES ({', '.join(['%s'] * len(COLUMNS))})
+            {UPSERT_CLAUSE}
+        """
+        
+        # Convert DataFrame to list of tuples
+        data_tuples = sql_rows(df, COLUMNS)
+        cursor.executemany(insert_query, data_tuples)
+    
+    def write_parquet(self, df):
+        """Copy a committed batch to the Parquet store; MySQL stays the source of truth"""
+        if self.parquet_sink is None:
+            return
+        try:
+            self.parquet_sink.write_batch(df)
+        except Exception as e:
+            logging.error(f"Error writing batch to Parquet: {e}")
+    
+    def update_latest(self, cursor, df):
+        """Upsert each city's newest observation into weather_latest"""
+        newest = df[COLUMNS].sort_values('data_timestamp').drop_duplicates('city', keep='last')
+        insert_query = f"""
+            INSERT INTO weather_latest ({', '.join(COLUMNS)})
+            VALUES ({', '.join(['%s'] * len(COLUMNS))})
+            {LATEST_UPSERT_CLAUSE}
+        """
+        cursor.executemany(insert_query, sql_rows(newest, COLUMNS))
+    
+    def update_rollups(self, cursor, df, previous):
+        """Add this batch to the rollup buckets it touches"""
+        apply_rollup_deltas(cursor, df, previous)
+    
+    def load_multirow(self, cursor, df):
+        """Upsert rows with large multi-row INSERTs sized to max_allowed_packet"""
+        if self.max_allowed_packet is None:
+            cursor.execute("SELECT @@max_allowed_packet")
+            self.max_allowed_packet = int(cursor.fetchone()[0])
+        
+        data_tuples = sql_rows(df, COLUMNS)
+        
+        # Size statements from the widest row in a sample, leaving headroom
+        # for quoting/escaping that the length of repr() does not account for
+        sample = data_tuples[:1000]
+        row_bytes = max(len(repr(row).encode()) for row in sample) + 16
+        rows_per_statement = max(1, int(self.max_allowed_packet * 0.5) // row_bytes)
+        
+        placeholders = f"({', '.join(['%s'] * len(COLUMNS))})"
+        for start in range(0, len(data_tuples), rows_per_statement):
+            rows = data_tuples[start:start + rows_per_statement]
+            insert_query = (f"INSERT INTO weather_data ({', '.join(COLUMNS)}) VALUES "
+                            + ', '.join([placeholders] * len(rows)) + ' ' + UPSERT_CLAUSE)
+            cursor.execute(insert_query, [value for row in rows for value in row])
+    
+    def load_infile(self, cursor, df):
+        """Stream rows to the server as a TSV file with LOAD DATA LOCAL INFILE
+
+        The file goes into a session-private staging table and is upserted
+        from there with the same ON DUPLICATE KEY UPDATE as the other
+        strategies. LOAD DATA ... REPLACE would delete and re-insert existing
+        rows, giving them a new id and recorded_at.
+        """
+        fd, path = tempfile.mkstemp(suffix='.tsv')
+        try:
+            with os.fdopen(fd, 'w', newline='') as f:
+                df[COLUMNS].to_csv(f, sep='\t', header=False, index=False, na_rep='NULL',
+                                   lineterminator='\n', date_format='%Y-%m-%d %H:%M:%S')
+            # Temporary tables neither commit implicitly nor outlive the session,
+            # and pooled sessions are reused, so the table is recreated per load
+            cursor.execute("DROP TEMPORARY TABLE IF EXISTS weather_data_staging")
+            cursor.execute(STAGING_TABLE_SQL)
+            cursor.execute(f"""
+                LOAD DATA LOCAL INFILE %s INTO TABLE weather_data_staging
+                FIELDS TERMINATED BY '\\t' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+                LINES TERMINATED BY '\\n'
+                ({', '.join(COLUMNS)})
+            """, (path,))
+            cursor.execute(f"""
+                INSERT INTO weather_data ({', '.join(COLUMNS)})
+                SELECT {', '.join(COLUMNS)} FROM weather_data_staging
+                {UPSERT_CLAUSE}
+            """)
+            cursor.execute("DROP TEMPORARY TABLE weather_data_staging")
+        finally:
+            os.remove(path)
@@ -0,0 +1,834 @@
+import argparse
+import csv
+import glob
+import json
+import logging
+import os
+import platform
+import re
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+import numpy as np
+import pandas as pd
+from etl_pipeline import WeatherETLPipeline
+from extract import WeatherExtractor, CityIdCache
+from transform import WeatherTransformer
+from load import WeatherLoader, COLUMNS
+from columnar import ParquetSink, ColumnarStore
+from change_detection import ObservationWatermarks
+from write_buffer import WriteBuffer
+from archive import RawArchive, ArchiveReplayer
+from sharding import ShardedRunner
+from metrics import STAGE_SECONDS, ROWS, PEAK_RSS, reset_peak_rss, read_peak_rss
+from synthetic import PayloadGenerator, MockWeatherAPI
+from config import CHUNK_SIZE, PIPELINE_MODE, DB_CONFIG, REPLAY_CHUNK_SIZE, LOCAL_INFILE
+
+class TimedExtractor(WeatherExtractor):
+    """Extractor pointed at the mock API that records every request's latency"""
+    def __init__(self, api, workdir, concurrency):
+        super().__init__(max_concurrency=concurrency, rate_limit=1e9, pool_size=concurrency)
+        self.base_url = api.base_url
+        self.group_url = api.group_url
+        self.id_cache = CityIdCache(os.path.join(workdir, f"city_ids-{concurrency}.json"))
+        self.latencies = []
+
+    def get_json(self, url, params):
+        started = time.monotonic()
+        try:
+            return super().get_json(url, params)
+        finally:
+            with self.lock:
+                self.latencies.append(time.monotonic() - started)
+
+class OfflineLoader(WeatherLoader):
+    """Loader for offline runs; run metrics are kept in-process instead of in MySQL"""
+    def get_connection(self):
+        return None
+
+class BufferedLoader(WeatherLoader):
+    """Offline stand-in for the loader that queues each batch in a local write buffer"""
+    def __init__(self, buffer):
+        super().__init__()
+        self.buffer = buffer
+
+    def load_data(self, df):
+        self.buffer.enqueue(df)
+        return True
+
+def shard_pipeline(settings, cities):
+    """Build a shard worker's pipeline against the mock API; picklable through functools.partial"""
+    pipeline = WeatherETLPipeline(engine=settings['engine'], mode=settings['mode'],
+                                  chunk_size=settings['chunk_size'], cities=cities)
+    workdir = settings['workdir']
+    pipeline.extractor.base_url = settings['base_url']
+    pipeline.extractor.group_url = settings['group_url']
+    pipeline.extractor.id_cache = CityIdCache(os.path.join(workdir, 'city_ids.json'))
+    # Shard workers share the watermark file and write buffer, as they do in production
+    pipeline.watermarks = ObservationWatermarks(os.path.join(workdir, 'watermarks.json'))
+    pipeline.watermarks.warmed = True
+    pipeline.archive = None
+    if not settings['db']:
+        pipeline.loader = OfflineLoader()
+        pipeline.buffer = WriteBuffer(os.path.join(workdir, 'write_buffer.sqlite3'))
+    else:
+        pipeline.buffer = None
+        pipeline.loader.parquet_sink = None
+    return pipeline
+
+class SQLiteCursor:
+    """Runs the load strategies' MySQL statements on SQLite, for load benchmarks without a server
+
+    Only what the strategies send is translated: %s placeholders, ON DUPLICATE
+    KEY UPDATE, the max_allowed_packet lookup, temporary tables, LOAD DATA
+    LOCAL INFILE and FOR UPDATE, which SQLite's single writer makes unnecessary.
+    Other statements, such as the benchmarks' SELECTs, pass through unchanged.
+    """
+    # Keeps multi-row statements under SQLite's 32766 bound parameters
+    MAX_ALLOWED_PACKET = 2**20
+
+    def __init__(self, connection):
+        self.cursor = connection.cursor()
+        self.result = None
+
+    @staticmethod
+    def translate(query):
+        def upsert(match):
+            # SQLite needs a WHERE before an upsert's ON CONFLICT in INSERT ... SELECT
+            where = 'WHERE true ' if re.search(r'\bSELECT\b', query) else ''
+            return (where + 'ON CONFLICT (city, data_timestamp) DO UPDATE SET '
+                    + re.sub(r'VALUES\((\w+)\)', r'excluded.\1', match.group(1)))
+        query = query.replace('%s', '?').replace('DROP TEMPORARY TABLE', 'DROP TABLE')
+        query = re.sub(r'\s+FOR UPDATE\s*$', '', query)
+        return re.sub(r'ON DUPLICATE KEY UPDATE (.*)', upsert, query, flags=re.S)
+
+    def execute(self, query, params=()):
+        if '@@max_allowed_packet' in query:
+            self.result = (self.MAX_ALLOWED_PACKET,)
+        elif 'LOAD DATA LOCAL INFILE' in query:
+            with open(params[0], newline='') as f:
+                rows = [[None if value == 'NULL' else value for value in row]
+                        for row in csv.reader(f, delimiter='\t')]
+            table = re.search(r'INTO TABLE (\w+)', query).group(1)
+            self.cursor.executemany(f"INSERT INTO {table} ({', '.join(COLUMNS)}) "
+                                    f"VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+        else:
+            self.cursor.execute(self.translate(query), params)
+
+    def executemany(self, query, rows):
+        self.cursor.executemany(self.translate(query), rows)
+
+    def fetchone(self):
+        return self.result
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def close(self):
+        self.cursor.close()
+
+def sqlite_weather_data(path):
+    connection = sqlite3.connect(path)
+    connection.execute(f"""
+        CREATE TABLE weather_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            {', '.join(COLUMNS)},
+            UNIQUE (city, data_timestamp)
+        )
+    """)
+    return connection
+
+def summarize(values, scale=1000):
+    """p50/p95/p99/max/mean of values, multiplied by scale (seconds to ms by default)"""
+    if not values:
+        return {}
+    values = np.asarray(values, dtype='float64') * scale
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': round(p50, 3), 'p95': round(p95, 3), 'p99': round(p99, 3),
+            'max': round(values.max(), 3), 'mean': round(values.mean(), 3)}
+
+def registry_snapshot():
+    """Cumulative stage seconds and row counts from the pipeline's metrics registry"""
+    with STAGE_SECONDS.lock:
+        stages = {key[0]: sample['sum'] for key, sample in STAGE_SECONDS.values.items()}
+    with ROWS.lock:
+        rows = {key[0]: count for key, count in ROWS.values.items()}
+    return stages, rows
+
+def benchmark_pipeline(args, generator, api, workdir, concurrency):
+    """Run the pipeline args.runs times against the mock API; returns its report section"""
+    pipeline = WeatherETLPipeline(engine=args.engine, mode=args.mode, chunk_size=args.chunk_size,
+                                  cities=[city['name'] for city in generator.cities])
+    pipeline.extractor = TimedExtractor(api, workdir, concurrency)
+    # Start empty so every served observation is new, whatever is already in MySQL
+    pipeline.watermarks = ObservationWatermarks(os.path.join(workdir, f"watermarks-{concurrency}.json"))
+    pipeline.watermarks.warmed = True
+    pipeline.archive = None
+    pipeline.max_failures = args.runs + 1
+    if not args.db:
+        pipeline.loader = OfflineLoader()
+        pipeline.buffer = WriteBuffer(os.path.join(workdir, f"write_buffer-{concurrency}.sqlite3"))
+    else:
+        pipeline.buffer = None
+        if pipeline.loader.parquet_sink is not None:
+            pipeline.loader.parquet_sink = ParquetSink(os.path.join(workdir, 'sink'))
+
+    stages_before, rows_before = registry_snapshot()
+    walls, peaks, failed = [], [], 0
+    for run in range(args.runs):
+        # Replay the newest hours, which the dashboard seed leaves out
+        api.hour = generator.hours - args.runs + run
+        started = time.monotonic()
+        pipeline.run_pipeline()
+        walls.append(time.monotonic() - started)
+        peaks.append(PEAK_RSS.values.get((), 0))
+        failed += pipeline.failure_count > 0
+    stages_after, rows_after = registry_snapshot()
+
+    seconds = {stage: stages_after.get(stage, 0) - stages_before.get(stage, 0) for stage in stages_after}
+    rows = {point: rows_after.get(point, 0) - rows_before.get(point, 0) for point in rows_after}
+    stage_rows = {'extract': rows.get('extracted', 0), 'transform': rows.get('validate_in', 0),
+                  'validate': rows.get('validate_in', 0), 'load': rows.get('loaded', 0)}
+    return {
+        'concurrency': concurrency,
+        'runs': args.runs,
+        'failed_runs': failed,
+        'run_seconds': summarize(walls, scale=1),
+        'rows_per_second': round(rows.get('loaded', 0) / sum(walls), 1) if sum(walls) else 0,
+        'stages': {stage: {'seconds': round(seconds.get(stage, 0), 4),
+                           'rows_per_second': round(count / seconds[stage], 1) if seconds.get(stage) else 0}
+                   for stage, count in stage_rows.items()},
+        'rows': rows,
+        'fetch_latency_ms': summarize(pipeline.extractor.latencies),
+        'http': pipeline.extractor.get_stats(),
+        'peak_rss_mb': round(max(peaks) / 2**20, 1),
+    }
+
+def seed_history(args, generator, workdir):
+    """Load all but the newest args.runs hours, as the dashboard's history; returns its report section"""
+    transformer = WeatherTransformer()
+    sink = None if args.db else ParquetSink(os.path.join(workdir, 'parquet'))
+    loader = WeatherLoader() if args.db else None
+    hours = max(0, generator.hours - args.runs)
+
+    started = time.monotonic()
+    rows = 0
+    frames = []
+    for hour in range(hours):
+        frames.append(transformer.transform_weather_data_columnar(generator.hour(hour)))
+        # A day at a time keeps one Parquet file per city and day, like a compacted sink
+        if len(frames) == 24 or hour == hours - 1:
+            df = pd.concat(frames, ignore_index=True)
+            frames = []
+            if sink is not None:
+                sink.write_batch(df)
+            elif not loader.load_data(df):
+                raise SystemExit("Seeding MySQL failed; check the DB_* settings or run without --db")
+            rows += len(df)
+    elapsed = time.monotonic() - started
+    return {'hours': hours, 'rows': rows, 'seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed, 1) if elapsed else 0}
+
+def benchmark_dashboard(args, workdir):
+    """Time the dashboard's queries with caches cleared; returns its report section"""
+    # Imported here so pipeline-only runs don't start Streamlit
+    import streamlit as st
+    from dashboard import WeatherDashboard, ANALYTICS_QUERIES
+
+    dashboard = WeatherDashboard()
+    queries = {
+        'trend': lambda: dashboard.get_temperature_trend(args.dashboard_days),
+        'recent': lambda: dashboard.get_historical_data(args.dashboard_days, 50),
+        'total_records': lambda: dashboard.get_record_count(args.dashboard_days),
+    }
+    for key in ANALYTICS_QUERIES:
+        queries[key] = lambda key=key: dashboard.get_analytics_item(key)
+    if not args.db:
+        # The Parquet seed stands in for MySQL; weather_latest only exists in MySQL
+        dashboard.columnar = ColumnarStore(os.path.join(workdir, 'parquet'))
+        dashboard.read_watermark = lambda: None
+    else:
+        queries['latest'] = dashboard.get_latest_data
+
+    reset_peak_rss()
+    timings = {name: [] for name in queries}
+    result_rows = {}
+    pages = []
+    for _ in range(args.dashboard_iterations):
+        st.cache_data.clear()
+        for name, query in queries.items():
+            started = time.monotonic()
+            result = query()
+            timings[name].append(time.monotonic() - started)
+            result_rows[name] = result if isinstance(result, int) else len(result)
+
+        # The whole page, with its queries running concurrently as in main()
+        st.cache_data.clear()
+        started = time.monotonic()
+        futures = [dashboard.submit(query) for query in queries.values()]
+        for future in futures:
+            future.result()
+        pages.append(time.monotonic() - started)
+
+    if dashboard.deferred_errors:
+        logging.warning(f"Dashboard queries reported errors: {sorted(set(dashboard.deferred_errors))}")
+    return {
+        'backend': 'duckdb' if dashboard.columnar is not None else 'mysql',
+        'iterations': args.dashboard_iterations,
+        'query_ms': {name: summarize(values) for name, values in timings.items()},
+        'result_rows': result_rows,
+        'page_ms': summarize(pages),
+        'errors': len(dashboard.deferred_errors),
+        'peak_rss_mb': round(read_peak_rss() / 2**20, 1),
+    }
+
+def item_key(item):
+    """What a sweep point in a report list is identified by"""
+    for name in ('concurrency', 'workers', 'cities', 'strategy', 'days', 'chunk_size'):
+        if name in item:
+            return item[name]
+    return None
+
+def flatten(report, prefix=''):
+    values = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    values.update(flatten(item, f"{prefix}{key}[{item_key(item)}]."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[f"{prefix}{key}"] = value
+    return values
+
+def compare(report, baseline, tolerance):
+    """Log every metric that moved by more than tolerance (a fraction) from the baseline"""
+    # Settings and environment are inputs, not results
+    old, new = (flatten({key: value for key, value in r.items() if key not in ('settings', 'environment')})
+                for r in (baseline, report))
+    changed = 0
+    for key in sorted(old.keys() & new.keys()):
+        if old[key] and abs(new[key] - old[key]) / abs(old[key]) > tolerance:
+            changed += 1
+            logging.warning(f"{key}: {old[key]} -> {new[key]} ({(new[key] - old[key]) / abs(old[key]):+.0%})")
+    logging.warning(f"{changed} metrics moved more than {tolerance:.0%} from the baseline")
+
+def parse_levels(value):
+    return [int(level) for level in value.split(',')]
+
+def run_pipeline_command(args, report):
+    if args.runs >= args.hours:
+        raise SystemExit("--hours must be larger than --runs")
+    generator = PayloadGenerator(args.cities, args.hours, seed=args.seed)
+    api = MockWeatherAPI(generator, args.latency, args.jitter, args.error_rate, args.seed).start()
+    with tempfile.TemporaryDirectory(prefix='weather-loadtest-') as workdir:
+        try:
+            report['pipeline'] = [benchmark_pipeline(args, generator, api, workdir, concurrency)
+                                  for concurrency in args.concurrency]
+        finally:
+            api.stop()
+        if not args.skip_dashboard:
+            report['seed'] = seed_history(args, generator, workdir)
+            report['dashboard'] = benchmark_dashboard(args, workdir)
+
+def benchmark_replay(args, generator, archive, workdir, chunk_size):
+    """Replay the whole archive in chunks of chunk_size; returns its report section"""
+    replayer = ArchiveReplayer(archive, chunk_size)
+    if not args.db:
+        replayer.loader = BufferedLoader(WriteBuffer(os.path.join(workdir, f"write_buffer-{chunk_size}.sqlite3")))
+    start = datetime.fromtimestamp(generator.start - 3600)
+    end = datetime.fromtimestamp(generator.end + 3600)
+
+    reset_peak_rss()
+    started = time.monotonic()
+    read, loaded, failed = replayer.replay(start, end)
+    elapsed = time.monotonic() - started
+    return {
+        'chunk_size': chunk_size,
+        'strategy': replayer.loader.choose_strategy(chunk_size),
+        'records': read,
+        'rows_loaded': loaded,
+        'failed_chunks': failed,
+        'seconds': round(elapsed, 3),
+        'records_per_second': round(read / elapsed, 1) if elapsed else 0,
+        'peak_rss_mb': round(read_peak_rss() / 2**20, 1),
+    }
+
+def run_replay_command(args, report):
+    generator = PayloadGenerator(args.cities, args.hours, seed=args.seed)
+    with tempfile.TemporaryDirectory(prefix='weather-loadtest-') as workdir:
+        archive = RawArchive(os.path.join(workdir, 'archive'))
+        elapsed = 0
+        for payloads in generator:
+            started = time.monotonic()
+            archive.append(payloads)
+            elapsed += time.monotonic() - started
+        records = args.cities * args.hours
+        report['archive'] = {'records': records, 'seconds': round(elapsed, 3),
+                             'records_per_second': round(records / elapsed, 1) if elapsed else 0}
+        report['replay'] = [benchmark_replay(args, generator, archive, workdir, chunk_size)
+                            for chunk_size in args.chunk_size]
+
+def benchmark_shards(args, generator, api, workers):
+    """Run the sharded runner args.runs times with the given worker count; returns its report section"""
+    with tempfile.TemporaryDirectory(prefix='weather-loadtest-') as workdir:
+        settings = {'engine': args.engine, 'mode': args.mode, 'chunk_size': args.chunk_size,
+                    'workdir': workdir, 'base_url': api.base_url, 'group_url': api.group_url, 'db': args.db}
+        # The mock API has no quota, so rate limiting is effectively off
+        runner = ShardedRunner(partial(shard_pipeline, settings), workers=workers,
+                               cities=[city['name'] for city in generator.cities], rate_limit=1e9)
+        walls, shard_seconds, slow, failed = [], [], 0, 0
+        try:
+            for run in range(args.runs):
+                api.hour = generator.hours - args.runs + run
+                started = time.monotonic()
+                results = runner.run_pipeline()
+                walls.append(time.monotonic() - started)
+                shard_seconds += [result['duration'] for result in results if result['duration'] is not None]
+                slow += sum(result['slow'] for result in results)
+                failed += sum(result['failed'] for result in results)
+        finally:
+            runner.close()
+    return {
+        'workers': workers,
+        'runs': args.runs,
+        'run_seconds': summarize(walls, scale=1),
+        'cities_per_second': round(len(generator.cities) * args.runs / sum(walls), 1) if sum(walls) else 0,
+        'shard_seconds': summarize(shard_seconds, scale=1),
+        'slow_shards': slow,
+        'failed_shards': failed,
+    }
+
+def run_shards_command(args, report):
+    if args.runs > args.hours:
+        raise SystemExit("--hours must be at least --runs")
+    generator = PayloadGenerator(args.cities, args.hours, seed=args.seed)
+    api = MockWeatherAPI(generator, args.latency, args.jitter, args.error_rate, args.seed).start()
+    try:
+        report['shards'] = [benchmark_shards(args, generator, api, workers) for workers in args.workers]
+    finally:
+        api.stop()
+
+def benchmark_load(args, df, workdir, strategy):
+    """Insert df with one load strategy, then upsert it again; returns its report section"""
+    loader = WeatherLoader(strategy)
+    if args.db:
+        connection = loader.get_connection()
+        if connection is None:
+            raise SystemExit("Could not connect to MySQL; check the DB_* settings or run without --db")
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM weather_data WHERE city LIKE 'Synthetic City %'")
+        connection.commit()
+    else:
+        connection = sqlite_weather_data(os.path.join(workdir, f"{strategy}.sqlite3"))
+        cursor = SQLiteCursor(connection)
+
+    section = {'strategy': strategy, 'rows': len(df)}
+    try:
+        for phase in ('insert', 'upsert'):
+            started = time.monotonic()
+            for start in range(0, len(df), args.batch_rows):
+                getattr(loader, f"load_{strategy}")(cursor, df.iloc[start:start + args.batch_rows])
+                connection.commit()
+            elapsed = time.monotonic() - started
+            section[f"{phase}_seconds"] = round(elapsed, 3)
+            section[f"{phase}_rows_per_second"] = round(len(df) / elapsed, 1) if elapsed else 0
+        if args.db:
+            cursor.execute("DELETE FROM weather_data WHERE city LIKE 'Synthetic City %'")
+            connection.commit()
+    finally:
+        cursor.close()
+        connection.close()
+    return section
+
+def run_load_command(args, report):
+    generator = PayloadGenerator(args.cities, -(-args.rows // args.cities), seed=args.seed)
+    df = generator.frame().iloc[:args.rows]
+    strategies = args.strategy
+    if args.db and not LOCAL_INFILE and 'infile' in strategies:
+        logging.warning("Skipping infile: LOCAL_INFILE is off")
+        strategies = [strategy for strategy in strategies if strategy != 'infile']
+    report['backend'] = 'mysql' if args.db else 'sqlite'
+    with tempfile.TemporaryDirectory(prefix='weather-loadtest-') as workdir:
+        report['load'] = [benchmark_load(args, df, workdir, strategy) for strategy in strategies]
+
+def seed_columnar(args, generator, workdir):
+    """Write the generator's frames to Parquet, one file per day as after compaction, and to MySQL with --db"""
+    sink = ParquetSink(os.path.join(workdir, 'parquet'))
+    loader = WeatherLoader() if args.db else None
+    started = time.monotonic()
+    rows = 0
+    pending = None
+    for df in generator.frames(len(generator.cities) * 24):
+        if loader is not None and not loader.load_data(df):
+            raise SystemExit("Seeding MySQL failed; check the DB_* settings or run without --db")
+        rows += len(df)
+        # Frames straddle midnight; a date is written once its last frame has arrived
+        pending = df if pending is None else pd.concat([pending, df], ignore_index=True)
+        dates = pending['data_timestamp'].dt.date
+        complete = dates < dates.max()
+        if complete.any():
+            sink.write_batch(pending[complete])
+        pending = pending[~complete]
+    if pending is not None and len(pending):
+        sink.write_batch(pending)
+    elapsed = time.monotonic() - started
+    return {'rows': rows, 'seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed, 1) if elapsed else 0}
+
+def benchmark_columnar(args, workdir, backend, days):
+    """Time the dashboard's history scans over days on one backend, caches cleared; returns its report section"""
+    import streamlit as st
+    from dashboard import WeatherDashboard
+
+    dashboard = WeatherDashboard()
+    if backend == 'duckdb':
+        dashboard.columnar = ColumnarStore(os.path.join(workdir, 'parquet'))
+        dashboard.read_watermark = lambda: None
+    else:
+        dashboard.columnar = None
+    queries = {
+        'historical': lambda: dashboard.get_historical_data(days),
+        'total_records': lambda: dashboard.get_record_count(days),
+        'trend': lambda: dashboard.get_temperature_trend(days),
+    }
+    timings = {name: [] for name in queries}
+    result_rows = {}
+    for _ in range(args.iterations):
+        st.cache_data.clear()
+        for name, query in queries.items():
+            started = time.monotonic()
+            result = query()
+            timings[name].append(time.monotonic() - started)
+            result_rows[name] = result if isinstance(result, int) else len(result)
+    if dashboard.deferred_errors:
+        logging.warning(f"{backend} queries reported errors: {sorted(set(dashboard.deferred_errors))}")
+    return {'days': days, 'query_ms': {name: summarize(values) for name, values in timings.items()},
+            'result_rows': result_rows, 'errors': len(dashboard.deferred_errors)}
+
+def run_columnar_command(args, report):
+    if args.db:
+        connection = WeatherLoader().get_connection()
+        if connection is None:
+            raise SystemExit("Could not connect to MySQL; check the DB_* settings or run without --db")
+        connection.close()
+    hours = -(-args.rows // args.cities)
+    if hours < max(args.days) * 24:
+        logging.warning(f"{args.rows} rows over {args.cities} cities cover only {hours} hours")
+    generator = PayloadGenerator(args.cities, hours, seed=args.seed)
+    backends = ['duckdb', 'mysql'] if args.db else ['duckdb']
+    with tempfile.TemporaryDirectory(prefix='weather-loadtest-') as workdir:
+        report['seed'] = seed_columnar(args, generator, workdir)
+        report['parquet_files'] = len(glob.glob(os.path.join(workdir, 'parquet', 'date=*', '*.parquet')))
+        for backend in backends:
+            report[backend] = [benchmark_columnar(args, workdir, backend, days) for days in args.days]
+
+# Current conditions as get_latest_data reads them, and the correlated
+# subquery it replaced, to show what weather_latest saves as history grows
+LATEST_QUERIES = {
+    'weather_latest': """
+        SELECT city, country, temperature, feels_like, humidity,
+               pressure, weather_main, weather_description, wind_speed,
+               wind_direction, visibility, data_timestamp
+        FROM weather_latest
+        ORDER BY city
+    """,
+    'correlated_subquery': """
+        SELECT DISTINCT city, country, temperature, feels_like, humidity,
+               pressure, weather_main, weather_description, wind_speed,
+               wind_direction, visibility, data_timestamp
+        FROM weather_data w1
+        WHERE data_timestamp = (
+            SELECT MAX(data_timestamp)
+            FROM weather_data w2
+            WHERE w2.city = w1.city
+        )
+        ORDER BY city
+    """,
+}
+
+def sqlite_weather_latest(connection):
+    """Build weather_latest from the stand-in's history, as migration 3 backfills it"""
+    connection.execute(f"CREATE TABLE weather_latest ({', '.join(COLUMNS)}, PRIMARY KEY (city))")
+    connection.execute(f"""
+        INSERT INTO weather_latest
+        SELECT {', '.join('w.' + col for col in COLUMNS)}
+        FROM weather_data w
+        JOIN (SELECT city, MAX(data_timestamp) AS data_timestamp
+              FROM weather_data GROUP BY city) newest
+          ON w.city = newest.city AND w.data_timestamp = newest.data_timestamp
+    """)
+    connection.commit()
+
+def run_latest_command(args, report):
+    generator = PayloadGenerator(args.cities, -(-args.rows // args.cities), seed=args.seed)
+    loader = WeatherLoader('multirow')
+    report['backend'] = 'mysql' if args.db else 'sqlite'
+    with tempfile.TemporaryDirectory(prefix='weather-loadtest-') as workdir:
+        if args.db:
+            loader.parquet_sink = None
+            connection = loader.get_connection()
+            if connection is None:
+                raise SystemExit("Could not connect to MySQL; check the DB_* settings or run without --db")
+            cursor = connection.cursor()
+        else:
+            connection = sqlite_weather_data(os.path.join(workdir, 'latest.sqlite3'))
+            cursor = SQLiteCursor(connection)
+
+        # The loader keeps weather_latest current on MySQL; the stand-in builds it once at the end
+        started = time.monotonic()
+        rows = 0
+        for df in generator.frames(len(generator.cities) * 24):
+            if args.db:
+                if not loader.load_data(df):
+                    raise SystemExit("Seeding MySQL failed; check the DB_* settings or run without --db")
+            else:
+                loader.load_multirow(cursor, df)
+                connection.commit()
+            rows += len(df)
+        if not args.db:
+            sqlite_weather_latest(connection)
+        elapsed = time.monotonic() - started
+        report['seed'] = {'rows': rows, 'seconds': round(elapsed, 3),
+                          'rows_per_second': round(rows / elapsed, 1) if elapsed else 0}
+
+        timings = {name: [] for name in LATEST_QUERIES}
+        result_rows = {}
+        try:
+            for _ in range(args.iterations):
+                for name, query in LATEST_QUERIES.items():
+                    started = time.monotonic()
+                    cursor.execute(query)
+                    result_rows[name] = len(cursor.fetchall())
+                    timings[name].append(time.monotonic() - started)
+        finally:
+            cursor.close()
+            connection.close()
+        report['query_ms'] = {name: summarize(values) for name, values in timings.items()}
+        report['result_rows'] = result_rows
+
+def memory_run(settings, cities):
+    """One pipeline run in a fresh worker process; returns its peak RSS before and after the run"""
+    pipeline = shard_pipeline(settings, cities)
+    pipeline.extractor.rate_limit = 1e9
+    # The process has imported everything by now, so this is the floor under the run
+    baseline = read_peak_rss()
+    pipeline.run_pipeline()
+    return {'baseline': baseline, 'peak': read_peak_rss(), 'failed': pipeline.failure_count > 0}
+
+def benchmark_memory(args, cities):
+    """Run the pipeline once over cities synthetic cities in its own process; returns its report section"""
+    generator = PayloadGenerator(cities, 1, seed=args.seed)
+    api = MockWeatherAPI(generator, args.latency, args.jitter, args.error_rate, args.seed).start()
+    try:
+        with tempfile.TemporaryDirectory(prefix='weather-loadtest-') as workdir:
+            settings = {'engine': args.engine, 'mode': args.mode, 'chunk_size': args.chunk_size,
+                        'workdir': workdir, 'base_url': api.base_url, 'group_url': api.group_url, 'db': args.db}
+            # The mock API and its payloads stay in this process, out of the measured one
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                started = time.monotonic()
+                result = executor.submit(memory_run, settings, [city['name'] for city in generator.cities]).result()
+                elapsed = time.monotonic() - started
+    finally:
+        api.stop()
+    return {'cities': cities, 'mode': args.mode, 'seconds': round(elapsed, 3), 'failed': result['failed'],
+            'baseline_rss_mb': round(result['baseline'] / 2**20, 1),
+            'peak_rss_mb': round(result['peak'] / 2**20, 1),
+            'run_rss_mb': round((result['peak'] - result['baseline']) / 2**20, 1)}
+
+def run_memory_command(args, report):
+    report['memory'] = [benchmark_memory(args, cities) for cities in args.cities]
+
+class ParquetLatestStore(ColumnarStore):
+    """ColumnarStore that also answers the current-conditions query, which only MySQL serves in production"""
+    def latest(self):
+        since = datetime.now() - timedelta(days=2)
+        return self.query(f"""
+            SELECT DISTINCT ON (city) *
+            FROM ({self.recent(since, COLUMNS)})
+            ORDER BY city, data_timestamp DESC
+        """, [])
+
+def offline_dashboard(dashboard, parquet_root):
+    """Point the dashboard module at a Parquet copy of the data instead of MySQL"""
+    class OfflineDashboard(dashboard.WeatherDashboard):
+        def __init__(self):
+            super().__init__()
+            self.columnar = ParquetLatestStore(parquet_root)
+
+        def read_watermark(self):
+            return None
+
+        def get_latest_data(self):
+            return self.fetch_columnar('latest')
+
+    dashboard.WeatherDashboard = OfflineDashboard
+
+def dashboard_app(parquet_root):
+    """Streamlit script for the headless dashboard benchmark; AppTest runs it from its source"""
+    import dashboard
+    from loadtest import offline_dashboard
+    if parquet_root is not None:
+        offline_dashboard(dashboard, parquet_root)
+    dashboard.main()
+
+def run_dashboard_command(args, report):
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    hours = -(-args.rows // args.cities)
+    generator = PayloadGenerator(args.cities, hours, seed=args.seed)
+    with tempfile.TemporaryDirectory(prefix='weather-loadtest-') as workdir:
+        report['seed'] = seed_columnar(args, generator, workdir)
+        report['backend'] = 'mysql' if args.db else 'duckdb'
+        parquet_root = None if args.db else os.path.join(workdir, 'parquet')
+
+        timings = {'first_section': [], 'total': [], 'script': []}
+        errors = 0
+        for _ in range(args.iterations):
+            # Cold caches every time, as for the first viewer after a load
+            st.cache_data.clear()
+            app = AppTest.from_function(dashboard_app, args=(parquet_root,), default_timeout=args.timeout)
+            started = time.monotonic()
+            app.run()
+            timings['script'].append(time.monotonic() - started)
+            errors += len(app.error) + len(app.exception)
+            if 'load_timings' not in app.session_state:
+                raise SystemExit(f"The dashboard stopped before loading: {[e.value for e in app.error]}")
+            load_timings = app.session_state['load_timings']
+            timings['first_section'].append(load_timings['first_section'])
+            timings['total'].append(load_timings['total'])
+    report['dashboard'] = {'iterations': args.iterations, 'errors': errors,
+                           **{f"{name}_ms": summarize(values) for name, values in timings.items()}}
+
+COMMANDS = {
+    'pipeline': run_pipeline_command,
+    'load': run_load_command,
+    'replay': run_replay_command,
+    'shards': run_shards_command,
+    'columnar': run_columnar_command,
+    'latest': run_latest_command,
+    'memory': run_memory_command,
+    'dashboard': run_dashboard_command,
+}
+
+def add_mock_api_arguments(parser):
+    parser.add_argument('--cities', type=int, default=1000, help="synthetic cities")
+    parser.add_argument('--hours', type=int, default=168, help="hours of observations to generate")
+    parser.add_argument('--runs', type=int, default=3, help="pipeline runs per sweep point")
+    parser.add_argument('--engine', choices=['sync', 'async', 'group'], default='async',
+                        help="extract engine; only async uses the concurrency levels")
+    parser.add_argument('--mode', choices=['batch', 'streaming'], default=PIPELINE_MODE)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--latency', type=float, default=0.05, help="mean mock API latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.02, help="standard deviation of the latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of API requests that fail")
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--db', action='store_true',
+                        help="use the DB_* MySQL database (a scratch one; it gets synthetic rows). "
+                             "Without it nothing touches MySQL: loads go to a local write buffer and "
+                             "dashboard queries read a local Parquet copy")
+    common.add_argument('--seed', type=int, default=0)
+    common.add_argument('--output', default='loadtest_report.json', help="where to write the JSON report")
+    common.add_argument('--baseline', help="earlier report to compare against")
+    common.add_argument('--tolerance', type=float, default=0.1, help="change to flag when comparing, as a fraction")
+    common.add_argument('--verbose', action='store_true', help="keep the pipeline's INFO logging")
+
+    parser = argparse.ArgumentParser(description="Load-test the ETL pipeline and dashboard on synthetic data")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    pipeline = commands.add_parser('pipeline', parents=[common],
+                                   help="pipeline runs across request concurrency levels, then dashboard queries")
+    add_mock_api_arguments(pipeline)
+    pipeline.add_argument('--concurrency', type=parse_levels, default=[1, 8, 32],
+                          help="comma-separated request concurrency levels to sweep (async engine)")
+    pipeline.add_argument('--skip-dashboard', action='store_true')
+    pipeline.add_argument('--dashboard-days', type=int, default=7)
+    pipeline.add_argument('--dashboard-iterations', type=int, default=5)
+
+    shards = commands.add_parser('shards', parents=[common],
+                                 help="sharded pipeline runs across worker process counts")
+    add_mock_api_arguments(shards)
+    shards.add_argument('--workers', type=parse_levels, default=[1, 2, 4, 8],
+                        help="comma-separated shard worker counts to sweep")
+
+    load = commands.add_parser('load', parents=[common],
+                               help="rows/sec of each load strategy (SQLite stand-in unless --db)")
+    load.add_argument('--rows', type=int, default=200000, help="synthetic rows to load")
+    load.add_argument('--cities', type=int, default=1000, help="synthetic cities the rows are spread over")
+    load.add_argument('--batch-rows', type=int, default=50000, help="rows per load call")
+    load.add_argument('--strategy', type=lambda value: value.split(','), default=['executemany', 'multirow', 'infile'],
+                      help="comma-separated strategies to compare")
+
+    replay = commands.add_parser('replay', parents=[common],
+                                 help="archive synthetic payloads, then replay them at several chunk sizes")
+    replay.add_argument('--cities', type=int, default=1000, help="synthetic cities")
+    replay.add_argument('--hours', type=int, default=100, help="hours of observations to archive")
+    replay.add_argument('--chunk-size', type=parse_levels, default=[CHUNK_SIZE, REPLAY_CHUNK_SIZE],
+                        help="comma-separated replay chunk sizes to sweep")
+
+    columnar = commands.add_parser('columnar', parents=[common],
+                                   help="history scans on DuckDB over Parquet, and on MySQL with --db")
+    columnar.add_argument('--rows', type=int, default=10_000_000, help="synthetic rows of history to seed")
+    columnar.add_argument('--cities', type=int, default=1000, help="synthetic cities the rows are spread over")
+    columnar.add_argument('--days', type=parse_levels, default=[7, 30], help="comma-separated query windows in days")
+    columnar.add_argument('--iterations', type=int, default=3)
+
+    latest = commands.add_parser('latest', parents=[common],
+                                 help="current conditions from weather_latest vs the correlated subquery")
+    latest.add_argument('--rows', type=int, default=10_000_000, help="synthetic rows of history to seed")
+    latest.add_argument('--cities', type=int, default=1000, help="synthetic cities the rows are spread over")
+    latest.add_argument('--iterations', type=int, default=3)
+
+    memory = commands.add_parser('memory', parents=[common],
+                                 help="peak RSS of one pipeline run across city counts, each in a fresh process")
+    memory.add_argument('--cities', type=parse_levels, default=[1000, 4000, 16000],
+                        help="comma-separated synthetic city counts to sweep")
+    memory.add_argument('--engine', choices=['sync', 'async', 'group'], default='group')
+    memory.add_argument('--mode', choices=['batch', 'streaming'], default='streaming')
+    memory.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    memory.add_argument('--latency', type=float, default=0.01, help="mean mock API latency in seconds")
+    memory.add_argument('--jitter', type=float, default=0.0, help="standard deviation of the latency")
+    memory.add_argument('--error-rate', type=float, default=0.0, help="fraction of API requests that fail")
+
+    dashboard = commands.add_parser('dashboard', parents=[common],
+                                    help="time to first section and full page load of the dashboard, run headless")
+    dashboard.add_argument('--rows', type=int, default=1_000_000, help="synthetic rows of history to seed")
+    dashboard.add_argument('--cities', type=int, default=1000, help="synthetic cities the rows are spread over")
+    dashboard.add_argument('--iterations', type=int, default=5)
+    dashboard.add_argument('--timeout', type=float, default=120, help="seconds to allow one page load")
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    if args.db:
+        logging.warning(f"Writing synthetic data to MySQL database {DB_CONFIG['database']} "
+                        f"on {DB_CONFIG['host']}")
+
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'command': args.command,
+        'settings': vars(args),
+        'environment': {'python': platform.python_version(), 'pandas': pd.__version__,
+                        'platform': platform.platform(), 'cpus': os.cpu_count()},
+    }
+    COMMANDS[args.command](args, report)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f), args.tolerance)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+import copy
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import mysql.connector
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Metric:
+    """Base for a labelled metric family rendered in the Prometheus text format"""
+    type_name = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}")
+        return tuple(str(value) for value in labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.extend(self.render_sample(key, value))
+        return lines
+
+    def render_sample(self, key, value):
+        return [f"{self.name}{format_labels(self.labels, key)} {value}"]
+
+    def snapshot(self):
+        with self.lock:
+            return copy.deepcopy(self.values)
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, *labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def changes(self, before):
+        """How much each series grew since the snapshot before"""
+        return {key: value - before.get(key, 0) for key, value in self.snapshot().items()
+                if value != before.get(key, 0)}
+
+    def merge(self, changes):
+        with self.lock:
+            for key, amount in changes.items():
+                self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def set(self, value, *labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def changes(self, before):
+        """Series set to a new value since the snapshot before"""
+        return {key: value for key, value in self.snapshot().items() if before.get(key) != value}
+
+    def merge(self, changes):
+        # A gauge is a current value, so the latest report wins
+        with self.lock:
+            self.values.update(changes)
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        key = self.key(labels)
+        with self.lock:
+            sample = self.values.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample['buckets'][i] += 1
+            sample['sum'] += value
+            sample['count'] += 1
+
+    def changes(self, before):
+        """Observations added to each series since the snapshot before"""
+        changes = {}
+        for key, sample in self.snapshot().items():
+            old = before.get(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            if sample['count'] != old['count']:
+                changes[key] = {'buckets': [new - prior for new, prior in zip(sample['buckets'], old['buckets'])],
+                                'sum': sample['sum'] - old['sum'], 'count': sample['count'] - old['count']}
+        return changes
+
+    def merge(self, changes):
+        with self.lock:
+            for key, change in changes.items():
+                sample = self.values.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+                sample['buckets'] = [count + added for count, added in zip(sample['buckets'], change['buckets'])]
+                sample['sum'] += change['sum']
+                sample['count'] += change['count']
+
+    def render_sample(self, key, sample):
+        lines = [f"{self.name}_bucket{format_labels(self.labels, key, [('le', bound)])} {count}"
+                 for bound, count in zip(self.buckets, sample['buckets'])]
+        lines.append(f"{self.name}_bucket{format_labels(self.labels, key, [('le', '+Inf')])} {sample['count']}")
+        lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {sample['sum']}")
+        lines.append(f"{self.name}_count{format_labels(self.labels, key)} {sample['count']}")
+        return lines
+
+class Registry:
+    """Process-wide collection of metrics served on /metrics"""
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def changes_since(self, snapshot):
+        """What was recorded since snapshot, in a picklable form that merge() applies elsewhere
+
+        Shard workers are separate processes with their own registry, so they
+        send their run's changes back for the coordinator to merge into its own.
+        """
+        changes = {metric.name: metric.changes(snapshot.get(metric.name, {})) for metric in self.metrics}
+        return {name: values for name, values in changes.items() if values}
+
+    def merge(self, changes):
+        metrics = {metric.name: metric for metric in self.metrics}
+        for name, values in changes.items():
+            if name in metrics:
+                metrics[name].merge(values)
+
+REGISTRY = Registry()
+
+# How often a run samples resident memory for its peak
+RSS_SAMPLE_SECONDS = 0.1
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'weather_etl_stage_seconds', 'Time spent in each pipeline stage per run', ['stage'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)))
+FETCH_SECONDS = REGISTRY.register(Histogram(
+    'weather_etl_fetch_seconds', 'OpenWeatherMap request latency including retries', ['city']))
+ROWS = REGISTRY.register(Counter(
+    'weather_etl_rows_total', 'Rows seen at each point of the pipeline', ['point']))
+RUNS = REGISTRY.register(Counter(
+    'weather_etl_runs_total', 'Pipeline runs by outcome', ['status']))
+LAST_RUN_SECONDS = REGISTRY.register(Gauge(
+    'weather_etl_last_run_seconds', 'Wall-clock duration of the last run'))
+PEAK_RSS = REGISTRY.register(Gauge(
+    'weather_etl_peak_rss_bytes', 'Highest resident memory of the process sampled during the last run'))
+BUFFER_PENDING = REGISTRY.register(Gauge(
+    'weather_etl_buffer_pending_batches', 'Batches in the local write buffer waiting for MySQL'))
+DRAIN_FAILURES = REGISTRY.register(Counter(
+    'weather_etl_buffer_drain_failures_total',
+    'Failed bulk loads from the write buffer, by reason (connection or rejected)', ['reason']))
+DEAD_BATCHES = REGISTRY.register(Counter(
+    'weather_etl_buffer_dead_batches_total', 'Buffered batches moved to dead_batches after repeated failures'))
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS counter for the whole process (Linux only)
+
+    Only for single-purpose processes such as the load test; pipeline runs
+    use RssSampler so they never clear each other's peak.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def read_peak_rss():
+    """Peak resident memory in bytes, since the last reset where supported"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return 0
+    # ru_maxrss is the lifetime peak, in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def read_rss():
+    """Current resident memory in bytes, or the lifetime peak where /proc is unavailable"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return read_peak_rss()
+
+class RssSampler:
+    """Highest resident memory seen while it runs, sampled from a background thread
+
+    The kernel's high-water mark can only be reset for the whole process, which
+    would wipe the peak of any run overlapping this one (staggered batches, the
+    write-buffer drainer), so each run samples instead. Spikes shorter than the
+    interval can be missed.
+    """
+    def __init__(self, interval=RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.peak = read_rss()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, name='rss-sampler', daemon=True)
+        self.thread.start()
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, read_rss())
+
+    def stop(self):
+        """Stop sampling and return the peak in bytes"""
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, read_rss())
+        return self.peak
+
+class RunMetrics:
+    """Timings and row counts for one pipeline run, published to REGISTRY and run_metrics"""
+    STAGES = ('extract', 'transform', 'validate', 'load')
+
+    def __init__(self, cities):
+        self.cities = cities
+        self.started_at = datetime.now()
+        self.started = time.monotonic()
+        self.stage_seconds = dict.fromkeys(self.STAGES, 0.0)
+        self.rows = {'extracted': 0, 'skipped': 0, 'validate_in': 0, 'validate_out': 0, 'loaded': 0}
+        self.memory = RssSampler()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stage_seconds[name] += time.monotonic() - started
+
+    def add_rows(self, point, count):
+        self.rows[point] += count
+
+    def finish(self, status, connection=None):
+        """Publish the run to the registry and, given a connection, to the run_metrics table"""
+        duration = time.monotonic() - self.started
+        peak_rss = self.memory.stop()
+        for name, seconds in self.stage_seconds.items():
+            STAGE_SECONDS.observe(seconds, name)
+        for point, count in self.rows.items():
+            ROWS.inc(count, point)
+        RUNS.inc(1, status)
+        LAST_RUN_SECONDS.set(duration)
+        PEAK_RSS.set(peak_rss)
+
+        rate = self.rows['loaded'] / duration if duration else 0
+        logging.info(f"Run metrics: {duration:.2f}s, stages "
+                     f"{ {name: round(seconds, 3) for name, seconds in self.stage_seconds.items()} }, "
+                     f"rows {self.rows}, {rate:.1f} rows/s, peak RSS {peak_rss / 2**20:.1f} MiB")
+
+        if connection is None:
+            return
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""
+                INSERT INTO etl_run_metrics
+                    (started_at, duration_seconds, status, cities, extract_seconds, transform_seconds,
+                     validate_seconds, load_seconds, rows_extracted, rows_skipped, rows_validate_in,
+                     rows_validate_out, rows_loaded, peak_rss_bytes)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (self.started_at, duration, status, self.cities,
+                  *(self.stage_seconds[name] for name in self.STAGES),
+                  self.rows['extracted'], self.rows['skipped'], self.rows['validate_in'],
+                  self.rows['validate_out'], self.rows['loaded'], peak_rss))
+            connection.commit()
+            cursor.close()
+        except mysql.connector.Error as e:
+            logging.error(f"Could not record run metrics: {e}")
+        finally:
+            connection.close()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port, host=''):
+    """Serve REGISTRY on http://host:port/metrics from a daemon thread"""
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logging.error(f"Could not start metrics endpoint on port {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Serving metrics on port {port}")
+    return server
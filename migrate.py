@@ -0,0 +1,322 @@
+import argparse
+import logging
+from datetime import date, timedelta
+import mysql.connector
+from db import get_pool
+from rollups import ROLLUP_TABLES_SQL, refresh_rollups
+from config import PARTITION_MONTHS_AHEAD, RETENTION_MONTHS, CITIES
+
+def index_exists(cursor, table, index):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index))
+    return cursor.fetchone()[0] > 0
+
+def add_unique_city_timestamp(cursor):
+    """Unique (city, data_timestamp) key; also serves city + time range lookups"""
+    if index_exists(cursor, 'weather_data', 'uq_city_timestamp'):
+        return
+    # Without an index on the pair, finding duplicates compares every row with
+    # every other row of its city; a plain index makes it one sorted pass
+    if not index_exists(cursor, 'weather_data', 'idx_city_timestamp_dedupe'):
+        cursor.execute("ALTER TABLE weather_data ADD INDEX idx_city_timestamp_dedupe (city, data_timestamp)")
+    # Keep the first copy of any observation loaded more than once
+    cursor.execute("""
+        DELETE w FROM weather_data w
+        JOIN (SELECT city, data_timestamp, MIN(id) AS first_id
+              FROM weather_data
+              GROUP BY city, data_timestamp
+              HAVING COUNT(*) > 1) duplicates
+          ON w.city = duplicates.city AND w.data_timestamp = duplicates.data_timestamp
+         AND w.id > duplicates.first_id
+    """)
+    # The unique key replaces the temporary index in the same table rebuild
+    cursor.execute("""
+        ALTER TABLE weather_data
+            ADD UNIQUE KEY uq_city_timestamp (city, data_timestamp),
+            DROP INDEX idx_city_timestamp_dedupe
+    """)
+
+def add_timestamp_index(cursor):
+    """Index for the all-city time range scans the dashboard runs"""
+    if not index_exists(cursor, 'weather_data', 'idx_data_timestamp'):
+        cursor.execute("ALTER TABLE weather_data ADD INDEX idx_data_timestamp (data_timestamp)")
+
+def create_weather_latest(cursor):
+    """One row per city with its newest observation, backfilled from history"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS weather_latest (
+            city VARCHAR(100) PRIMARY KEY,
+            country VARCHAR(50),
+            temperature DECIMAL(5,2),
+            feels_like DECIMAL(5,2),
+            humidity INT,
+            pressure INT,
+            weather_main VARCHAR(50),
+            weather_description VARCHAR(100),
+            wind_speed DECIMAL(5,2),
+            wind_direction INT,
+            visibility INT,
+            data_timestamp DATETIME,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        REPLACE INTO weather_latest
+            (city, country, temperature, feels_like, humidity, pressure, weather_main,
+             weather_description, wind_speed, wind_direction, visibility, data_timestamp)
+        SELECT w.city, w.country, w.temperature, w.feels_like, w.humidity, w.pressure,
+               w.weather_main, w.weather_description, w.wind_speed, w.wind_direction,
+               w.visibility, w.data_timestamp
+        FROM weather_data w
+        JOIN (SELECT city, MAX(data_timestamp) AS data_timestamp
+              FROM weather_data GROUP BY city) newest
+          ON w.city = newest.city AND w.data_timestamp = newest.data_timestamp
+    """)
+
+def create_rollup_tables(cursor):
+    """Hourly/daily rollup tables, backfilled from all existing history"""
+    for statement in ROLLUP_TABLES_SQL:
+        cursor.execute(statement)
+    cursor.execute("SELECT MIN(data_timestamp), MAX(data_timestamp) FROM weather_data")
+    oldest, newest = cursor.fetchone()
+    if oldest:
+        refresh_rollups(cursor, oldest, newest + timedelta(hours=1))
+
+def create_etl_watermark(cursor):
+    """Single-row table holding the time of the last successful load"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS etl_watermark (
+            id TINYINT PRIMARY KEY,
+            last_load_at TIMESTAMP(6) NOT NULL
+        )
+    """)
+
+def create_run_history(cursor):
+    """One row per scheduled batch run, used for catch-up after downtime"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS etl_run_history (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            batch_id INT NOT NULL,
+            batch_count INT NOT NULL,
+            cities INT NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            started_at DATETIME(3) NOT NULL,
+            finished_at DATETIME(3) NOT NULL,
+            duration_seconds DOUBLE NOT NULL,
+            KEY idx_batch_started (batch_count, batch_id, started_at)
+        )
+    """)
+
+def create_run_metrics(cursor):
+    """Per-run stage timings, row counts and peak memory written by the pipeline"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS etl_run_metrics (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            started_at DATETIME(3) NOT NULL,
+            duration_seconds DOUBLE NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            cities INT NOT NULL,
+            extract_seconds DOUBLE NOT NULL,
+            transform_seconds DOUBLE NOT NULL,
+            validate_seconds DOUBLE NOT NULL,
+            load_seconds DOUBLE NOT NULL,
+            rows_extracted INT NOT NULL,
+            rows_skipped INT NOT NULL,
+            rows_validate_in INT NOT NULL,
+            rows_validate_out INT NOT NULL,
+            rows_loaded INT NOT NULL,
+            peak_rss_bytes BIGINT NOT NULL,
+            KEY idx_started_at (started_at)
+        )
+    """)
+
+def create_city_registry(cursor):
+    """Cities to poll with per-city enabled flag, priority and poll interval, seeded from config.CITIES"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS city_registry (
+            city VARCHAR(100) PRIMARY KEY,
+            enabled BOOLEAN NOT NULL DEFAULT TRUE,
+            priority INT NOT NULL DEFAULT 0,
+            poll_interval_minutes INT NULL,
+            last_polled_at DATETIME NULL,
+            updated_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3)
+        )
+    """)
+    cursor.executemany("INSERT IGNORE INTO city_registry (city) VALUES (%s)", [(city,) for city in CITIES])
+
+# Applied in order and recorded in schema_migrations; never edit or reorder
+# an entry once released, add a new one instead
+MIGRATIONS = [
+    (1, 'Unique key on (city, data_timestamp)', add_unique_city_timestamp),
+    (2, 'Index on data_timestamp', add_timestamp_index),
+    (3, 'weather_latest table', create_weather_latest),
+    (4, 'Hourly and daily rollup tables', create_rollup_tables),
+    (5, 'etl_watermark table', create_etl_watermark),
+    (6, 'etl_run_history table', create_run_history),
+    (7, 'etl_run_metrics table', create_run_metrics),
+    (8, 'city_registry table', create_city_registry),
+]
+
+def month_start(day, months_offset=0):
+    """First day of the month months_offset months after the month of day"""
+    month_index = day.year * 12 + day.month - 1 + months_offset
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def partition_name(month):
+    return f"p{month.year:04d}{month.month:02d}"
+
+def partition_month(name):
+    """Month covered by a pYYYYMM partition, or None for pmax"""
+    if name == 'pmax':
+        return None
+    return date(int(name[1:5]), int(name[5:7]), 1)
+
+def partition_clause(month):
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN ('{month_start(month, 1).isoformat()}')"
+
+class SchemaMigrator:
+    """Applies versioned schema migrations and maintains monthly partitions"""
+    def __init__(self):
+        self.pool = get_pool()
+
+    def run(self, operation, *args):
+        connection = self.pool.get_connection()
+        try:
+            cursor = connection.cursor()
+            try:
+                return operation(cursor, *args)
+            finally:
+                cursor.close()
+        finally:
+            connection.close()
+
+    def migrate(self):
+        """Apply every migration that has not been recorded yet"""
+        return self.run(self._migrate)
+
+    def _migrate(self, cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                description VARCHAR(200),
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cursor.fetchall()}
+
+        count = 0
+        for version, description, migration in MIGRATIONS:
+            if version in applied:
+                continue
+            logging.info(f"Applying migration {version}: {description}")
+            # DDL commits implicitly, so each migration is recorded as soon as it is done
+            migration(cursor)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                           (version, description))
+            cursor.execute("COMMIT")
+            count += 1
+
+        if count:
+            logging.info(f"Applied {count} schema migrations")
+        return count
+
+    def get_partitions(self, cursor):
+        cursor.execute("""
+            SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'weather_data'
+              AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """)
+        return [row[0] for row in cursor.fetchall()]
+
+    def enable_partitioning(self):
+        """Convert weather_data to monthly RANGE partitions on data_timestamp"""
+        return self.run(self._enable_partitioning)
+
+    def _enable_partitioning(self, cursor):
+        if self.get_partitions(cursor):
+            logging.info("weather_data is already partitioned")
+            return
+
+        cursor.execute("SELECT MIN(data_timestamp) FROM weather_data")
+        oldest = cursor.fetchone()[0]
+        first = month_start(oldest.date() if oldest else date.today())
+        last = month_start(date.today(), PARTITION_MONTHS_AHEAD)
+
+        months = [first]
+        while months[-1] < last:
+            months.append(month_start(months[-1], 1))
+        partitions = [partition_clause(month) for month in months]
+        partitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+
+        # Every unique key of a partitioned table must include the partition column
+        logging.info(f"Partitioning weather_data into {len(partitions)} partitions")
+        cursor.execute("DELETE FROM weather_data WHERE data_timestamp IS NULL")
+        cursor.execute("""
+            ALTER TABLE weather_data
+                MODIFY data_timestamp DATETIME NOT NULL,
+                DROP PRIMARY KEY,
+                ADD PRIMARY KEY (id, data_timestamp)
+        """)
+        cursor.execute(f"""
+            ALTER TABLE weather_data
+            PARTITION BY RANGE COLUMNS (data_timestamp) ({', '.join(partitions)})
+        """)
+
+    def maintain_partitions(self, months_ahead=PARTITION_MONTHS_AHEAD, retention_months=RETENTION_MONTHS):
+        """Create upcoming monthly partitions and drop those past the retention period"""
+        return self.run(self._maintain_partitions, months_ahead, retention_months)
+
+    def _maintain_partitions(self, cursor, months_ahead, retention_months):
+        partitions = self.get_partitions(cursor)
+        if not partitions:
+            if retention_months:
+                logging.warning("Retention needs a partitioned weather_data table (migrate.py --partition)")
+            return
+
+        months = [partition_month(name) for name in partitions if partition_month(name)]
+        newest = max(months)
+        target = month_start(date.today(), months_ahead)
+        new_months = []
+        while newest < target:
+            newest = month_start(newest, 1)
+            new_months.append(newest)
+
+        if new_months:
+            clauses = [partition_clause(month) for month in new_months]
+            clauses.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+            cursor.execute(f"ALTER TABLE weather_data REORGANIZE PARTITION pmax INTO ({', '.join(clauses)})")
+            logging.info(f"Created partitions {', '.join(partition_name(month) for month in new_months)}")
+
+        if retention_months:
+            cutoff = month_start(date.today(), -retention_months)
+            expired = [partition_name(month) for month in months if month < cutoff]
+            if expired:
+                cursor.execute(f"ALTER TABLE weather_data DROP PARTITION {', '.join(expired)}")
+                logging.info(f"Dropped expired partitions {', '.join(expired)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply weather_data schema migrations")
+    parser.add_argument('--partition', action='store_true',
+                        help="convert weather_data to monthly partitions")
+    parser.add_argument('--maintain', action='store_true',
+                        help="create future partitions and drop expired ones")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    migrator = SchemaMigrator()
+    try:
+        migrator.migrate()
+        if args.partition:
+            migrator.enable_partitioning()
+        if args.partition or args.maintain:
+            migrator.maintain_partitions()
+    except mysql.connector.Error as e:
+        logging.error(f"Migration failed: {e}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import argparse
+import logging
+from datetime import datetime, timedelta
+import mysql.connector
+import pandas as pd
+from db import get_pool
+from dtypes import sql_rows
+
+ROLLUP_TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS weather_hourly (
+        city VARCHAR(100) NOT NULL,
+        hour_start DATETIME NOT NULL,
+        observations INT NOT NULL,
+        temp_sum DOUBLE,
+        temp_count INT,
+        temp_min DECIMAL(5,2),
+        temp_max DECIMAL(5,2),
+        humidity_sum DOUBLE,
+        humidity_count INT,
+        PRIMARY KEY (city, hour_start),
+        KEY idx_hour_start (hour_start)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS weather_daily (
+        city VARCHAR(100) NOT NULL,
+        day DATE NOT NULL,
+        observations INT NOT NULL,
+        temp_sum DOUBLE,
+        temp_count INT,
+        temp_min DECIMAL(5,2),
+        temp_max DECIMAL(5,2),
+        humidity_sum DOUBLE,
+        humidity_count INT,
+        PRIMARY KEY (city, day),
+        KEY idx_day (day)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS weather_condition_hourly (
+        city VARCHAR(100) NOT NULL,
+        hour_start DATETIME NOT NULL,
+        weather_main VARCHAR(50) NOT NULL,
+        observations INT NOT NULL,
+        PRIMARY KEY (city, hour_start, weather_main),
+        KEY idx_hour_start (hour_start)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS weather_condition_daily (
+        city VARCHAR(100) NOT NULL,
+        day DATE NOT NULL,
+        weather_main VARCHAR(50) NOT NULL,
+        observations INT NOT NULL,
+        PRIMARY KEY (city, day, weather_main),
+        KEY idx_day (day)
+    )
+    """,
+]
+
+HOUR_OF = "TIMESTAMP(DATE(data_timestamp), MAKETIME(HOUR(data_timestamp), 0, 0))"
+
+# Raw columns the rollups are built from; a reloaded row that changes none of them changes no rollup
+ROLLUP_SOURCE_COLUMNS = ['temperature', 'humidity', 'weather_main']
+
+MEASURE_COLUMNS = ['observations', 'temp_sum', 'temp_count', 'temp_min', 'temp_max',
+                   'humidity_sum', 'humidity_count']
+
+def add_nullable(column):
+    # A sum over no values is NULL, as SUM() leaves it
+    return f"{column} = IF({column} IS NULL, VALUES({column}), {column} + COALESCE(VALUES({column}), 0))"
+
+# Folds a batch's aggregates into a stored bucket; LEAST/GREATEST return NULL if either side is
+MEASURE_UPSERT_CLAUSE = "ON DUPLICATE KEY UPDATE " + ', '.join([
+    "observations = observations + VALUES(observations)",
+    add_nullable('temp_sum'),
+    "temp_count = temp_count + VALUES(temp_count)",
+    "temp_min = LEAST(COALESCE(temp_min, VALUES(temp_min)), COALESCE(VALUES(temp_min), temp_min))",
+    "temp_max = GREATEST(COALESCE(temp_max, VALUES(temp_max)), COALESCE(VALUES(temp_max), temp_max))",
+    add_nullable('humidity_sum'),
+    "humidity_count = humidity_count + VALUES(humidity_count)",
+])
+
+CONDITION_UPSERT_CLAUSE = "ON DUPLICATE KEY UPDATE observations = observations + VALUES(observations)"
+
+def city_filter(column, cities):
+    """SQL condition and params restricting a query to the given cities (None = all)"""
+    if cities is None:
+        return "", []
+    return f"AND {column} IN ({', '.join(['%s'] * len(cities))})", list(cities)
+
+def refresh_rollups(cursor, start, end, cities=None):
+    """Recompute hourly and daily rollups for [start, end) from raw weather_data
+
+    start and end are widened to whole days. Sums and counts are stored rather
+    than averages so any range can be combined exactly. Runs on the caller's
+    cursor so the loader can refresh rollups in the same transaction as the insert.
+    """
+    day_start = datetime(start.year, start.month, start.day)
+    day_end = datetime(end.year, end.month, end.day)
+    if day_end < end:
+        day_end += timedelta(days=1)
+
+    raw_cities, raw_params = city_filter('city', cities)
+    range_params = [day_start, day_end]
+
+    for table in ('weather_hourly', 'weather_condition_hourly', 'weather_daily', 'weather_condition_daily'):
+        column = 'day' if table.endswith('daily') else 'hour_start'
+        cursor.execute(f"DELETE FROM {table} WHERE {column} >= %s AND {column} < %s {raw_cities}",
+                       range_params + raw_params)
+
+    cursor.execute(f"""
+        INSERT INTO weather_hourly
+            (city, hour_start, observations, temp_sum, temp_count, temp_min, temp_max,
+             humidity_sum, humidity_count)
+        SELECT city, {HOUR_OF}, COUNT(*), SUM(temperature), COUNT(temperature),
+               MIN(temperature), MAX(temperature), SUM(humidity), COUNT(humidity)
+        FROM weather_data
+        WHERE data_timestamp >= %s AND data_timestamp < %s {raw_cities}
+        GROUP BY city, {HOUR_OF}
+    """, range_params + raw_params)
+
+    cursor.execute(f"""
+        INSERT INTO weather_condition_hourly (city, hour_start, weather_main, observations)
+        SELECT city, {HOUR_OF}, weather_main, COUNT(*)
+        FROM weather_data
+        WHERE data_timestamp >= %s AND data_timestamp < %s AND weather_main IS NOT NULL {raw_cities}
+        GROUP BY city, {HOUR_OF}, weather_main
+    """, range_params + raw_params)
+
+    # Daily rollups are combined from the hourly rows just written
+    cursor.execute(f"""
+        INSERT INTO weather_daily
+            (city, day, observations, temp_sum, temp_count, temp_min, temp_max,
+             humidity_sum, humidity_count)
+        SELECT city, DATE(hour_start), SUM(observations), SUM(temp_sum), SUM(temp_count),
+               MIN(temp_min), MAX(temp_max), SUM(humidity_sum), SUM(humidity_count)
+        FROM weather_hourly
+        WHERE hour_start >= %s AND hour_start < %s {raw_cities}
+        GROUP BY city, DATE(hour_start)
+    """, range_params + raw_params)
+
+    cursor.execute(f"""
+        INSERT INTO weather_condition_daily (city, day, weather_main, observations)
+        SELECT city, DATE(hour_start), weather_main, SUM(observations)
+        FROM weather_condition_hourly
+        WHERE hour_start >= %s AND hour_start < %s {raw_cities}
+        GROUP BY city, DATE(hour_start), weather_main
+    """, range_params + raw_params)
+
+def previous_observations(cursor, df):
+    """Read the stored rollup columns of df's rows that are already in weather_data
+
+    Must run before df is upserted. The locking read stops a concurrent load
+    inserting the same rows unseen; one of the two then fails and is retried.
+    """
+    cities = df['city'].astype(str).unique().tolist()
+    timestamps = pd.to_datetime(df['data_timestamp'])
+    cursor.execute(f"""
+        SELECT city, data_timestamp, {', '.join(ROLLUP_SOURCE_COLUMNS)}
+        FROM weather_data
+        WHERE city IN ({', '.join(['%s'] * len(cities))}) AND data_timestamp >= %s AND data_timestamp <= %s
+        FOR UPDATE
+    """, cities + [timestamps.min().to_pydatetime(), timestamps.max().to_pydatetime()])
+    return pd.DataFrame(cursor.fetchall(), columns=['city', 'data_timestamp'] + ROLLUP_SOURCE_COLUMNS)
+
+def rollup_source(df):
+    """The rollup columns of df, as weather_data stores them, one row per (city, data_timestamp)"""
+    source = pd.DataFrame({
+        'city': df['city'].astype(str).to_numpy(),
+        'data_timestamp': pd.to_datetime(df['data_timestamp']).astype('datetime64[ns]').to_numpy(),
+        # DECIMAL(5,2), so the sums match SUM() over the stored values
+        'temperature': pd.to_numeric(df['temperature']).astype('float64').round(2).to_numpy(),
+        'humidity': pd.to_numeric(df['humidity']).astype('float64').to_numpy(),
+        'weather_main': df['weather_main'].astype(object).where(df['weather_main'].notna(), None).to_numpy(),
+    })
+    return source.drop_duplicates(['city', 'data_timestamp'], keep='last')
+
+def split_batch(df, previous):
+    """Return (rows new to weather_data, (city, day) pairs with a stored row whose rollup columns changed)"""
+    batch, stored = rollup_source(df), rollup_source(previous)
+    merged = batch.merge(stored, on=['city', 'data_timestamp'], how='left', suffixes=('', '_stored'),
+                         indicator=True)
+    existing = merged['_merge'] == 'both'
+    changed = pd.Series(False, index=merged.index)
+    for column in ROLLUP_SOURCE_COLUMNS:
+        new, old = merged[column], merged[f"{column}_stored"]
+        if column == 'weather_main':
+            differs = new.fillna('') != old.fillna('')
+        else:
+            differs = ~((new - old).abs() < 0.005) & ~(new.isna() & old.isna())
+        changed |= existing & differs
+    changed_days = set(zip(merged.loc[changed, 'city'], merged.loc[changed, 'data_timestamp'].dt.date))
+    return batch[~existing.to_numpy()], changed_days
+
+def rollup_deltas(rows, period):
+    """Aggregate rows into (measures, conditions) DataFrames per city and 'hour' or 'day'"""
+    bucket = rows['data_timestamp'].dt.floor('h') if period == 'hour' else rows['data_timestamp'].dt.normalize()
+    grouped = rows.assign(bucket=bucket).groupby(['city', 'bucket'])
+    measures = pd.DataFrame({
+        'observations': grouped.size(),
+        'temp_sum': grouped['temperature'].sum(min_count=1),
+        'temp_count': grouped['temperature'].count(),
+        'temp_min': grouped['temperature'].min(),
+        'temp_max': grouped['temperature'].max(),
+        'humidity_sum': grouped['humidity'].sum(min_count=1),
+        'humidity_count': grouped['humidity'].count(),
+    }).reset_index()
+    conditions = (rows[rows['weather_main'].notna()].assign(bucket=bucket)
+                  .groupby(['city', 'bucket', 'weather_main']).size().rename('observations').reset_index())
+    for column in ['temp_sum', 'temp_min', 'temp_max', 'humidity_sum']:
+        # NaN would reach the driver as a number; an empty aggregate is NULL
+        measures[column] = measures[column].astype(object).where(measures[column].notna(), None)
+    if period == 'day':
+        measures['bucket'] = measures['bucket'].dt.date
+        conditions['bucket'] = conditions['bucket'].dt.date
+    return measures, conditions
+
+def apply_rollup_deltas(cursor, df, previous):
+    """Fold a just-upserted batch into the rollups without re-reading raw data
+
+    previous is previous_observations() from before the upsert. Rows new to
+    weather_data are aggregated here and added to their buckets. Rows that were
+    already stored add nothing, unless their values changed; a changed value
+    can't be taken back out of a MIN or MAX, so those cities' days are
+    recomputed from raw data instead.
+    """
+    new, changed_days = split_batch(df, previous)
+    if changed_days:
+        new = new[[(city, day) not in changed_days
+                   for city, day in zip(new['city'], new['data_timestamp'].dt.date)]]
+
+    if not new.empty:
+        for period, table, condition_table in (('hour', 'weather_hourly', 'weather_condition_hourly'),
+                                               ('day', 'weather_daily', 'weather_condition_daily')):
+            column = 'hour_start' if period == 'hour' else 'day'
+            measures, conditions = rollup_deltas(new, period)
+            cursor.executemany(f"""
+                INSERT INTO {table} (city, {column}, {', '.join(MEASURE_COLUMNS)})
+                VALUES ({', '.join(['%s'] * (len(MEASURE_COLUMNS) + 2))})
+                {MEASURE_UPSERT_CLAUSE}
+            """, sql_rows(measures, ['city', 'bucket'] + MEASURE_COLUMNS))
+            if not conditions.empty:
+                cursor.executemany(f"""
+                    INSERT INTO {condition_table} (city, {column}, weather_main, observations)
+                    VALUES (%s, %s, %s, %s)
+                    {CONDITION_UPSERT_CLAUSE}
+                """, sql_rows(conditions, ['city', 'bucket', 'weather_main', 'observations']))
+
+    days = {}
+    for city, day in changed_days:
+        days.setdefault(day, []).append(city)
+    for day, cities in sorted(days.items()):
+        start = datetime(day.year, day.month, day.day)
+        refresh_rollups(cursor, start, start + timedelta(days=1), sorted(cities))
+
+def find_mismatches(cursor, start, end):
+    """Return (city, hour_start) buckets whose hourly rollup disagrees with raw data"""
+    start = start.replace(minute=0, second=0, microsecond=0)
+    cursor.execute(f"""
+        SELECT city, {HOUR_OF}, COUNT(*), SUM(temperature)
+        FROM weather_data
+        WHERE data_timestamp >= %s AND data_timestamp < %s
+        GROUP BY city, {HOUR_OF}
+    """, (start, end))
+    raw = {(city, hour): (count, temp_sum) for city, hour, count, temp_sum in cursor.fetchall()}
+
+    cursor.execute("""
+        SELECT city, hour_start, observations, temp_sum
+        FROM weather_hourly
+        WHERE hour_start >= %s AND hour_start < %s
+    """, (start, end))
+    rolled = {(city, hour): (count, temp_sum) for city, hour, count, temp_sum in cursor.fetchall()}
+
+    def matches(key):
+        if key not in raw or key not in rolled:
+            return False
+        (raw_count, raw_sum), (rolled_count, rolled_sum) = raw[key], rolled[key]
+        return raw_count == rolled_count and abs(float(raw_sum or 0) - float(rolled_sum or 0)) <= 0.001
+
+    return sorted(key for key in raw.keys() | rolled.keys() if not matches(key))
+
+class RollupChecker:
+    """Verifies rollup tables against raw data and rebuilds ranges that drifted"""
+    def __init__(self):
+        self.pool = get_pool()
+
+    def check(self, start, end, rebuild=False):
+        """Return the number of mismatched hourly buckets, rebuilding their days if asked"""
+        connection = self.pool.get_connection()
+        try:
+            cursor = connection.cursor()
+            mismatches = find_mismatches(cursor, start, end)
+            if mismatches:
+                logging.warning(f"{len(mismatches)} hourly rollup buckets disagree with raw data")
+            if mismatches and rebuild:
+                cities = sorted({city for city, _ in mismatches})
+                first = min(hour for _, hour in mismatches)
+                last = max(hour for _, hour in mismatches) + timedelta(hours=1)
+                refresh_rollups(cursor, first, last, cities)
+                connection.commit()
+                logging.info(f"Rebuilt rollups for {len(cities)} cities from {first} to {last}")
+            cursor.close()
+            return len(mismatches)
+        finally:
+            connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Check rollup tables against raw weather_data")
+    parser.add_argument('--days', type=int, default=7, help="how many days back to check")
+    parser.add_argument('--rebuild', action='store_true', help="rebuild ranges that disagree")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    end = datetime.now() + timedelta(hours=1)
+    start = end - timedelta(days=args.days)
+    try:
+        mismatched = RollupChecker().check(start, end, rebuild=args.rebuild)
+    except mysql.connector.Error as e:
+        logging.error(f"Rollup check failed: {e}")
+        raise SystemExit(1)
+    logging.info(f"{mismatched} mismatched hourly buckets in the last {args.days} days")
+
+if __name__ == "__main__":
+    main()
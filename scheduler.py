@@ -0,0 +1,205 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import mysql.connector
+from db import get_pool
+from config import SCHEDULE_INTERVAL_MINUTES
+
+class BatchScheduler:
+    """Runs each city batch once per interval at its own evenly spaced offset
+
+    Batch i of n is due at i/n of the way through every interval, so API and DB
+    load is spread out instead of arriving as one burst. A batch still running
+    when it comes due again is skipped rather than queued, in this process via
+    an in-memory set and across processes via a MySQL named lock. Every run is
+    recorded in etl_run_history.
+
+    Given a CityRegistry, each run polls only the batch's registry cities that
+    are due, and a run with none due is recorded as idle without calling the API.
+    A job that reports failed_cities (a ShardedRunner whose shards partly failed)
+    is recorded as partial, and only its other cities are marked polled.
+    """
+    def __init__(self, jobs, interval=SCHEDULE_INTERVAL_MINUTES * 60, registry=None):
+        # Each job is a pipeline-like object with run_pipeline(), failure_count and cities
+        self.jobs = jobs
+        self.interval = interval
+        self.registry = registry
+        self.pool = get_pool()
+        self.executor = ThreadPoolExecutor(max_workers=len(jobs))
+        self.running = set()
+        self.lock = threading.Lock()
+        self.next_due = {}
+        self.fatal = False
+
+    def offset(self, batch_id):
+        return self.interval * batch_id / len(self.jobs)
+
+    def last_slot(self, batch_id, now):
+        """Start of the most recent slot for a batch at or before now"""
+        offset = self.offset(batch_id)
+        return (now - offset) // self.interval * self.interval + offset
+
+    def start(self):
+        """Plan each batch's next run, running straight away any batch that missed a slot"""
+        now = time.time()
+        for batch_id in range(len(self.jobs)):
+            last_run = self.last_run_started(batch_id)
+            slot = self.last_slot(batch_id, now)
+            if last_run is None or last_run < slot:
+                # The current-weather API can't return past observations, so one
+                # run now stands in for however many slots were missed
+                missed = 1 if last_run is None else int((slot - last_run) // self.interval) + 1
+                logging.info(f"Batch {batch_id} missed {missed} scheduled run(s); catching up now")
+                self.next_due[batch_id] = now
+            else:
+                self.next_due[batch_id] = slot + self.interval
+
+    def last_run_started(self, batch_id):
+        """Epoch time the batch last started a run, or None if it never has"""
+        try:
+            connection = self.pool.get_connection()
+        except mysql.connector.Error as e:
+            logging.warning(f"Could not read run history for batch {batch_id}: {e}")
+            return None
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT MAX(started_at) FROM etl_run_history
+                WHERE batch_count = %s AND batch_id = %s AND status <> 'skipped'
+            """, (len(self.jobs), batch_id))
+            (started_at,) = cursor.fetchone()
+            cursor.close()
+            return None if started_at is None else started_at.timestamp()
+        except mysql.connector.Error as e:
+            logging.warning(f"Could not read run history for batch {batch_id}: {e}")
+            return None
+        finally:
+            connection.close()
+
+    def run_pending(self):
+        """Start every batch whose slot has come; returns False once a batch hit its failure limit"""
+        now = time.time()
+        for batch_id, due in self.next_due.items():
+            if due <= now:
+                # Slots that passed while this process was busy are not replayed
+                self.next_due[batch_id] = self.last_slot(batch_id, now) + self.interval
+                self.executor.submit(self.run_batch, batch_id)
+        return not self.fatal
+
+    def seconds_until_next(self):
+        return max(0.0, min(self.next_due.values()) - time.time())
+
+    def run_batch(self, batch_id):
+        job = self.jobs[batch_id]
+        with self.lock:
+            if batch_id in self.running:
+                logging.warning(f"Batch {batch_id} is still running; skipping this slot")
+                return
+            self.running.add(batch_id)
+
+        started = datetime.now()
+        status = 'skipped'
+        lock_connection = None
+        try:
+            if self.registry is not None:
+                # Picks up cities added, removed or retuned in the table since the last run
+                self.registry.refresh()
+                job.cities = self.registry.due(self.registry.cities(batch_id, len(self.jobs)), started.timestamp())
+            if self.registry is not None and not job.cities:
+                status = 'idle'
+            else:
+                lock_connection = self.acquire_batch_lock(batch_id)
+                if lock_connection is not False:
+                    logging.info(f"Running batch {batch_id} ({len(job.cities)} cities)")
+                    status = 'error'
+                    job.run_pipeline()
+                    failed_cities = set(getattr(job, 'failed_cities', ()))
+                    if job.failure_count:
+                        status = 'failed'
+                    else:
+                        status = 'partial' if failed_cities else 'success'
+                    if status != 'failed' and self.registry is not None:
+                        # Failed shards' cities stay due, so the next run polls them again
+                        self.registry.mark_polled([city for city in job.cities if city not in failed_cities],
+                                                  started.timestamp())
+        except SystemExit:
+            # The pipeline gave up after too many consecutive failures
+            self.fatal = True
+        except Exception as e:
+            logging.error(f"Batch {batch_id} crashed: {e}")
+        finally:
+            self.release_batch_lock(batch_id, lock_connection)
+            with self.lock:
+                self.running.discard(batch_id)
+            self.record_run(batch_id, len(job.cities), status, started, datetime.now())
+
+    def lock_name(self, batch_id):
+        return f"weather_etl_batch_{len(self.jobs)}_{batch_id}"
+
+    def acquire_batch_lock(self, batch_id):
+        """Take the batch's named lock; returns its connection, None if the DB is down, False if held
+
+        The lock lives as long as its session, so it gets a dedicated connection
+        outside the pool. Held from the pool for a whole run, lock connections
+        would use up the slots the batches' own loads need.
+        """
+        try:
+            connection = mysql.connector.connect(**self.pool.db_config)
+        except mysql.connector.Error as e:
+            logging.warning(f"Running batch {batch_id} without a lock, database unavailable: {e}")
+            return None
+
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (self.lock_name(batch_id),))
+            (acquired,) = cursor.fetchone()
+            cursor.close()
+        except mysql.connector.Error as e:
+            logging.warning(f"Running batch {batch_id} without a lock: {e}")
+            connection.close()
+            return None
+        if acquired != 1:
+            logging.warning(f"Batch {batch_id} is running in another process; skipping this slot")
+            connection.close()
+            return False
+        return connection
+
+    def release_batch_lock(self, batch_id, connection):
+        if not connection:
+            return
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (self.lock_name(batch_id),))
+            cursor.fetchone()
+            cursor.close()
+        except mysql.connector.Error as e:
+            logging.warning(f"Could not release lock for batch {batch_id}: {e}")
+        finally:
+            connection.close()
+
+    def record_run(self, batch_id, cities, status, started, finished):
+        duration = (finished - started).total_seconds()
+        logging.info(f"Batch {batch_id} {status} in {duration:.1f}s")
+        try:
+            connection = self.pool.get_connection()
+        except mysql.connector.Error as e:
+            logging.error(f"Could not record run for batch {batch_id}: {e}")
+            return
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""
+                INSERT INTO etl_run_history
+                    (batch_id, batch_count, cities, status, started_at, finished_at, duration_seconds)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (batch_id, len(self.jobs), cities, status, started, finished, duration))
+            connection.commit()
+            cursor.close()
+        except mysql.connector.Error as e:
+            logging.error(f"Could not record run for batch {batch_id}: {e}")
+        finally:
+            connection.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
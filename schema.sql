@@ -16,5 +16,28 @@ CREATE TABLE weather_data (
     wind_direction INT,
     visibility INT,
     recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    data_timestamp DATETIME
+    data_timestamp DATETIME,
+    UNIQUE KEY uq_city_timestamp (city, data_timestamp)
 );
+
+-- Most recent observation per city, maintained by the loader
+CREATE TABLE weather_latest (
+    city VARCHAR(100) PRIMARY KEY,
+    country VARCHAR(50),
+    temperature DECIMAL(5,2),
+    feels_like DECIMAL(5,2),
+    humidity INT,
+    pressure INT,
+    weather_main VARCHAR(50),
+    weather_description VARCHAR(100),
+    wind_speed DECIMAL(5,2),
+    wind_direction INT,
+    visibility INT,
+    data_timestamp DATETIME,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Hourly/daily rollups (weather_hourly, weather_daily, weather_condition_hourly,
+-- weather_condition_daily) are created by migrate.py, see rollups.py
+
+-- Existing databases: run `python migrate.py` to bring the schema up to date
@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from metrics import REGISTRY
+from config import CITIES, SHARD_WORKERS, SLOW_SHARD_FACTOR, API_RATE_LIMIT
+
+def shard_for(city, shards):
+    """Stable shard index for a city; unlike hash() it is the same in every process and run"""
+    digest = hashlib.md5(city.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shards
+
+def shard_cities(cities, shards):
+    """Split cities into a fixed list of city lists, one per shard"""
+    assignment = [[] for _ in range(shards)]
+    for city in cities:
+        assignment[shard_for(city, shards)].append(city)
+    return assignment
+
+def run_shard(pipeline_class, shard, cities, rate_limit):
+    """Run a full extract, transform and load for one shard inside a worker process"""
+    started = time.monotonic()
+    before = REGISTRY.snapshot()
+    pipeline = pipeline_class(cities=cities)
+    # Each process has its own rate limiter, so each gets its share of the quota
+    pipeline.extractor.rate_limit = rate_limit
+    pipeline.run_pipeline()
+    return {
+        'shard': shard,
+        'cities': len(cities),
+        'duration': time.monotonic() - started,
+        'failed': pipeline.failure_count > 0,
+        # The worker's registry isn't the one /metrics serves, so the run's metrics travel back
+        'metrics': REGISTRY.changes_since(before)
+    }
+
+class ShardedRunner:
+    """Runs the pipeline as N worker processes, each owning a fixed subset of cities
+
+    Every worker has its own HTTP session and database pool (see db.get_pool).
+    Processes are kept alive between runs so those connections are reused.
+    The API quota (rate_limit calls per minute) is split evenly between workers.
+    """
+    def __init__(self, pipeline_class, workers=SHARD_WORKERS, cities=None, slow_factor=SLOW_SHARD_FACTOR,
+                 rate_limit=API_RATE_LIMIT):
+        # Passed in rather than imported, so etl_pipeline run as a script is not imported twice
+        self.pipeline_class = pipeline_class
+        self.workers = workers
+        # The scheduler may replace cities between runs, so shards are worked out per run
+        self.cities = CITIES if cities is None else cities
+        self.slow_factor = slow_factor
+        self.rate_limit = rate_limit
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.failure_count = 0
+        # Cities of the shards that failed in the last run, which the scheduler leaves due
+        self.failed_cities = []
+        self.max_failures = 5
+
+    def run_pipeline(self):
+        """Run every shard once and return the per-shard results"""
+        logging.info(f"Starting sharded ETL run across {self.workers} workers")
+        started = time.monotonic()
+        shards = shard_cities(self.cities, self.workers)
+        rate_limit = self.rate_limit / self.workers
+        futures = {self.executor.submit(run_shard, self.pipeline_class, shard, cities, rate_limit): shard
+                   for shard, cities in enumerate(shards) if cities}
+        results = []
+
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+                REGISTRY.merge(result.pop('metrics', {}))
+                results.append(result)
+            except Exception as e:
+                logging.error(f"Shard {futures[future]} crashed: {e}")
+                results.append({'shard': futures[future], 'cities': len(shards[futures[future]]),
+                                'duration': None, 'failed': True})
+
+        results.sort(key=lambda result: result['shard'])
+        self.failed_cities = [city for result in results if result['failed'] for city in shards[result['shard']]]
+        self.report(results, time.monotonic() - started)
+        return results
+
+    def report(self, results, elapsed):
+        """Log per-shard timings, flag slow shards and track consecutive failed runs"""
+        durations = [result['duration'] for result in results if result['duration'] is not None]
+        median = statistics.median(durations) if durations else 0
+
+        for result in results:
+            slow = result['duration'] is not None and median and result['duration'] > median * self.slow_factor
+            result['slow'] = bool(slow)
+            duration = 'n/a' if result['duration'] is None else f"{result['duration']:.1f}s"
+            logging.info(f"Shard {result['shard']}: {result['cities']} cities in {duration}"
+                         f"{' FAILED' if result['failed'] else ''}{' SLOW' if slow else ''}")
+            if slow:
+                logging.warning(f"Shard {result['shard']} took {result['duration']:.1f}s, "
+                                f"over {self.slow_factor}x the median of {median:.1f}s")
+
+        failed = [result['shard'] for result in results if result['failed']]
+        logging.info(f"Sharded ETL run finished in {elapsed:.1f}s; {len(failed)} of {len(results)} shards failed")
+
+        if failed and len(failed) == len(results):
+            self.failure_count += 1
+        else:
+            self.failure_count = 0
+        if self.failure_count >= self.max_failures:
+            logging.critical(f"Too many failures ({self.failure_count}). Stopping pipeline.")
+            self.close()
+            raise SystemExit(1)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
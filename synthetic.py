@@ -0,0 +1,260 @@
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from dtypes import OUTPUT_COLUMNS, apply_dtypes
+from transform import local_utc_offsets
+
+COUNTRIES = ['GB', 'US', 'JP', 'IN', 'AU', 'BR', 'DE', 'FR', 'NG', 'CA', 'MX', 'ZA', 'CN', 'AR', 'NO']
+
+# (id, main, description, icon) for each condition the generator emits
+CONDITIONS = {
+    'Clear': [(800, 'clear sky', '01')],
+    'Clouds': [(801, 'few clouds', '02'), (802, 'scattered clouds', '03'),
+               (803, 'broken clouds', '04'), (804, 'overcast clouds', '04')],
+    'Drizzle': [(300, 'light intensity drizzle', '09')],
+    'Rain': [(500, 'light rain', '10'), (501, 'moderate rain', '10'), (502, 'heavy intensity rain', '10')],
+    'Thunderstorm': [(211, 'thunderstorm', '11')],
+    'Snow': [(600, 'light snow', '13'), (601, 'snow', '13')],
+    'Mist': [(701, 'mist', '50')],
+    'Fog': [(741, 'fog', '50')],
+}
+
+class PayloadGenerator:
+    """Realistic OpenWeatherMap current-weather payloads for synthetic cities, hour by hour
+
+    Each city gets a fixed location, climate and wind pattern. Its observations
+    follow a seasonal and daily temperature cycle with noise, and humidity,
+    conditions and visibility that agree with it. Hour 0 is the oldest and the
+    last hour ends at end, so the data looks like the recent past. Payloads are
+    derived from (seed, city, hour), so any hour can be regenerated on its own.
+    """
+    def __init__(self, cities, hours, end=None, seed=0):
+        self.hours = hours
+        self.seed = seed
+        end = end or datetime.now(timezone.utc)
+        self.end = int(end.timestamp()) // 3600 * 3600
+        self.start = self.end - (hours - 1) * 3600
+        rng = random.Random(seed)
+        self.cities = [self.make_city(i, rng) for i in range(cities)]
+
+    def make_city(self, index, rng):
+        lat = rng.uniform(-55, 65)
+        lon = rng.uniform(-180, 180)
+        return {
+            'id': 9000000 + index,
+            'name': f"Synthetic City {index:05d}",
+            'country': COUNTRIES[index % len(COUNTRIES)],
+            'lat': round(lat, 4),
+            'lon': round(lon, 4),
+            'timezone': round(lon / 15) * 3600,
+            'base_temp': 28 - 0.45 * abs(lat) + rng.gauss(0, 2),
+            'wetness': rng.uniform(-15, 15),
+            'wind_deg': rng.uniform(0, 360),
+            'phase': rng.random(),
+            # Stations report at their own minute past the hour
+            'lag': rng.randrange(0, 3000),
+        }
+
+    def payload(self, city, hour):
+        rng = random.Random(self.seed * 1_000_003 + city['id'] * 10_007 + hour)
+        dt = self.start + hour * 3600 - city['lag']
+
+        local_hour = (dt + city['timezone']) / 3600 % 24
+        day_of_year = datetime.fromtimestamp(dt, timezone.utc).timetuple().tm_yday
+        # Summer peaks in July in the north and January in the south
+        season = math.cos(2 * math.pi * (day_of_year - 196) / 365) * abs(city['lat']) / 4
+        if city['lat'] < 0:
+            season = -season
+        temp = city['base_temp'] + season + 5 * math.sin(2 * math.pi * (local_hour - 9) / 24) + rng.gauss(0, 1.2)
+        humidity = int(min(100, max(10, 70 + city['wetness'] - 1.5 * (temp - city['base_temp']) + rng.gauss(0, 8))))
+        pressure = int(1013 + 9 * math.sin(2 * math.pi * (hour / 96 + city['phase'])) + rng.gauss(0, 2))
+        wind_speed = round(rng.gammavariate(2, 1.8), 2)
+
+        if humidity >= 92:
+            main = rng.choice(['Snow'] if temp < 0.5 else ['Rain', 'Rain', 'Drizzle', 'Mist', 'Fog', 'Thunderstorm'])
+        elif humidity >= 75:
+            main = rng.choice(['Clouds', 'Clouds', 'Rain', 'Snow' if temp < 0.5 else 'Drizzle'])
+        else:
+            main = rng.choice(['Clear', 'Clear', 'Clouds'])
+        condition_id, description, icon = rng.choice(CONDITIONS[main])
+        visibility = 10000 if main in ('Clear', 'Clouds') else rng.randrange(200, 8000, 100)
+
+        feels_like = temp - 0.6 * max(0.0, wind_speed - 1.5) + (0.05 * (humidity - 50) if temp > 24 else 0)
+        is_day = 6 <= local_hour < 18
+        return {
+            'coord': {'lon': city['lon'], 'lat': city['lat']},
+            'weather': [{'id': condition_id, 'main': main, 'description': description,
+                         'icon': f"{icon}{'d' if is_day else 'n'}"}],
+            'base': 'stations',
+            'main': {'temp': round(temp, 2), 'feels_like': round(feels_like, 2),
+                     'temp_min': round(temp - rng.uniform(0, 1.5), 2),
+                     'temp_max': round(temp + rng.uniform(0, 1.5), 2),
+                     'pressure': pressure, 'humidity': humidity},
+            'visibility': visibility,
+            'wind': {'speed': wind_speed, 'deg': int(city['wind_deg'] + rng.gauss(0, 40)) % 360},
+            'clouds': {'all': 0 if main == 'Clear' else rng.randrange(20, 101)},
+            'dt': dt,
+            'sys': {'country': city['country'],
+                    'sunrise': dt - int((local_hour - 6) * 3600), 'sunset': dt - int((local_hour - 18) * 3600)},
+            'timezone': city['timezone'],
+            'id': city['id'],
+            'name': city['name'],
+            'cod': 200,
+        }
+
+    def hour(self, hour):
+        """Payloads for every city at one hour"""
+        return [self.payload(city, hour) for city in self.cities]
+
+    def __iter__(self):
+        for hour in range(self.hours):
+            yield self.hour(hour)
+
+    def frame(self, first_hour=0, last_hour=None):
+        """Transformed observations for hours [first_hour, last_hour), as the pipeline would load them
+
+        A vectorized counterpart of payload() for building large histories
+        quickly: the same cities and climate model, but with independent noise.
+        """
+        last_hour = self.hours if last_hour is None else min(last_hour, self.hours)
+        n_cities = len(self.cities)
+        hour = np.repeat(np.arange(first_hour, last_hour), n_cities)
+        index = np.tile(np.arange(n_cities), last_hour - first_hour)
+        rng = np.random.default_rng([self.seed, first_hour])
+
+        def city_values(key):
+            return np.array([city[key] for city in self.cities])[index]
+
+        lat, base_temp, wetness = city_values('lat'), city_values('base_temp'), city_values('wetness')
+        dt = self.start + hour * 3600 - city_values('lag')
+        local_hour = (dt + city_values('timezone')) / 3600 % 24
+        day_of_year = pd.to_datetime(dt, unit='s').dayofyear.to_numpy()
+        season = np.cos(2 * np.pi * (day_of_year - 196) / 365) * np.abs(lat) / 4 * np.sign(lat)
+        temp = base_temp + season + 5 * np.sin(2 * np.pi * (local_hour - 9) / 24) + rng.normal(0, 1.2, len(hour))
+        humidity = np.clip(70 + wetness - 1.5 * (temp - base_temp) + rng.normal(0, 8, len(hour)), 10, 100).astype(int)
+        pressure = (1013 + 9 * np.sin(2 * np.pi * (hour / 96 + city_values('phase')))
+                    + rng.normal(0, 2, len(hour))).astype(int)
+        wind_speed = np.round(rng.gamma(2, 1.8, len(hour)), 2)
+
+        wet = np.where(temp < 0.5, 'Snow', np.array(['Rain', 'Drizzle', 'Mist', 'Fog', 'Thunderstorm'])[
+            rng.integers(0, 5, len(hour))])
+        damp = np.where(rng.random(len(hour)) < 0.5, 'Clouds', np.where(temp < 0.5, 'Snow', 'Rain'))
+        dry = np.where(rng.random(len(hour)) < 2 / 3, 'Clear', 'Clouds')
+        main = np.where(humidity >= 92, wet, np.where(humidity >= 75, damp, dry))
+        descriptions = {name: [description for _, description, _ in options] for name, options in CONDITIONS.items()}
+        description = np.empty(len(hour), dtype=object)
+        for name, options in descriptions.items():
+            mask = main == name
+            description[mask] = np.array(options, dtype=object)[rng.integers(0, len(options), mask.sum())]
+        visibility = np.where(np.isin(main, ['Clear', 'Clouds']), 10000, rng.integers(2, 80, len(hour)) * 100)
+
+        epoch = pd.Series(dt, dtype='float64')
+        df = pd.DataFrame({
+            'city': pd.Categorical.from_codes(index, [city['name'] for city in self.cities]),
+            'country': city_values('country'),
+            'temperature': np.round(temp, 2),
+            'feels_like': np.round(temp - 0.6 * np.maximum(0, wind_speed - 1.5)
+                                   + np.where(temp > 24, 0.05 * (humidity - 50), 0), 2),
+            'humidity': humidity,
+            'pressure': pressure,
+            'weather_main': main,
+            'weather_description': description,
+            'wind_speed': wind_speed,
+            'wind_direction': (city_values('wind_deg') + rng.normal(0, 40, len(hour))).astype(int) % 360,
+            'visibility': visibility,
+            'data_timestamp': pd.to_datetime(epoch + local_utc_offsets(epoch), unit='s'),
+        }, columns=OUTPUT_COLUMNS)
+        return apply_dtypes(df)
+
+    def frames(self, rows):
+        """Yield frame() over all hours in pieces of about rows rows each"""
+        step = max(1, rows // max(1, len(self.cities)))
+        for first_hour in range(0, self.hours, step):
+            yield self.frame(first_hour, first_hour + step)
+
+class MockAPIHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        status, body = self.server.api.respond(parsed.path, parse_qs(parsed.query))
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        if status == 503 and self.server.api.retry_after is not None:
+            self.send_header('Retry-After', str(self.server.api.retry_after))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class MockWeatherAPI:
+    """Local stand-in for the OpenWeatherMap current-weather and group endpoints
+
+    Serves the generator's observations for the current hour. Each request is
+    delayed by a random latency (mean latency, standard deviation jitter), and
+    a fraction error_rate of requests fail with a 503.
+    """
+    def __init__(self, generator, latency=0.05, jitter=0.02, error_rate=0.0, seed=0):
+        self.generator = generator
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.hour = generator.hours - 1
+        self.by_name = {city['name']: city for city in generator.cities}
+        self.by_id = {str(city['id']): city for city in generator.cities}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.server = None
+        # (path, query) of every request served, for tests to inspect
+        self.calls = []
+        # Retry-After value sent with injected errors, if any
+        self.retry_after = None
+
+    def start(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), MockAPIHandler)
+        self.server.daemon_threads = True
+        self.server.api = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/data/2.5/weather"
+
+    @property
+    def group_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/data/2.5/group"
+
+    def respond(self, path, query):
+        """Return (status, JSON body) for a request"""
+        with self.lock:
+            self.calls.append((path, query))
+            delay = max(0.0, self.rng.gauss(self.latency, self.jitter))
+            failed = self.rng.random() < self.error_rate
+        time.sleep(delay)
+        if failed:
+            return 503, {'cod': 503, 'message': 'Service Unavailable'}
+
+        if path.endswith('/weather'):
+            city = self.by_name.get(query.get('q', [''])[0])
+            if city is None:
+                return 404, {'cod': '404', 'message': 'city not found'}
+            return 200, self.generator.payload(city, self.hour)
+        if path.endswith('/group'):
+            ids = query.get('id', [''])[0].split(',')
+            payloads = [self.generator.payload(self.by_id[city_id], self.hour)
+                        for city_id in ids if city_id in self.by_id]
+            return 200, {'cnt': len(payloads), 'list': payloads}
+        return 404, {'cod': '404', 'message': 'Internal error'}
@@ -0,0 +1,22 @@
+import pytest
+from extract import CityIdCache, WeatherExtractor
+from synthetic import PayloadGenerator, MockWeatherAPI
+
+@pytest.fixture
+def generator():
+    return PayloadGenerator(cities=45, hours=1)
+
+@pytest.fixture
+def mock_api(generator):
+    api = MockWeatherAPI(generator, latency=0, jitter=0).start()
+    yield api
+    api.stop()
+
+@pytest.fixture
+def extractor(mock_api, tmp_path):
+    """An extractor pointed at the stub server, with no retries and its own ID cache"""
+    extractor = WeatherExtractor(max_retries=0, rate_limit=1e9)
+    extractor.base_url = mock_api.base_url
+    extractor.group_url = mock_api.group_url
+    extractor.id_cache = CityIdCache(str(tmp_path / 'city_ids.json'))
+    return extractor
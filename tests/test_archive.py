@@ -0,0 +1,50 @@
+import gzip
+import os
+import threading
+import zlib
+import pytest
+from archive import RawArchive
+from synthetic import PayloadGenerator
+
+def read_all(archive, generator):
+    return list(archive.iter_records(generator.start - 3600, generator.end + 3600))
+
+def test_archives_sharing_a_segment_append_safely(tmp_path):
+    # Appends this size take several writes each, which interleave without a shared lock
+    generator = PayloadGenerator(cities=2000, hours=8)
+    hours = list(generator)
+    root = str(tmp_path / 'archive')
+    RawArchive(root)
+
+    def append(hour):
+        # One archive per thread, as each pipeline creates its own
+        RawArchive(root).append(hours[hour])
+
+    threads = [threading.Thread(target=append, args=(hour,)) for hour in range(generator.hours)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    records = read_all(RawArchive(root), generator)
+    assert len({(data['id'], data['dt']) for data in records}) == len(records) == 2000 * 8
+
+def test_damaged_segment_yields_records_before_the_damage(tmp_path):
+    generator = PayloadGenerator(cities=20, hours=2)
+    archive = RawArchive(str(tmp_path / 'archive'))
+    archive.append(generator.hour(0))
+    (path,) = archive.segments(generator.start - 3600, generator.end + 3600)
+    full_path = os.path.join(archive.root, path)
+    intact = os.path.getsize(full_path)
+    archive.append(generator.hour(1))
+
+    # Corrupt the deflate stream of the second member, past its header
+    with open(full_path, 'r+b') as f:
+        f.seek(intact + 40)
+        f.write(b'\xff' * 64)
+    with pytest.raises(zlib.error), gzip.open(full_path, 'rb') as f:
+        f.read()
+
+    records = read_all(archive, generator)
+    assert [data['id'] for data in records[:20]] == [city['id'] for city in generator.cities]
+    assert len(records) < 40
@@ -0,0 +1,140 @@
+import json
+from datetime import datetime
+import mysql.connector
+import pytest
+import change_detection
+from change_detection import ObservationWatermarks
+from etl_pipeline import WeatherETLPipeline
+from write_buffer import WriteBuffer, BufferDrainer
+from transform import WeatherTransformer
+from synthetic import PayloadGenerator
+
+class FakeConnection:
+    """Pool connection whose cursor returns weather_latest's rows"""
+    def __init__(self, rows):
+        self.rows = rows
+        self.closed = False
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, params=()):
+        assert 'weather_latest' in query
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        self.closed = True
+
+class RejectingLoader:
+    """Loader that keeps what it is given, rejecting batches with a poisoned city"""
+    def __init__(self):
+        self.loaded = []
+        self.last_error = None
+
+    def load_data(self, df):
+        if (df['city'] == 'Poison').any():
+            self.last_error = mysql.connector.errors.DataError("1265 (01000): Data truncated")
+            return False
+        self.loaded.append(df)
+        return True
+
+@pytest.fixture
+def watermarks(tmp_path):
+    watermarks = ObservationWatermarks(str(tmp_path / 'watermarks.json'))
+    watermarks.warmed = True
+    return watermarks
+
+@pytest.fixture
+def payloads():
+    return PayloadGenerator(cities=3, hours=2).hour(0)
+
+def test_filter_keeps_only_observations_newer_than_the_watermark(watermarks, payloads):
+    watermarks.entries = {payloads[0]['name']: payloads[0]['dt'], payloads[1]['name']: payloads[1]['dt'] - 1}
+    malformed = {'name': None, 'dt': 'soon'}
+
+    fresh, skipped = watermarks.filter(payloads + [malformed])
+
+    assert fresh == payloads[1:] + [malformed]
+    assert skipped == 1
+
+def test_advance_only_moves_watermarks_forward(watermarks, payloads):
+    newest = payloads[0]['dt']
+    watermarks.entries = {payloads[0]['name']: newest + 60}
+
+    watermarks.advance(payloads)
+
+    assert watermarks.entries[payloads[0]['name']] == newest + 60
+    assert all(watermarks.entries[data['name']] == data['dt'] for data in payloads[1:])
+    assert watermarks.filter(payloads) == ([], len(payloads))
+
+def test_save_keeps_the_newest_watermark_from_every_writer(tmp_path):
+    path = str(tmp_path / 'watermarks.json')
+    first, second = ObservationWatermarks(path), ObservationWatermarks(path)
+    first.entries = {'Oslo': 200, 'Lima': 100}
+    second.entries = {'Oslo': 150, 'Kyiv': 300}
+
+    first.save()
+    second.save()
+
+    with open(path) as f:
+        assert json.load(f) == {'Oslo': 200, 'Lima': 100, 'Kyiv': 300}
+    assert ObservationWatermarks(path).entries == {'Oslo': 200, 'Lima': 100, 'Kyiv': 300}
+
+def test_warm_raises_watermarks_to_weather_latest(tmp_path, monkeypatch):
+    latest = datetime(2024, 5, 1, 12, 0)
+    connection = FakeConnection([('Oslo', latest), ('Lima', datetime(2024, 5, 1, 9, 0))])
+    pool = type('Pool', (), {'get_connection': lambda self: connection})()
+    monkeypatch.setattr(change_detection, 'get_pool', lambda: pool)
+    watermarks = ObservationWatermarks(str(tmp_path / 'watermarks.json'))
+    watermarks.entries = {'Lima': latest.timestamp()}
+
+    fresh, skipped = watermarks.filter([{'name': 'Oslo', 'dt': latest.timestamp()},
+                                        {'name': 'Oslo', 'dt': latest.timestamp() + 600}])
+
+    assert connection.closed
+    assert watermarks.entries == {'Oslo': latest.timestamp(), 'Lima': latest.timestamp()}
+    assert (len(fresh), skipped) == (1, 1)
+
+def buffered(tmp_path, payloads):
+    df = WeatherTransformer().transform_weather_data_columnar(payloads)
+    buffer = WriteBuffer(str(tmp_path / 'write_buffer.sqlite3'))
+    buffer.enqueue(df)
+    return buffer
+
+def test_the_drainer_advances_watermarks_once_a_batch_is_loaded(tmp_path, watermarks, payloads):
+    buffer = buffered(tmp_path, payloads)
+    drainer = BufferDrainer(buffer, RejectingLoader(), watermarks=watermarks)
+
+    assert watermarks.filter(payloads) == (payloads, 0)
+    drainer.drain_once()
+
+    assert watermarks.filter(payloads) == ([], len(payloads))
+    assert ObservationWatermarks(watermarks.path).entries == watermarks.entries
+
+def test_a_dead_batch_leaves_its_observations_due(tmp_path, watermarks, payloads):
+    # The poisoned city makes the loader reject the batch until it is buried
+    poisoned = [dict(data, name='Poison') for data in payloads]
+    buffer = buffered(tmp_path, poisoned)
+    drainer = BufferDrainer(buffer, RejectingLoader(), max_attempts=2, watermarks=watermarks)
+
+    for _ in range(2):
+        drainer.drain_once()
+
+    assert buffer.dead()[0] == 1
+    assert watermarks.filter(poisoned) == (poisoned, 0)
+
+def test_a_buffered_batch_is_not_marked_loaded_by_the_pipeline(tmp_path, watermarks, payloads):
+    pipeline = WeatherETLPipeline(cities=[])
+    pipeline.watermarks = watermarks
+    pipeline.buffer = WriteBuffer(str(tmp_path / 'write_buffer.sqlite3'))
+    df = WeatherTransformer().transform_weather_data_columnar(payloads)
+
+    assert pipeline.store(df, payloads)
+    assert watermarks.filter(payloads) == (payloads, 0)
+
+    pipeline.buffer = None
+    pipeline.loader = RejectingLoader()
+    assert pipeline.store(df, payloads)
+    assert watermarks.filter(payloads) == ([], len(payloads))
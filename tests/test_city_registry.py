@@ -0,0 +1,119 @@
+import logging
+from datetime import datetime
+import mysql.connector
+import pytest
+import city_registry
+from city_registry import CityRegistry
+from config import CITIES
+
+HOUR = 3600
+TICK = 900
+
+class FakeCursor:
+    """Answers the registry's version query, then its row query, from a table held in a list"""
+    def __init__(self, table):
+        self.table = table
+        self.result = None
+
+    def execute(self, query, params=()):
+        if 'MAX(updated_at)' in query:
+            self.result = [self.table.version]
+        else:
+            self.result = list(self.table.rows)
+            self.table.reads += 1
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+class FakeTable:
+    def __init__(self, rows):
+        self.rows = rows
+        self.version = (datetime(2024, 5, 1), len(rows))
+        self.reads = 0
+
+    def get_connection(self):
+        return self
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def table(monkeypatch):
+    table = FakeTable([
+        # city, enabled, priority, poll_interval_minutes, last_polled_at
+        ('London', 1, 10, 15, None),
+        ('Paris', 1, 0, None, None),
+        ('Oslo', 0, 5, 180, None),
+        ('Lima', 1, 0, 5, None),
+    ])
+    monkeypatch.setattr(city_registry, 'get_pool', lambda: table)
+    return table
+
+@pytest.fixture
+def registry(table):
+    registry = CityRegistry(default_interval=HOUR, tick=TICK)
+    assert registry.refresh()
+    return registry
+
+def test_refresh_only_reloads_when_the_table_changed(registry, table):
+    assert not registry.refresh()
+    assert table.reads == 1
+
+    table.rows.append(('Kyiv', 1, 0, None, None))
+    table.version = (datetime(2024, 5, 2), len(table.rows))
+    assert registry.refresh()
+    assert table.reads == 2
+    assert 'Kyiv' in registry.cities()
+
+def test_cities_are_enabled_ones_by_priority(registry):
+    assert registry.cities() == ['London', 'Lima', 'Paris']
+
+def test_null_intervals_fall_back_to_the_default(registry):
+    assert registry.entries['Paris']['interval'] == HOUR
+    assert registry.entries['Oslo']['interval'] == 180 * 60
+
+def test_intervals_shorter_than_a_tick_are_raised_with_a_warning(table, caplog):
+    registry = CityRegistry(default_interval=HOUR, tick=TICK)
+    with caplog.at_level(logging.WARNING):
+        registry.refresh()
+
+    assert registry.entries['Lima']['interval'] == TICK
+    assert registry.entries['London']['interval'] == TICK
+    assert 'Lima' in caplog.text and 'London' not in caplog.text
+
+def test_never_polled_cities_are_due(registry):
+    assert registry.due(['Paris', 'London', 'Atlantis'], now=0) == ['Paris', 'London']
+
+@pytest.mark.parametrize('city, interval', [('Paris', HOUR), ('London', TICK), ('Lima', TICK)])
+def test_a_city_is_due_within_half_a_tick_of_its_interval(registry, city, interval):
+    polled_at = 1_700_000_000
+    registry.entries[city]['last_polled'] = polled_at
+    due_at = polled_at + interval - TICK / 2
+
+    assert registry.due([city], now=due_at - 1) == []
+    assert registry.due([city], now=due_at) == [city]
+    assert registry.due([city], now=polled_at + interval) == [city]
+
+def test_due_keeps_the_order_it_is_given(registry):
+    for city in ('London', 'Paris'):
+        registry.entries[city]['last_polled'] = 0
+    assert registry.due(['Paris', 'Lima', 'London'], now=HOUR) == ['Paris', 'Lima', 'London']
+
+def test_an_unreadable_table_falls_back_to_the_configured_cities(monkeypatch):
+    def unavailable():
+        raise mysql.connector.errors.InterfaceError("Can't connect")
+    monkeypatch.setattr(city_registry, 'get_pool', unavailable)
+    registry = CityRegistry(default_interval=HOUR, tick=TICK)
+
+    assert not registry.refresh()
+    assert registry.cities() == sorted(CITIES)
+    assert registry.due(CITIES, now=0) == CITIES
@@ -0,0 +1,89 @@
+import glob
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+from columnar import ParquetSink, ColumnarStore
+from synthetic import PayloadGenerator
+
+def one_day(generator):
+    df = generator.frame()
+    dates = df['data_timestamp'].dt.date
+    return df[dates == dates.iloc[len(df) // 2]].reset_index(drop=True)
+
+def day_dir(sink, day):
+    return os.path.join(sink.root, f"date={day:%Y-%m-%d}")
+
+def stored(paths):
+    return pd.concat([pq.read_table(path).to_pandas() for path in paths], ignore_index=True)
+
+def test_compaction_merges_a_day_into_one_file_sorted_by_city(tmp_path):
+    df = one_day(PayloadGenerator(cities=5, hours=72))
+    day = df['data_timestamp'].iloc[0]
+    sink = ParquetSink(str(tmp_path / 'parquet'))
+    hours = sorted(df['data_timestamp'].dt.hour.unique())
+    for hour in hours:
+        sink.write_batch(df[df['data_timestamp'].dt.hour == hour])
+    # A re-loaded hour is kept once
+    sink.write_batch(df[df['data_timestamp'].dt.hour == hours[0]])
+
+    sink.compact_day(day)
+
+    (path,) = glob.glob(os.path.join(day_dir(sink, day), '*.parquet'))
+    merged = stored([path])
+    assert len(merged) == len(df)
+    assert list(merged['city']) == sorted(merged['city'])
+
+def test_compaction_keeps_batches_written_while_it_runs(tmp_path, monkeypatch):
+    df = one_day(PayloadGenerator(cities=1, hours=72))
+    day = df['data_timestamp'].iloc[0]
+    early, late = df.iloc[:len(df) - 2], df.iloc[len(df) - 2:]
+    sink = ParquetSink(str(tmp_path / 'parquet'))
+    sink.write_batch(early.iloc[:6])
+    sink.write_batch(early.iloc[6:])
+
+    read_table = pq.read_table
+    def read_then_write_late(path, *args, **kwargs):
+        # A loader writing the day's next batch between the read and the cleanup
+        if not late_written:
+            late_written.append(True)
+            sink.write_batch(late)
+        return read_table(path, *args, **kwargs)
+    late_written = []
+    monkeypatch.setattr(pq, 'read_table', read_then_write_late)
+    sink.compact_day(day)
+    monkeypatch.undo()
+
+    paths = glob.glob(os.path.join(day_dir(sink, day), '*.parquet'))
+    assert len(paths) == 2
+    assert sorted(stored(paths)['data_timestamp']) == sorted(df['data_timestamp'])
+
+def test_compaction_moves_city_directories_into_the_day(tmp_path):
+    # The layout before date-only partitioning had a directory per city
+    df = one_day(PayloadGenerator(cities=3, hours=72))
+    day = df['data_timestamp'].iloc[0]
+    sink = ParquetSink(str(tmp_path / 'parquet'))
+    for city, rows in df.groupby('city', observed=True):
+        city_dir = os.path.join(day_dir(sink, day), f"city_key={city}")
+        os.makedirs(city_dir)
+        rows.to_parquet(os.path.join(city_dir, 'part-0.parquet'), index=False)
+
+    store = ColumnarStore(sink.root)
+    days = (pd.Timestamp.now() - day).days + 2
+    assert store.record_count(days)['total_records'].iloc[0] == len(df)
+
+    sink.compact_day(day)
+
+    assert len(glob.glob(os.path.join(day_dir(sink, day), '*.parquet'))) == 1
+    assert not glob.glob(os.path.join(day_dir(sink, day), 'city_key=*'))
+    assert store.record_count(days)['total_records'].iloc[0] == len(df)
+
+def test_batches_over_many_days_are_written_and_read_back(tmp_path):
+    generator = PayloadGenerator(cities=50, hours=24 * 40)
+    df = generator.frame()
+    root = str(tmp_path / 'parquet')
+    ParquetSink(root).write_batch(df)
+
+    days = (pd.Timestamp.now() - df['data_timestamp'].min()).days + 1
+    counted = ColumnarStore(root).record_count(days)
+    assert counted['total_records'].iloc[0] == len(df)
+    assert len(glob.glob(os.path.join(root, 'date=*', '*.parquet'))) == df['data_timestamp'].dt.date.nunique()
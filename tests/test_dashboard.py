@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+from columnar import ParquetSink, ColumnarStore
+from synthetic import PayloadGenerator
+
+def submit_from_session():
+    import streamlit as st
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    from dashboard import WeatherDashboard
+
+    dashboard = WeatherDashboard()
+    future = dashboard.submit(lambda: get_script_run_ctx(suppress_warning=True))
+    st.session_state['pool_ctx_matches'] = future.result() is get_script_run_ctx()
+
+def test_query_threads_run_with_the_session_context():
+    # st.cache_data in a query thread needs the session's ScriptRunContext
+    app = AppTest.from_function(submit_from_session).run(timeout=30)
+    assert not app.exception
+    assert app.session_state['pool_ctx_matches']
+
+def test_wider_ranges_get_coarser_trend_buckets():
+    from dashboard import TREND_SERIES_BUCKETS, trend_bucket_hours
+
+    hours = [trend_bucket_hours(days) for days in (1, 3, 7, 14, 30)]
+
+    assert hours == sorted(hours) and hours[0] == 1 and hours[-1] > hours[2]
+    assert all(24 % bucket == 0 for bucket in hours)
+    assert all(days * 24 / bucket <= TREND_SERIES_BUCKETS for days, bucket in zip((1, 3, 7, 14, 30), hours))
+
+def test_mysql_trend_buckets_count_hours_from_local_midnight(monkeypatch):
+    from dashboard import WeatherDashboard, trend_bucket_hours
+
+    dashboard = WeatherDashboard()
+    dashboard.columnar = None
+    calls = []
+    monkeypatch.setattr(dashboard, 'fetch_data', lambda query, params: calls.append((query, params)) or pd.DataFrame())
+
+    dashboard.get_temperature_trend(30)
+
+    ((query, (anchor, bucket, _, _, days)),) = calls
+    assert 'TIMESTAMPDIFF(HOUR' in query and 'UNIX_TIMESTAMP' not in query
+    assert (anchor.hour, anchor.minute) == (0, 0)
+    assert datetime.now() - anchor >= timedelta(days=30)
+    assert (bucket, days) == (trend_bucket_hours(30), 30)
+
+def test_columnar_trend_buckets_start_at_local_midnight(tmp_path):
+    from dashboard import trend_anchor
+
+    df = PayloadGenerator(cities=2, hours=72).frame()
+    ParquetSink(str(tmp_path)).write_batch(df)
+    days = (datetime.now() - df['data_timestamp'].min()).days + 1
+
+    trend = ColumnarStore(str(tmp_path)).temperature_trend(days, 6, trend_anchor(days))
+
+    assert set(trend['data_timestamp'].dt.hour) <= {0, 6, 12, 18}
+    assert (trend['data_timestamp'].dt.minute == 0).all()
+    assert len(trend) <= 2 * (72 // 6 + 2)
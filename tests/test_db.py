@@ -0,0 +1,159 @@
+import threading
+import time
+import mysql.connector
+import pytest
+from db import ConnectionPool
+
+class FakeConnection:
+    """Records what the pool does to a connection; ping and rollback fail on request"""
+    def __init__(self, number):
+        self.number = number
+        self.in_transaction = False
+        self.ping_error = None
+        self.rollback_error = None
+        self.pings = self.rollbacks = 0
+        self.closed = False
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if self.ping_error is not None:
+            raise self.ping_error
+
+    def rollback(self):
+        self.rollbacks += 1
+        if self.rollback_error is not None:
+            raise self.rollback_error
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Every connection the fake connector has made, oldest first"""
+    made = []
+    def connect(**config):
+        made.append(FakeConnection(len(made)))
+        return made[-1]
+    monkeypatch.setattr(mysql.connector, 'connect', connect)
+    return made
+
+def make_pool(**kwargs):
+    return ConnectionPool(db_config={}, **dict({'size': 2, 'timeout': 0.1, 'max_lifetime': 60}, **kwargs))
+
+def test_a_released_connection_is_pinged_and_reused(connections):
+    pool = make_pool()
+    first = pool.get_connection()
+    first.close()
+    second = pool.get_connection()
+
+    assert second.number == 0
+    assert len(connections) == 1
+    assert connections[0].pings == 1
+    assert pool.get_stats()['checkouts'] == 2
+
+def test_closing_a_borrowed_connection_twice_returns_it_once(connections):
+    pool = make_pool(size=1)
+    connection = pool.get_connection()
+    connection.close()
+    connection.close()
+
+    pool.get_connection()
+    with pytest.raises(mysql.connector.errors.PoolError):
+        pool.get_connection()
+
+def test_checkout_times_out_when_every_connection_is_borrowed(connections):
+    pool = make_pool(size=1, timeout=0.05)
+    pool.get_connection()
+
+    started = time.monotonic()
+    with pytest.raises(mysql.connector.errors.PoolError, match='No free connection'):
+        pool.get_connection()
+
+    assert time.monotonic() - started >= 0.05
+    assert pool.get_stats()['checkout_timeouts'] == 1
+
+def test_a_waiting_checkout_gets_the_connection_when_it_is_released(connections):
+    pool = make_pool(size=1, timeout=5)
+    borrowed = pool.get_connection()
+    threading.Timer(0.05, borrowed.close).start()
+
+    assert pool.get_connection().number == 0
+    assert pool.get_stats()['wait_time_max'] >= 0.04
+
+def test_a_connection_failing_its_ping_is_replaced(connections):
+    pool = make_pool()
+    pool.get_connection().close()
+    connections[0].ping_error = mysql.connector.errors.OperationalError("MySQL server has gone away")
+
+    assert pool.get_connection().number == 1
+    assert connections[0].closed
+    assert pool.get_stats()['failed_health_checks'] == 1
+
+def test_idle_connections_past_their_lifetime_are_recycled(connections):
+    pool = make_pool(max_lifetime=0.05)
+    pool.get_connection().close()
+    time.sleep(0.1)
+
+    assert pool.get_connection().number == 1
+    assert connections[0].closed and connections[0].pings == 0
+    assert pool.get_stats()['connections_recycled'] == 1
+
+def test_connections_past_their_lifetime_are_closed_on_release(connections):
+    pool = make_pool(max_lifetime=0.05)
+    borrowed = pool.get_connection()
+    time.sleep(0.1)
+    borrowed.close()
+
+    assert connections[0].closed
+    assert pool.get_stats()['idle'] == 0
+
+def test_an_open_transaction_is_rolled_back_on_release(connections):
+    pool = make_pool()
+    borrowed = pool.get_connection()
+    connections[0].in_transaction = True
+    borrowed.close()
+
+    assert connections[0].rollbacks == 1
+    assert pool.get_connection().number == 0
+
+def test_a_connection_that_cannot_roll_back_is_discarded(connections):
+    pool = make_pool()
+    borrowed = pool.get_connection()
+    connections[0].in_transaction = True
+    connections[0].rollback_error = mysql.connector.errors.OperationalError("Lost connection")
+    borrowed.close()
+
+    assert connections[0].closed
+    assert pool.get_connection().number == 1
+
+def test_a_failed_connect_frees_its_slot(monkeypatch):
+    def refuse(**config):
+        raise mysql.connector.errors.InterfaceError("Can't connect to MySQL server")
+    monkeypatch.setattr(mysql.connector, 'connect', refuse)
+    pool = make_pool(size=1)
+
+    for _ in range(3):
+        with pytest.raises(mysql.connector.errors.InterfaceError):
+            pool.get_connection()
+    assert pool.get_stats()['checkout_timeouts'] == 0
+
+def test_close_waits_for_borrowed_connections_then_closes_them_all(connections):
+    pool = make_pool()
+    pool.get_connection().close()
+    borrowed = pool.get_connection(), pool.get_connection()
+    threading.Timer(0.05, lambda: [connection.close() for connection in borrowed]).start()
+
+    pool.close(timeout=5)
+
+    assert all(connection.closed for connection in connections)
+    with pytest.raises(mysql.connector.errors.PoolError, match='closed'):
+        pool.get_connection()
+
+def test_close_gives_up_on_connections_that_are_never_returned(connections, caplog):
+    pool = make_pool()
+    pool.get_connection()
+
+    pool.close(timeout=0.05)
+
+    assert 'still checked out' in caplog.text
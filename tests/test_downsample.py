@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+from downsample import lttb, downsample_series
+from synthetic import PayloadGenerator
+
+def test_lttb_keeps_the_ends_and_the_peak():
+    x = np.arange(100)
+    y = np.zeros(100)
+    y[37] = 10
+    keep = lttb(x, y, 10)
+
+    assert len(keep) == 10
+    assert keep[0] == 0 and keep[-1] == 99
+    assert 37 in keep
+    assert list(keep) == sorted(keep)
+
+def test_lttb_returns_short_series_unchanged():
+    assert list(lttb(np.arange(5), np.arange(5), 10)) == [0, 1, 2, 3, 4]
+
+def test_downsample_series_matches_per_series_lttb():
+    df = PayloadGenerator(cities=6, hours=300).frame()[['city', 'data_timestamp', 'temperature']]
+    # Uneven series lengths exercise the grouping by length
+    df = df.drop(index=df.index[df['city'] == df['city'].iloc[0]][:40])
+    df = df.sort_values(['city', 'data_timestamp'], ignore_index=True)
+
+    result = downsample_series(df, 'data_timestamp', 'temperature', 'city', 50)
+
+    expected = []
+    for _, series in df.groupby('city', sort=False, observed=True):
+        x = series['data_timestamp'].astype('int64').to_numpy()
+        expected.append(series.iloc[lttb(x, series['temperature'].to_numpy(), 50)])
+    pd.testing.assert_frame_equal(result, pd.concat(expected, ignore_index=True))
+    assert result.groupby('city', observed=True).size().max() == 50
@@ -0,0 +1,191 @@
+import time
+import pytest
+import requests
+from config import BREAKER_RESET_TIMEOUT
+from extract import RETRY_MAX_BACKOFF, CityIdCache, TokenBucket, WeatherExtractor, get_rate_limiter, GROUP_BATCH_SIZE
+
+def group_calls(api):
+    return [query['id'][0].split(',') for path, query in api.calls if path.endswith('/group')]
+
+def city_calls(api):
+    return [query['q'][0] for path, query in api.calls if path.endswith('/weather')]
+
+def warm_cache(extractor, generator):
+    for city in generator.cities:
+        extractor.id_cache.set(city['name'], city['id'])
+
+def test_group_engine_batches_cached_ids(extractor, mock_api, generator):
+    warm_cache(extractor, generator)
+
+    results = extractor.fetch_all_cities_grouped([city['name'] for city in generator.cities])
+
+    assert sorted(data['id'] for data in results) == sorted(city['id'] for city in generator.cities)
+    assert [len(batch) for batch in group_calls(mock_api)] == [GROUP_BATCH_SIZE, GROUP_BATCH_SIZE, 5]
+    assert city_calls(mock_api) == []
+
+def test_group_engine_resolves_unknown_cities_once(extractor, mock_api, generator):
+    names = [city['name'] for city in generator.cities]
+
+    first = extractor.fetch_all_cities_grouped(names)
+    assert len(first) == len(names)
+    assert city_calls(mock_api) == names
+    assert group_calls(mock_api) == []
+
+    mock_api.calls.clear()
+    second = extractor.fetch_all_cities_grouped(names)
+    assert len(second) == len(names)
+    assert city_calls(mock_api) == []
+    assert len(group_calls(mock_api)) == 3
+
+def test_group_engine_falls_back_for_cities_missing_from_a_batch(extractor, mock_api, generator):
+    warm_cache(extractor, generator)
+    # The stub drops the last two cities of every group response
+    respond = mock_api.respond
+    def partial_respond(path, query):
+        status, body = respond(path, query)
+        if path.endswith('/group'):
+            body = {'cnt': len(body['list']) - 2, 'list': body['list'][:-2]}
+        return status, body
+    mock_api.respond = partial_respond
+
+    results = extractor.fetch_all_cities_grouped([city['name'] for city in generator.cities])
+
+    assert len(results) == len(generator.cities)
+    missed = [batch[-2:] for batch in group_calls(mock_api)]
+    by_id = {str(city['id']): city['name'] for city in generator.cities}
+    assert city_calls(mock_api) == [by_id[city_id] for batch in missed for city_id in batch]
+
+def test_group_engine_falls_back_when_a_batch_fails(extractor, mock_api, generator):
+    warm_cache(extractor, generator)
+    respond = mock_api.respond
+    failed = []
+    def failing_respond(path, query):
+        # Fail only the first group call
+        if path.endswith('/group') and not failed:
+            failed.append(query['id'][0])
+            return 503, {'cod': 503, 'message': 'Service Unavailable'}
+        return respond(path, query)
+    mock_api.respond = failing_respond
+
+    results = extractor.fetch_all_cities_grouped([city['name'] for city in generator.cities])
+
+    assert len(results) == len(generator.cities)
+    assert len(city_calls(mock_api)) == GROUP_BATCH_SIZE
+
+def test_city_id_cache_expires_entries(tmp_path, monkeypatch):
+    cache = CityIdCache(str(tmp_path / 'city_ids.json'), ttl=60)
+    cache.set('London', 2643743)
+    assert cache.get('London') == 2643743
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    assert cache.get('London') is None
+
+def test_city_id_cache_persists_between_instances(tmp_path):
+    path = str(tmp_path / 'city_ids.json')
+    cache = CityIdCache(path)
+    cache.set('London', 2643743)
+    cache.save()
+
+    assert CityIdCache(path).get('London') == 2643743
+
+def test_expired_ids_are_resolved_again(extractor, mock_api, generator, monkeypatch):
+    names = [city['name'] for city in generator.cities]
+    extractor.fetch_all_cities_grouped(names)
+    mock_api.calls.clear()
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + extractor.id_cache.ttl + 1)
+    extractor.fetch_all_cities_grouped(names)
+
+    assert city_calls(mock_api) == names
+    assert group_calls(mock_api) == []
+
+def test_token_bucket_spaces_requests_after_the_burst():
+    bucket = TokenBucket(rate_per_minute=1200, burst=2)
+    started = time.monotonic()
+    for _ in range(4):
+        bucket.acquire()
+    # Two tokens from the burst, then one every 50 ms
+    assert time.monotonic() - started >= 0.09
+
+def test_extractors_share_one_rate_limiter_per_host(mock_api):
+    first = WeatherExtractor(rate_limit=1e9)
+    second = WeatherExtractor(rate_limit=1e9)
+    limiter = get_rate_limiter(mock_api.base_url, first.rate_limit, first.max_concurrency)
+
+    assert get_rate_limiter(mock_api.group_url, second.rate_limit, second.max_concurrency) is limiter
+
+def test_rate_limiters_are_kept_per_rate(mock_api):
+    full = get_rate_limiter(mock_api.base_url, 6000, 4)
+    share = get_rate_limiter(mock_api.base_url, 1500, 4)
+
+    assert share is not full
+    assert (full.rate, share.rate) == (100, 25)
+    # A caller at the same rate with a larger burst widens the shared bucket
+    assert get_rate_limiter(mock_api.base_url, 6000, 16) is full
+    assert full.capacity == 16
+
+def test_retries_wait_for_the_rate_limiter(extractor, mock_api, monkeypatch):
+    acquired = []
+    limiter = get_rate_limiter(mock_api.base_url, extractor.rate_limit, extractor.max_concurrency)
+    monkeypatch.setattr(limiter, 'acquire', lambda: acquired.append(1))
+    monkeypatch.setattr(time, 'sleep', lambda seconds: None)
+    mock_api.error_rate = 1.0
+    extractor.max_retries = 2
+
+    assert extractor.fetch_weather_data('Synthetic City 00000') is None
+    assert len(acquired) == 3
+
+def test_retry_after_is_capped(extractor, mock_api, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, 'sleep', sleeps.append)
+    mock_api.error_rate = 1.0
+    mock_api.retry_after = 3600
+    extractor.max_retries = 1
+
+    assert extractor.fetch_weather_data('Synthetic City 00000') is None
+    # The stub server's own zero-latency sleeps land here too
+    assert [seconds for seconds in sleeps if seconds] == [RETRY_MAX_BACKOFF]
+
+def test_failed_half_open_trial_reopens_the_breaker(extractor, mock_api, monkeypatch):
+    url = mock_api.base_url
+    breaker = extractor.get_breaker(url)
+    breaker.opened_at = time.monotonic() - BREAKER_RESET_TIMEOUT - 1
+    get = extractor.session.get
+    def broken_get(*args, **kwargs):
+        raise requests.exceptions.ChunkedEncodingError("connection broken mid-body")
+    monkeypatch.setattr(extractor.session, 'get', broken_get)
+
+    # The trial fails with an error other than a connection error or timeout
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        extractor.get_json(url, {'q': 'Synthetic City 00000'})
+    assert not breaker.trial_in_flight
+
+    # Once the cool-down passes again, the next trial goes out and closes the breaker
+    monkeypatch.setattr(extractor.session, 'get', get)
+    breaker.opened_at = time.monotonic() - BREAKER_RESET_TIMEOUT - 1
+    assert extractor.get_json(url, {'q': 'Synthetic City 00000'})['name'] == 'Synthetic City 00000'
+    assert breaker.opened_at is None
+
+def test_city_id_cache_save_merges_with_other_writers(tmp_path):
+    path = str(tmp_path / 'city_ids.json')
+    first, second = CityIdCache(path), CityIdCache(path)
+    first.set('London', 2643743)
+    second.set('Paris', 2988507)
+    first.save()
+    second.save()
+
+    merged = CityIdCache(path)
+    assert merged.get('London') == 2643743
+    assert merged.get('Paris') == 2988507
+
+def test_city_id_cache_save_keeps_the_newest_resolution(tmp_path):
+    path = str(tmp_path / 'city_ids.json')
+    stale, fresh = CityIdCache(path), CityIdCache(path)
+    stale.entries['London'] = {'id': 1, 'resolved_at': time.time() - 100}
+    fresh.set('London', 2643743)
+    fresh.save()
+    stale.save()
+
+    assert CityIdCache(path).get('London') == 2643743
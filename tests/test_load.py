@@ -0,0 +1,139 @@
+import sqlite3
+import pytest
+import load
+from load import WeatherLoader, LRUCache
+from loadtest import SQLiteCursor, sqlite_weather_data
+from synthetic import PayloadGenerator
+
+class WeatherDataCursor(SQLiteCursor):
+    """Runs a load's weather_data statements on SQLite and skips the MySQL-only rest
+
+    weather_latest, the rollups and the watermark use MySQL syntax; the
+    information_schema lookup reports the unique key as already there.
+    Reading the rows a batch replaces is kept, so the rollup deltas run.
+    """
+    def execute(self, query, params=()):
+        if 'information_schema' in query:
+            self.result = (1,)
+        elif any(part in query for part in ('INTO weather_data', 'TEMPORARY TABLE', 'LOAD DATA',
+                                            'FOR UPDATE', '@@max_allowed_packet')):
+            super().execute(query, params)
+
+    def executemany(self, query, rows):
+        if 'INTO weather_data' in query:
+            super().executemany(query, rows)
+
+class FakeConnection:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def cursor(self):
+        return WeatherDataCursor(self.connection)
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def database(tmp_path):
+    return sqlite_weather_data(str(tmp_path / 'weather.sqlite3'))
+
+@pytest.fixture(params=['executemany', 'multirow', 'infile'])
+def loader(request, database, monkeypatch):
+    loader = WeatherLoader(request.param)
+    loader.parquet_sink = None
+    loader.borrowed = 0
+    def get_connection():
+        loader.borrowed += 1
+        return FakeConnection(database)
+    monkeypatch.setattr(loader, 'get_connection', get_connection)
+    return loader
+
+@pytest.fixture
+def batch():
+    return PayloadGenerator(cities=5, hours=2).frame()
+
+def stored(database):
+    return database.execute("SELECT id, city, data_timestamp, temperature FROM weather_data ORDER BY id").fetchall()
+
+def test_reloading_a_batch_writes_nothing(loader, database, batch):
+    assert loader.load_data(batch)
+    rows = stored(database)
+    assert len(rows) == len(batch)
+
+    assert loader.load_data(batch)
+    assert loader.borrowed == 1
+    assert stored(database) == rows
+
+def test_a_changed_row_is_updated_not_duplicated(loader, database, batch):
+    assert loader.load_data(batch)
+    before = stored(database)
+
+    changed = batch.copy()
+    changed.loc[0, 'temperature'] = changed.loc[0, 'temperature'] + 10
+    # The changed row gets past the cache; the unique key turns it into an update
+    assert loader.load_data(changed)
+    after = stored(database)
+
+    assert len(after) == len(before)
+    assert [row[:3] for row in after] == [row[:3] for row in before]
+    assert after[0][3] == pytest.approx(before[0][3] + 10, abs=0.01)
+    assert after[1:] == before[1:]
+
+def test_unchanged_rows_reloaded_by_a_new_loader_keep_their_ids(loader, database, batch, monkeypatch):
+    assert loader.load_data(batch)
+    before = stored(database)
+
+    fresh = WeatherLoader(loader.strategy)
+    fresh.parquet_sink = None
+    monkeypatch.setattr(fresh, 'get_connection', lambda: FakeConnection(database))
+    assert fresh.load_data(batch)
+
+    assert stored(database) == before
+
+def test_loaded_keys_evict_at_the_cache_size(database, batch, monkeypatch):
+    monkeypatch.setattr(load, 'LOADED_KEYS_CACHE_SIZE', 3)
+    loader = WeatherLoader('executemany')
+    loader.parquet_sink = None
+    sent = []
+    monkeypatch.setattr(loader, 'get_connection', lambda: FakeConnection(database))
+    load_executemany = loader.load_executemany
+    def recording_load(cursor, df):
+        sent.append(len(df))
+        load_executemany(cursor, df)
+    monkeypatch.setattr(loader, 'load_executemany', recording_load)
+
+    five = batch.iloc[:5]
+    assert loader.load_data(five)
+    assert len(loader.loaded_keys.data) == 3
+    # The two least recently loaded rows were evicted, so only they are sent again
+    assert loader.load_data(five)
+    assert sent == [5, 2]
+
+def test_lru_cache_evicts_the_least_recently_used_key():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+def test_the_unique_key_is_ensured_once_per_loader(batch, monkeypatch):
+    added = []
+    monkeypatch.setattr(load, 'add_unique_city_timestamp', lambda cursor: added.append(cursor))
+    loader = WeatherLoader('executemany')
+    loader.parquet_sink = None
+    connection = sqlite3.connect(':memory:')
+    connection.execute(f"CREATE TABLE weather_data (id INTEGER PRIMARY KEY, {', '.join(load.COLUMNS)},"
+                       " UNIQUE (city, data_timestamp))")
+    monkeypatch.setattr(loader, 'get_connection', lambda: FakeConnection(connection))
+
+    assert loader.load_data(batch.iloc[:2])
+    assert loader.load_data(batch.iloc[2:4])
+    assert len(added) == 1
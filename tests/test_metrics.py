@@ -0,0 +1,88 @@
+import time
+from metrics import REGISTRY, RUNS, ROWS, Counter, Gauge, Histogram, Registry, RunMetrics
+from sharding import run_shard
+
+def registry():
+    registry = Registry()
+    registry.register(Counter('test_rows_total', 'Rows seen', ['point']))
+    registry.register(Gauge('test_last_run_seconds', 'Last run duration'))
+    registry.register(Histogram('test_stage_seconds', 'Stage time', ['stage'], buckets=(0.1, 1)))
+    return registry
+
+def test_registry_renders_the_exposition_format():
+    metrics = registry()
+    rows, last_run, stages = metrics.metrics
+    rows.inc(3, 'loaded')
+    rows.inc(2, 'say "hi"\n')
+    last_run.set(1.5)
+    stages.observe(0.5, 'load')
+
+    assert metrics.render().splitlines() == [
+        '# HELP test_rows_total Rows seen',
+        '# TYPE test_rows_total counter',
+        'test_rows_total{point="loaded"} 3',
+        'test_rows_total{point="say \\"hi\\"\\n"} 2',
+        '# HELP test_last_run_seconds Last run duration',
+        '# TYPE test_last_run_seconds gauge',
+        'test_last_run_seconds 1.5',
+        '# HELP test_stage_seconds Stage time',
+        '# TYPE test_stage_seconds histogram',
+        'test_stage_seconds_bucket{stage="load",le="0.1"} 0',
+        'test_stage_seconds_bucket{stage="load",le="1"} 1',
+        'test_stage_seconds_bucket{stage="load",le="+Inf"} 1',
+        'test_stage_seconds_sum{stage="load"} 0.5',
+        'test_stage_seconds_count{stage="load"} 1',
+    ]
+
+def test_changes_since_a_snapshot_merge_into_another_registry():
+    worker, coordinator = registry(), registry()
+    worker.metrics[0].inc(5, 'loaded')
+    before = worker.snapshot()
+    worker.metrics[0].inc(2, 'loaded')
+    worker.metrics[1].set(4.0)
+    worker.metrics[2].observe(0.05, 'load')
+    coordinator.metrics[0].inc(1, 'loaded')
+
+    coordinator.merge(worker.changes_since(before))
+
+    rendered = coordinator.render()
+    assert 'test_rows_total{point="loaded"} 3' in rendered
+    assert 'test_last_run_seconds 4.0' in rendered
+    assert 'test_stage_seconds_bucket{stage="load",le="0.1"} 1' in rendered
+
+class FakePipeline:
+    """Stands in for WeatherETLPipeline inside run_shard: one run that loads a row per city"""
+    def __init__(self, cities):
+        self.cities = cities
+        self.extractor = type('Extractor', (), {})()
+        self.failure_count = 0
+
+    def run_pipeline(self):
+        run = RunMetrics(len(self.cities))
+        run.add_rows('loaded', len(self.cities))
+        run.finish('success')
+
+def test_shard_results_carry_the_run_metrics():
+    result = run_shard(FakePipeline, 0, ['A', 'B', 'C'], rate_limit=60)
+
+    metrics = result['metrics']
+    assert metrics[ROWS.name][('loaded',)] == 3
+    assert metrics[RUNS.name][('success',)] == 1
+
+    loaded = ROWS.values.get(('loaded',), 0)
+    REGISTRY.merge(metrics)
+    assert ROWS.values[('loaded',)] == loaded + 3
+
+def test_overlapping_runs_keep_their_own_peak_memory():
+    first = RunMetrics(1)
+    block = bytearray(64 * 2**20)
+    block[::4096] = b'x' * len(block[::4096])
+    time.sleep(0.3)
+    del block
+    # Starting another run must not clear the first run's peak
+    second = RunMetrics(1)
+    second.finish('success')
+    baseline = second.memory.peak
+
+    first.finish('success')
+    assert first.memory.peak >= baseline + 48 * 2**20
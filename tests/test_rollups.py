@@ -0,0 +1,168 @@
+import re
+import sqlite3
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+import rollups
+from rollups import RollupChecker, apply_rollup_deltas, find_mismatches, rollup_source
+from synthetic import PayloadGenerator
+
+KEYS = {
+    'weather_hourly': 'city, hour_start',
+    'weather_daily': 'city, day',
+    'weather_condition_hourly': 'city, hour_start, weather_main',
+    'weather_condition_daily': 'city, day, weather_main',
+}
+
+class RollupCursor:
+    """Runs the rollup delta upserts on SQLite, translating the MySQL functions they use"""
+    def __init__(self, connection):
+        self.cursor = connection.cursor()
+
+    @staticmethod
+    def translate(query):
+        table = re.search(r'INTO (\w+)', query).group(1)
+        query = query.replace('%s', '?').replace('LEAST(', 'MIN(').replace('GREATEST(', 'MAX(')
+        query = re.sub(r'\bIF\(', 'IIF(', re.sub(r'VALUES\((\w+)\)', r'excluded.\1', query))
+        return query.replace('ON DUPLICATE KEY UPDATE', f"ON CONFLICT ({KEYS[table]}) DO UPDATE SET")
+
+    def executemany(self, query, rows):
+        self.cursor.executemany(self.translate(query), rows)
+
+# What previous_observations() returns when none of a batch's rows are stored yet
+NOTHING_STORED = pd.DataFrame(columns=['city', 'data_timestamp', 'temperature', 'humidity', 'weather_main'])
+
+def rollup_tables():
+    connection = sqlite3.connect(':memory:')
+    measures = ('observations INTEGER, temp_sum REAL, temp_count INTEGER, temp_min REAL, temp_max REAL, '
+                'humidity_sum REAL, humidity_count INTEGER')
+    for table, keys in KEYS.items():
+        columns = measures if 'condition' not in table else 'observations INTEGER'
+        bucket = 'hour_start TEXT' if 'hourly' in table else 'day TEXT'
+        weather_main = ', weather_main TEXT' if 'condition' in table else ''
+        connection.execute(f"CREATE TABLE {table} (city TEXT, {bucket}{weather_main}, {columns}, "
+                           f"PRIMARY KEY ({keys}))")
+    return connection
+
+def table(connection, name):
+    return pd.read_sql(f"SELECT * FROM {name}", connection)
+
+def stored_rows(batches):
+    """weather_data after upserting batches, with the columns previous_observations() reads"""
+    rows = pd.concat([rollup_source(batch) for batch in batches], ignore_index=True)
+    return rows.drop_duplicates(['city', 'data_timestamp'], keep='last')
+
+def expected_hourly(rows):
+    grouped = rows.assign(hour_start=rows['data_timestamp'].dt.floor('h')).groupby(['city', 'hour_start'])
+    return pd.DataFrame({
+        'observations': grouped.size(),
+        'temp_sum': grouped['temperature'].sum(min_count=1),
+        'temp_count': grouped['temperature'].count(),
+        'temp_min': grouped['temperature'].min(),
+        'temp_max': grouped['temperature'].max(),
+    })
+
+def test_deltas_from_successive_batches_add_up_to_the_whole_history():
+    frame = PayloadGenerator(cities=4, hours=30).frame()
+    frame.loc[3, 'temperature'] = np.nan
+    hours = frame['data_timestamp'].dt.floor('h')
+    first, second = frame[hours < hours.unique()[20]], frame[hours >= hours.unique()[10]]
+    connection = rollup_tables()
+    cursor = RollupCursor(connection)
+
+    apply_rollup_deltas(cursor, first, NOTHING_STORED)
+    # The second batch repeats ten hours of the first unchanged, which must not count twice
+    apply_rollup_deltas(cursor, second, stored_rows([first]))
+
+    rows = stored_rows([first, second])
+    hourly = table(connection, 'weather_hourly')
+    hourly['hour_start'] = pd.to_datetime(hourly['hour_start'])
+    hourly = hourly.set_index(['city', 'hour_start']).sort_index()
+    expected = expected_hourly(rows).sort_index()
+    assert list(hourly.index) == list(expected.index)
+    for column in expected:
+        np.testing.assert_allclose(hourly[column].astype(float), expected[column].astype(float), atol=1e-6)
+
+    daily = table(connection, 'weather_daily').set_index(['city', 'day'])
+    assert daily['observations'].sum() == len(rows)
+    assert daily['temp_count'].sum() == rows['temperature'].count()
+    conditions = table(connection, 'weather_condition_daily')
+    assert conditions['observations'].sum() == rows['weather_main'].notna().sum()
+
+def test_a_changed_observation_recomputes_its_day_from_raw_data(monkeypatch):
+    refreshed = []
+    monkeypatch.setattr(rollups, 'refresh_rollups',
+                        lambda cursor, start, end, cities: refreshed.append((start, end, cities)))
+    frame = PayloadGenerator(cities=3, hours=4).frame()
+    connection = rollup_tables()
+    cursor = RollupCursor(connection)
+    apply_rollup_deltas(cursor, frame, NOTHING_STORED)
+    before = table(connection, 'weather_hourly')
+
+    changed = frame.copy()
+    changed.loc[0, 'temperature'] = changed.loc[0, 'temperature'] - 20
+    apply_rollup_deltas(cursor, changed, stored_rows([frame]))
+
+    day = frame.loc[0, 'data_timestamp'].normalize().to_pydatetime()
+    assert refreshed == [(day, day + timedelta(days=1), [str(frame.loc[0, 'city'])])]
+    pd.testing.assert_frame_equal(table(connection, 'weather_hourly'), before)
+
+class CannedCursor:
+    """Returns one canned result per executed query, in order"""
+    def __init__(self, *results):
+        self.results = list(results)
+        self.result = None
+
+    def execute(self, query, params=()):
+        self.result = self.results.pop(0)
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+HOUR = datetime(2024, 5, 1, 10)
+
+def test_find_mismatches_reports_buckets_that_disagree():
+    raw = [('Oslo', HOUR, 4, 40.0), ('Lima', HOUR, 2, 30.0), ('Kyiv', HOUR, 1, 5.0), ('Rome', HOUR, 3, 60.0)]
+    rolled = [('Oslo', HOUR, 4, 40.0004), ('Lima', HOUR, 2, 31.0), ('Rome', HOUR, 2, 60.0),
+              ('Pune', HOUR, 1, 20.0)]
+
+    mismatches = find_mismatches(CannedCursor(raw, rolled), HOUR, HOUR + timedelta(hours=1))
+
+    assert mismatches == [('Kyiv', HOUR), ('Lima', HOUR), ('Pune', HOUR), ('Rome', HOUR)]
+
+class CheckerConnection:
+    def __init__(self, cursor):
+        self.cursor_ = cursor
+        self.committed = False
+
+    def cursor(self):
+        return self.cursor_
+
+    def commit(self):
+        self.committed = True
+
+    def close(self):
+        pass
+
+@pytest.mark.parametrize('rebuild', [False, True])
+def test_check_rebuilds_only_the_cities_and_range_that_drifted(monkeypatch, rebuild):
+    later = HOUR + timedelta(hours=5)
+    raw = [('Oslo', HOUR, 4, 40.0), ('Lima', later, 2, 30.0), ('Rome', HOUR, 1, 5.0)]
+    rolled = [('Oslo', HOUR, 3, 30.0), ('Rome', HOUR, 1, 5.0)]
+    connection = CheckerConnection(CannedCursor(raw, rolled))
+    monkeypatch.setattr(rollups, 'get_pool', lambda: type('Pool', (), {'get_connection': lambda self: connection})())
+    refreshed = []
+    monkeypatch.setattr(rollups, 'refresh_rollups',
+                        lambda cursor, start, end, cities: refreshed.append((start, end, cities)))
+
+    assert RollupChecker().check(HOUR, later + timedelta(hours=1), rebuild=rebuild) == 2
+
+    if rebuild:
+        assert refreshed == [(HOUR, later + timedelta(hours=1), ['Lima', 'Oslo'])]
+        assert connection.committed
+    else:
+        assert refreshed == [] and not connection.committed
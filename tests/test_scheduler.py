@@ -0,0 +1,145 @@
+import mysql.connector
+from db import ConnectionPool
+from scheduler import BatchScheduler
+from sharding import ShardedRunner, shard_for
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = None
+
+    def execute(self, query, params=()):
+        self.connection.queries.append(query.split('(')[0].strip())
+        self.result = (1,)
+
+    def fetchone(self):
+        return self.result
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    """Just enough of a MySQL connection for the scheduler and the pool"""
+    in_transaction = False
+
+    def __init__(self, queries):
+        self.queries = queries
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def ping(self, reconnect=False):
+        pass
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+class LoadingJob:
+    """A batch whose run borrows a pool connection, as WeatherLoader does"""
+    failure_count = 0
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.cities = ['London']
+
+    def run_pipeline(self):
+        connection = self.pool.get_connection()
+        connection.close()
+
+def test_batch_lock_does_not_use_a_pool_connection(monkeypatch):
+    queries = []
+    monkeypatch.setattr(mysql.connector, 'connect', lambda **config: FakeConnection(queries))
+    # With one slot, a lock held on a pooled connection would starve the load
+    pool = ConnectionPool(db_config={}, size=1, timeout=0.1)
+    scheduler = BatchScheduler([LoadingJob(pool)])
+    scheduler.pool = pool
+
+    scheduler.run_batch(0)
+
+    assert queries == ['SELECT GET_LOCK', 'SELECT RELEASE_LOCK', 'INSERT INTO etl_run_history']
+    assert pool.get_stats()['checkout_timeouts'] == 0
+    scheduler.close()
+
+class PollRegistry:
+    """Registry where every city is due, recording which ones were marked polled"""
+    def __init__(self, cities):
+        self.all_cities = cities
+        self.polled = []
+
+    def refresh(self):
+        pass
+
+    def cities(self, batch_id, batches):
+        return list(self.all_cities)
+
+    def due(self, cities, now):
+        return cities
+
+    def mark_polled(self, cities, polled_at):
+        self.polled.extend(cities)
+
+class ShardedJob:
+    """A ShardedRunner-like job whose shard for some cities failed"""
+    def __init__(self, failed_cities, failure_count=0):
+        self.cities = []
+        self.failed = failed_cities
+        self.failure_count = failure_count
+        self.failed_cities = []
+
+    def run_pipeline(self):
+        self.failed_cities = list(self.failed)
+
+def run_with_registry(monkeypatch, job):
+    monkeypatch.setattr(mysql.connector, 'connect', lambda **config: FakeConnection([]))
+    registry = PollRegistry(['Lima', 'Oslo', 'Pune'])
+    scheduler = BatchScheduler([job], registry=registry)
+    scheduler.pool = ConnectionPool(db_config={}, size=1, timeout=0.1)
+    recorded = []
+    monkeypatch.setattr(scheduler, 'record_run', lambda batch_id, cities, status, started, finished:
+                        recorded.append(status))
+    scheduler.run_batch(0)
+    scheduler.close()
+    return recorded, registry.polled
+
+def test_a_run_with_failed_shards_is_partial_and_leaves_their_cities_due(monkeypatch):
+    recorded, polled = run_with_registry(monkeypatch, ShardedJob(['Oslo']))
+
+    assert recorded == ['partial']
+    assert polled == ['Lima', 'Pune']
+
+def test_a_run_with_no_failed_shards_marks_every_city_polled(monkeypatch):
+    recorded, polled = run_with_registry(monkeypatch, ShardedJob([]))
+
+    assert recorded == ['success']
+    assert polled == ['Lima', 'Oslo', 'Pune']
+
+def test_a_failed_run_marks_nothing_polled(monkeypatch):
+    recorded, polled = run_with_registry(monkeypatch, ShardedJob(['Lima', 'Oslo', 'Pune'], failure_count=1))
+
+    assert recorded == ['failed']
+    assert polled == []
+
+class ShardPipeline:
+    """Stands in for WeatherETLPipeline in a shard worker; the shard polling 'B' fails"""
+    def __init__(self, cities):
+        self.cities = cities
+        self.extractor = type('Extractor', (), {})()
+        self.failure_count = 0
+
+    def run_pipeline(self):
+        self.failure_count = int('B' in self.cities)
+
+def test_sharded_runner_reports_the_cities_of_failed_shards():
+    cities = ['A', 'B', 'C', 'D', 'E', 'F']
+    runner = ShardedRunner(ShardPipeline, workers=2, cities=cities)
+    try:
+        runner.run_pipeline()
+    finally:
+        runner.close()
+
+    failed_shard = shard_for('B', 2)
+    assert runner.failed_cities == [city for city in cities if shard_for(city, 2) == failed_shard]
+    assert runner.failure_count == 0
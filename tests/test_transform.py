@@ -0,0 +1,24 @@
+import copy
+import pandas as pd
+from transform import WeatherTransformer
+from synthetic import PayloadGenerator
+
+def test_columnar_transform_matches_row_transform():
+    raw_data = [payload for hour in PayloadGenerator(cities=50, hours=48) for payload in hour]
+    transformer = WeatherTransformer()
+
+    pd.testing.assert_frame_equal(transformer.transform_weather_data_columnar(raw_data),
+                                  transformer.transform_weather_data(raw_data))
+
+def test_columnar_transform_matches_row_transform_on_sparse_payloads():
+    raw_data = copy.deepcopy(PayloadGenerator(cities=4, hours=1).hour(0))
+    del raw_data[0]['wind']
+    del raw_data[1]['visibility']
+    del raw_data[2]['main']
+    transformer = WeatherTransformer()
+
+    columnar = transformer.transform_weather_data_columnar(raw_data)
+    pd.testing.assert_frame_equal(columnar, transformer.transform_weather_data(raw_data))
+    assert len(columnar) == 3
+    assert columnar.loc[0, 'wind_speed'] == 0
+    assert columnar.loc[1, 'visibility'] == 0
@@ -0,0 +1,101 @@
+import pickle
+import sqlite3
+import time
+import mysql.connector
+import pandas as pd
+import pytest
+from metrics import DRAIN_FAILURES, DEAD_BATCHES
+from write_buffer import WriteBuffer, BufferDrainer
+from synthetic import PayloadGenerator
+
+class RecordingLoader:
+    """Loader that keeps what it is given, rejecting batches with a poisoned city"""
+    def __init__(self, error=None):
+        self.error = error
+        self.loaded = []
+        self.last_error = None
+
+    def load_data(self, df):
+        self.last_error = None
+        if self.error is not None:
+            self.last_error = self.error
+            return False
+        if (df['city'] == 'Poison').any():
+            self.last_error = mysql.connector.errors.DataError("1265 (01000): Data truncated")
+            return False
+        self.loaded.append(df)
+        return True
+
+@pytest.fixture
+def frames():
+    generator = PayloadGenerator(cities=5, hours=4)
+    frames = [generator.frame(hour, hour + 1) for hour in range(4)]
+    frames[1] = frames[1].assign(city='Poison')
+    return frames
+
+@pytest.fixture
+def buffer(tmp_path, frames):
+    buffer = WriteBuffer(str(tmp_path / 'write_buffer.sqlite3'))
+    for df in frames:
+        buffer.enqueue(df)
+    return buffer
+
+def counter(metric, *labels):
+    return metric.values.get(tuple(labels), 0)
+
+def test_rejected_batch_is_buried_without_blocking_the_rest(buffer):
+    loader = RecordingLoader()
+    drainer = BufferDrainer(buffer, loader, max_attempts=3)
+    rejected_before = counter(DRAIN_FAILURES, 'rejected')
+    dead_before = counter(DEAD_BATCHES)
+
+    for _ in range(6):
+        drainer.drain_once()
+
+    assert buffer.pending() == (0, 0)
+    assert buffer.dead() == (1, 5)
+    assert sum(len(df) for df in loader.loaded) == 15
+    assert counter(DRAIN_FAILURES, 'rejected') - rejected_before == 3
+    assert counter(DEAD_BATCHES) - dead_before == 1
+
+def test_connection_failures_keep_batches_queued(buffer):
+    drainer = BufferDrainer(buffer, RecordingLoader(mysql.connector.errors.PoolError("Failed getting connection")))
+    before = counter(DRAIN_FAILURES, 'connection')
+
+    for _ in range(5):
+        assert drainer.drain_once() is None
+
+    assert buffer.pending() == (4, 20)
+    assert buffer.dead() == (0, 0)
+    assert counter(DRAIN_FAILURES, 'connection') - before == 5
+    # Connection failures say nothing about the batches, so none were counted against them
+    assert buffer.connection().execute("SELECT MAX(attempts) FROM batches").fetchone() == (0,)
+
+def test_buffer_without_attempts_column_is_upgraded(tmp_path, frames):
+    path = str(tmp_path / 'write_buffer.sqlite3')
+    connection = sqlite3.connect(path)
+    connection.execute("""
+        CREATE TABLE batches (id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL,
+                              row_count INTEGER NOT NULL, payload BLOB NOT NULL)
+    """)
+    connection.execute("INSERT INTO batches (created_at, row_count, payload) VALUES (?, ?, ?)",
+                       (time.time(), 5, pickle.dumps(frames[0])))
+    connection.commit()
+    connection.close()
+
+    loader = RecordingLoader()
+    assert BufferDrainer(WriteBuffer(path), loader).drain_once() == 5
+    pd.testing.assert_frame_equal(loader.loaded[0], frames[0])
+
+def test_a_profiled_run_loads_directly_rather_than_buffering(tmp_path, monkeypatch):
+    import etl_pipeline
+    buffers = []
+    monkeypatch.setattr(etl_pipeline.CityRegistry, 'refresh', lambda self: False)
+    monkeypatch.setattr(etl_pipeline.WeatherETLPipeline, 'run_pipeline', lambda self: buffers.append(self.buffer))
+    monkeypatch.setattr(etl_pipeline, 'WRITE_BUFFER', True)
+    monkeypatch.setattr(etl_pipeline, 'WriteBuffer', lambda: WriteBuffer(str(tmp_path / 'write_buffer.sqlite3')))
+
+    etl_pipeline.profile_run(str(tmp_path / 'run.prof'))
+
+    # No drainer runs for a one-off profile, so a buffered batch would never be loaded
+    assert buffers == [None]
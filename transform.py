@@ -1,6 +1,18 @@
 import pandas as pd
+import time
 from datetime import datetime
 import logging
+from dtypes import OUTPUT_COLUMNS, apply_dtypes
+
+def local_utc_offsets(epoch):
+    """Return the local UTC offset in seconds for each epoch value
+
+    DST and zone changes happen on quarter-hour boundaries, so the offset is
+    looked up once per distinct quarter-hour instead of once per record.
+    """
+    quarters = (epoch // 900) * 900
+    offsets = {quarter: time.localtime(quarter).tm_gmtoff for quarter in quarters.dropna().unique()}
+    return quarters.map(offsets)
 
 class WeatherTransformer:
     def __init__(self):
@@ -45,7 +57,42 @@ class WeatherTransformer:
                 transformed_record['data_timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 transformed_data.append(transformed_record)
         
-        return pd.DataFrame(transformed_data)
+        return apply_dtypes(pd.DataFrame(transformed_data))
+    
+    def transform_weather_data_columnar(self, raw_data):
+        """Columnar version of transform_weather_data with compact column dtypes"""
+        rows = []
+
+        # Single pass that only flattens the payloads; all conversion is vectorized
+        for data in raw_data:
+            try:
+                wind = data.get('wind', {})
+                weather = data['weather'][0]
+                timestamp = data['dt']
+                rows.append((
+                    data['name'], data['sys']['country'],
+                    data['main']['temp'], data['main']['feels_like'],
+                    data['main']['humidity'], data['main']['pressure'],
+                    weather['main'], weather['description'],
+                    wind.get('speed', 0), wind.get('deg', 0), data.get('visibility', 0),
+                    timestamp if isinstance(timestamp, (int, float)) else None
+                ))
+            except KeyError as e:
+                logging.error(f"Error transforming data: {e}")
+
+        df = pd.DataFrame.from_records(rows, columns=OUTPUT_COLUMNS[:-1] + ['dt'])
+
+        epoch = df['dt'].astype('float64')
+        local_time = pd.to_datetime(epoch, unit='s', errors='coerce') + pd.to_timedelta(
+            local_utc_offsets(epoch), unit='s')
+        # Whole seconds, as stored in the DATETIME column
+        local_time = local_time.dt.floor('s')
+
+        # Non-numeric or out-of-range timestamps fall back to the current time
+        df['data_timestamp'] = local_time.fillna(pd.Timestamp(datetime.now()).floor('s'))
+        df = df.drop(columns='dt')
+
+        return apply_dtypes(df)
     
     def validate_data(self, df):
         """Validate and clean the transformed data"""
@@ -0,0 +1,226 @@
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+import mysql.connector
+import pandas as pd
+from metrics import BUFFER_PENDING, DRAIN_FAILURES, DEAD_BATCHES
+from dtypes import apply_dtypes
+from config import WRITE_BUFFER_PATH, DRAIN_BATCH_ROWS, DRAIN_INTERVAL, DRAIN_MAX_ATTEMPTS
+
+# Failures that mean MySQL couldn't be reached, rather than that it rejected the batch
+CONNECTION_ERRORS = (mysql.connector.errors.InterfaceError, mysql.connector.errors.OperationalError,
+                     mysql.connector.errors.PoolError)
+
+def is_connection_error(error):
+    # A loader that fails without an error never got a connection
+    return error is None or isinstance(error, CONNECTION_ERRORS)
+
+class WriteBuffer:
+    """Durable local queue of transformed batches waiting to be loaded into MySQL
+
+    Batches are pickled DataFrames in a SQLite file (WAL mode, fully synced),
+    so they survive a crash or restart. The file may be shared by every
+    pipeline thread and shard process on the host. A batch is only deleted
+    after MySQL has committed it. Loads are idempotent upserts, so a crash
+    between the commit and the delete just loads that batch again.
+    """
+    def __init__(self, path=WRITE_BUFFER_PATH):
+        self.path = path
+        self.local = threading.local()
+        connection = self.connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS batches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                row_count INTEGER NOT NULL,
+                payload BLOB NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        if 'attempts' not in {row[1] for row in connection.execute("PRAGMA table_info(batches)")}:
+            # Buffers created before failed loads were counted
+            connection.execute("ALTER TABLE batches ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS dead_batches (
+                id INTEGER PRIMARY KEY,
+                created_at REAL NOT NULL,
+                row_count INTEGER NOT NULL,
+                payload BLOB NOT NULL,
+                error TEXT
+            )
+        """)
+        connection.commit()
+
+    def connection(self):
+        """SQLite connection for the calling thread"""
+        if getattr(self.local, 'connection', None) is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA synchronous=FULL")
+            self.local.connection = connection
+        return self.local.connection
+
+    def enqueue(self, df):
+        connection = self.connection()
+        with connection:
+            connection.execute("INSERT INTO batches (created_at, row_count, payload) VALUES (?, ?, ?)",
+                               (time.time(), len(df), pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def pending(self):
+        """Return (batches, rows) waiting to be loaded"""
+        batches, rows = self.connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(row_count), 0) FROM batches").fetchone()
+        return batches, rows
+
+    def peek(self, max_rows):
+        """Return the oldest batches as [(id, DataFrame)], up to about max_rows rows (at least one batch)
+
+        A batch that has already failed to load is returned on its own, so one
+        bad batch can be found and set aside without holding up the others.
+        """
+        connection = self.connection()
+        chosen, rows = [], 0
+        for batch_id, row_count, attempts in connection.execute(
+                "SELECT id, row_count, attempts FROM batches ORDER BY id"):
+            if chosen and (attempts or rows + row_count > max_rows):
+                break
+            chosen.append(batch_id)
+            rows += row_count
+            if attempts:
+                break
+
+        batches = []
+        for batch_id in chosen:
+            (payload,) = connection.execute("SELECT payload FROM batches WHERE id = ?", (batch_id,)).fetchone()
+            try:
+                batches.append((batch_id, pickle.loads(payload)))
+            except Exception as e:
+                # An unreadable batch would block everything queued behind it
+                logging.error(f"Moving unreadable buffered batch {batch_id} aside: {e}")
+                self.bury(batch_id, str(e))
+        return batches
+
+    def ack(self, batch_ids):
+        """Delete batches that have been committed to MySQL"""
+        connection = self.connection()
+        with connection:
+            connection.executemany("DELETE FROM batches WHERE id = ?", [(batch_id,) for batch_id in batch_ids])
+
+    def record_failure(self, batch_ids):
+        """Count a failed load against batches; returns {id: failed loads so far}"""
+        connection = self.connection()
+        with connection:
+            connection.executemany("UPDATE batches SET attempts = attempts + 1 WHERE id = ?",
+                                   [(batch_id,) for batch_id in batch_ids])
+        placeholders = ', '.join('?' * len(batch_ids))
+        return dict(connection.execute(f"SELECT id, attempts FROM batches WHERE id IN ({placeholders})",
+                                       batch_ids).fetchall())
+
+    def dead(self):
+        """Return (batches, rows) moved aside after failing to load"""
+        return self.connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(row_count), 0) FROM dead_batches").fetchone()
+
+    def bury(self, batch_id, error):
+        connection = self.connection()
+        with connection:
+            connection.execute("""
+                INSERT INTO dead_batches (id, created_at, row_count, payload, error)
+                SELECT id, created_at, row_count, payload, ? FROM batches WHERE id = ?
+            """, (error, batch_id))
+            connection.execute("DELETE FROM batches WHERE id = ?", (batch_id,))
+
+class BufferDrainer:
+    """Background thread that loads buffered batches into MySQL in bulk, oldest first"""
+    def __init__(self, buffer, loader, max_rows=DRAIN_BATCH_ROWS, interval=DRAIN_INTERVAL, max_backoff=300,
+                 max_attempts=DRAIN_MAX_ATTEMPTS, watermarks=None):
+        self.buffer = buffer
+        self.loader = loader
+        # Pipelines leave buffered observations to be marked loaded here, once MySQL has them
+        self.watermarks = watermarks
+        self.max_rows = max_rows
+        self.max_attempts = max_attempts
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='buffer-drainer', daemon=True)
+
+    def start(self):
+        batches, rows = self.buffer.pending()
+        if batches:
+            # Left over from a crash or a database outage before the last shutdown
+            logging.info(f"Recovering {batches} buffered batches ({rows} rows)")
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """Stop after the current load; anything still queued stays on disk for next time"""
+        self.stopping.set()
+        self.thread.join(timeout)
+
+    def run(self):
+        backoff = self.interval
+        while not self.stopping.is_set():
+            try:
+                loaded = self.drain_once()
+            except Exception as e:
+                logging.error(f"Buffer drainer error: {e}")
+                loaded = None
+
+            if loaded is None:
+                # Database unavailable or load failed: back off, keeping the batches
+                self.stopping.wait(backoff)
+                backoff = min(self.max_backoff, backoff * 2)
+            else:
+                backoff = self.interval
+                if not loaded:
+                    self.stopping.wait(self.interval)
+
+    def drain_once(self):
+        """Load the oldest batches as one bulk load; returns rows loaded, or None if MySQL is unavailable
+
+        Batches MySQL rejects are counted, retried on their own, and moved to
+        dead_batches after max_attempts failures, so they can't block the queue.
+        """
+        BUFFER_PENDING.set(self.buffer.pending()[0])
+        batches = self.buffer.peek(self.max_rows)
+        if not batches:
+            return 0
+
+        try:
+            # Concatenating categoricals with different categories falls back to object,
+            # and batches buffered by older versions hold timestamps as text
+            df = apply_dtypes(pd.concat([batch for _, batch in batches], ignore_index=True))
+            # Later batches hold the newer copy of any repeated observation
+            df = df.drop_duplicates(subset=['city', 'data_timestamp'], keep='last')
+            loaded = self.loader.load_data(df)
+            error = None if loaded else self.loader.last_error
+        except Exception as e:
+            loaded, error = False, e
+
+        batch_ids = [batch_id for batch_id, _ in batches]
+        if not loaded:
+            if is_connection_error(error):
+                DRAIN_FAILURES.inc(1, 'connection')
+                return None
+            DRAIN_FAILURES.inc(1, 'rejected')
+            attempts = self.buffer.record_failure(batch_ids)
+            if len(batch_ids) == 1 and attempts.get(batch_ids[0], 0) >= self.max_attempts:
+                logging.error(f"Moving buffered batch {batch_ids[0]} to dead_batches after "
+                              f"{attempts[batch_ids[0]]} failed loads: {error}")
+                self.buffer.bury(batch_ids[0], str(error))
+                DEAD_BATCHES.inc()
+            else:
+                logging.warning(f"MySQL rejected {len(batch_ids)} buffered batches, retrying them one at a time: {error}")
+            return 0
+
+        self.buffer.ack(batch_ids)
+        if self.watermarks is not None:
+            self.watermarks.advance_loaded(df)
+            try:
+                self.watermarks.save()
+            except OSError as e:
+                logging.warning(f"Could not save city watermarks: {e}")
+        logging.info(f"Drained {len(batches)} buffered batches ({len(df)} rows) into MySQL")
+        return len(df)